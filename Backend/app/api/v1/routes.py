@@ -1,4 +1,6 @@
 from fastapi import APIRouter
+from app.core.metrics import metrics
+from app.modules.chat.provider import pool_stats
 from app.modules.users.routes import router as users_router
 from app.modules.auth.routes import router as auth_router
 from app.modules.chat.routes import router as chat_router
@@ -13,6 +15,12 @@ async def ping():
     return {"message": "pong"}
 
 
+@router.get("/metrics", tags=["health"])
+async def read_metrics():
+    """In-process counters/timings for this worker (OCR pipeline, caches, providers)."""
+    return {**metrics.snapshot(), "chat_provider_pool": pool_stats()}
+
+
 api_router = APIRouter()
 api_router.include_router(router, prefix="/health")
 api_router.include_router(auth_router)
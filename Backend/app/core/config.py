@@ -37,6 +37,17 @@ class Settings(BaseSettings):
     CHAT_MODEL: str = "gpt-4o-mini-2024-07-18"
     CHAT_MAX_TOKENS: int = 1000
     CHAT_TEMPERATURE: float = 0.2
+    # Shared HTTP client to the chat provider (one per worker, opened in lifespan)
+    CHAT_HTTP2: bool = True  # needs the h2 package (httpx[http2]); falls back to HTTP/1.1 without it
+    CHAT_HTTP_MAX_CONNECTIONS: int = 100
+    CHAT_HTTP_MAX_KEEPALIVE: int = 20
+    CHAT_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    CHAT_HTTP_CONNECT_TIMEOUT: float = 5.0
+    CHAT_HTTP_READ_TIMEOUT: float = 60.0
+    # Chat WebSocket: re-read the session's OCR snippet at most this often (seconds)
+    CHAT_WS_CONTEXT_REFRESH_SECONDS: int = 30
+    # Chat history cache: also read (and migrate) the pre-v2 Redis layout; turn off once its keys expired (1h TTL)
+    CHAT_CACHE_LEGACY_READ: bool = True
 
     # Testing/Startup controls
     SKIP_STARTUP_CHECKS: bool = False
@@ -44,10 +55,45 @@ class Settings(BaseSettings):
     # OCR Expense Configuration
     OCR_UPLOAD_DIR: str = "/tmp/uploads/ocr"
     OCR_MAX_FILE_SIZE: int = 5 * 1024 * 1024  # 5MB as per spec
+    OCR_UPLOAD_CHUNK_SIZE: int = 64 * 1024
+    # Uploads are processed in memory; set true to keep a copy in OCR_UPLOAD_DIR for audit
+    OCR_RETAIN_UPLOADS: bool = False
     OCR_ALLOWED_TYPES: list = ["image/jpeg", "image/png", "image/heic", "application/pdf"]
     OCR_MAX_DIMENSION: int = 1280  # Max dimension for image processing
     OCR_DPI: int = 300
     OCR_DEFAULT_TIMEZONE: str = "Asia/Ho_Chi_Minh"
+    # Process pool for CPU-bound image preprocessing (0 = run in a thread, no pool)
+    OCR_PREPROCESS_WORKERS: int = 2
+    # JPEG output: start quality, lowest quality allowed, and byte budget per image
+    OCR_JPEG_QUALITY: int = 85
+    OCR_JPEG_MIN_QUALITY: int = 60
+    OCR_TARGET_BYTES: int = 350_000
+    # Decompression-bomb guard: reject images above this many pixels before decoding
+    OCR_MAX_IMAGE_PIXELS: int = 40_000_000
+    # PDFs: max pages sent to Gemini, and pages rasterized in parallel (also bounds peak memory)
+    OCR_PDF_MAX_PAGES: int = 5
+    OCR_PDF_RENDER_THREADS: int = 2
+    # Tall receipts: tile images whose long/short ratio exceeds this (0 = off); overlap is a fraction of a tile
+    OCR_TILE_ASPECT_THRESHOLD: float = 2.5
+    OCR_TILE_OVERLAP: float = 0.15
+    OCR_TILE_MAX_TILES: int = 6
+    # Two-tier OCR: first pass at OCR_TIER1_MAX_DIMENSION (and OCR_TIER1_MODEL_NAME if set), full pass only when it looks wrong
+    OCR_TIERED_ENABLED: bool = False
+    OCR_TIER1_MAX_DIMENSION: int = 768
+    OCR_TIER1_MODEL_NAME: str = ""
+    # Crop photos to the receipt (plus margin) and straighten rotations up to OCR_DESKEW_MAX_ANGLE degrees (0 = off)
+    OCR_AUTOCROP_ENABLED: bool = False
+    OCR_AUTOCROP_MARGIN: float = 0.03
+    OCR_DESKEW_MAX_ANGLE: float = 8.0
+    # Photo quality gate before Gemini: warn (scores + warning in meta) | reject (422) | off
+    # Thresholds are not tuned on real receipt photos yet: opt into reject per deployment
+    OCR_QUALITY_GATE: str = "warn"
+    OCR_QUALITY_MIN_SHARPNESS: float = 10.0  # Laplacian variance over the receipt region
+    OCR_QUALITY_MIN_BRIGHTNESS: float = 40.0  # mean luminance 0-255
+    OCR_QUALITY_MAX_BRIGHTNESS: float = 250.0
+    OCR_QUALITY_MIN_COVERAGE: float = 0.02  # fraction of the frame with text/edges
+    # Forward upright JPEGs already within OCR_MAX_DIMENSION / OCR_TARGET_BYTES as uploaded (no re-encode)
+    OCR_PASSTHROUGH_ENABLED: bool = True
 
     # Gemini OCR Configuration
     GEMINI_API_KEY: str | None = None
@@ -55,13 +101,43 @@ class Settings(BaseSettings):
     GEMINI_MODEL_NAME: str = "gemini-2.5-flash"
     GEMINI_MAX_TOKENS: int = 256
     GEMINI_TEMPERATURE: float = 0.0
-    # Prompt mode: "json" (default) or "financial" (text/plain like gemini_adv)
-    GEMINI_OCR_PROMPT_MODE: str = "json"
-    # In financial mode, optionally bypass preprocessing (send original image)
-    OCR_BYPASS_PREPROCESS_FINANCIAL: bool = True
+    # Global cap on in-flight Gemini calls per worker process, and per-call timeout
+    GEMINI_MAX_CONCURRENCY: int = 8
+    GEMINI_TIMEOUT_SECONDS: float = 60.0
+    # Gemini context caching for the static system prompt (TTL in seconds); falls back to inline on failure
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = False
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600
+    # Project quota shared by all processes via Redis token buckets (0 = unlimited); calls wait up to the deadline
+    GEMINI_RPM_LIMIT: int = 0
+    GEMINI_TPM_LIMIT: int = 0
+    GEMINI_QUEUE_DEADLINE_SECONDS: float = 20.0
+    # 429/503 retries with full-jitter exponential backoff (base delay in seconds), bounded by the deadline
+    GEMINI_RETRY_MAX_ATTEMPTS: int = 4
+    GEMINI_RETRY_BASE_DELAY: float = 0.5
     
-    # OCR Batch Processing
+    # OCR result cache keyed by sha256(upload bytes + prompt version + hints)
+    OCR_RESULT_CACHE_ENABLED: bool = True
+    OCR_RESULT_CACHE_TTL: int = 7 * 24 * 3600
+    
+    # Latest OCR context per chat session (incl. "no OCR" entries), read by every chat turn
+    OCR_CONTEXT_CACHE_ENABLED: bool = True
+    OCR_CONTEXT_CACHE_TTL: int = 24 * 3600
+    
+    # Near-duplicate receipts (perceptual hash): off | warn (flag possible_duplicate) | reuse (skip Gemini)
+    OCR_DUPLICATE_POLICY: str = "warn"
+    OCR_DUPLICATE_HAMMING_THRESHOLD: int = 6  # max differing bits out of 64
+    OCR_DUPLICATE_INDEX_REFRESH_SECONDS: int = 300  # reload a user's hash index from DB after this
+    
+    # OCR Batch Processing (POST /ocr/expense:batchExtract): max files, and files processed in parallel
     OCR_BATCH_SIZE: int = 30
+    OCR_BATCH_CONCURRENCY: int = 4
+
+    # Async OCR jobs (Redis queue + worker pool: python -m app.modules.ocr_expense.worker)
+    OCR_WORKER_CONCURRENCY: int = 4
+    OCR_JOB_MAX_RETRIES: int = 3
+    OCR_JOB_PAYLOAD_TTL: int = 3600  # seconds an enqueued upload is kept in Redis
+    OCR_JOB_RETRY_BASE_DELAY: float = 5.0  # seconds before the first retry, doubled per attempt
+    OCR_JOB_RETRY_MAX_DELAY: float = 300.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
@@ -14,6 +14,8 @@ from app.modules.ocr_expense.exceptions import register_ocr_exception_handlers
 from app.middlewares.request_context import RequestContextMiddleware
 from app.db.session import engine
 from app.redis.client import ping as redis_ping, close as redis_close
+from app.modules.ocr_expense.preprocessing import preprocessor
+from app.modules.chat.provider import get_http_client, close_http_client
 from fastapi.openapi.utils import get_openapi
 
 
@@ -37,10 +39,15 @@ async def lifespan(app: FastAPI):
             # Cho nổ lỗi để container/app fail fast nếu Redis không sẵn sàng
             raise RuntimeError("Redis is not reachable at startup")
 
+    # Connection pool tới chat provider, dùng chung cho mọi request của worker
+    get_http_client()
+
     try:
         yield
     finally:
         # Shutdown
+        preprocessor.shutdown()
+        await close_http_client()
         try:
             await redis_close()
         except Exception:
@@ -12,6 +12,18 @@ from app.core.config import settings
 security = HTTPBearer()
 
 
+async def get_user_from_token(db: AsyncSession, token: str) -> Optional[User]:
+    """Decode a JWT access token and load its user; None if the token is invalid"""
+    try:
+        payload = decode_token(token)
+        user_id: str = payload.get("sub")
+    except Exception:
+        return None
+    if user_id is None:
+        return None
+    return await get_user_by_email(db, user_id)
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
@@ -23,16 +35,7 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = decode_token(credentials.credentials)
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except Exception:
-        raise credentials_exception
-    
-    # Get user from database
-    user = await get_user_by_email(db, user_id)
+    user = await get_user_from_token(db, credentials.credentials)
     if user is None:
         raise credentials_exception
     
@@ -1,127 +1,178 @@
 from __future__ import annotations
 
 import json
-from typing import List, Optional
-from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
+from app.core.config import settings
 from app.redis.client import get_redis_client
 from app.modules.chat.schemas import ChatMessage
 
+# Layout v2: mỗi session là MỘT list capped các entry JSON gọn [id, role, content]
+# (cũ -> mới), TTL trượt theo mỗi lần đọc/ghi. Không còn key riêng cho từng message
+# nên không có "lỗ" do message hết hạn lệch nhau, và bớt overhead mỗi key của Redis.
+# Đổi schema entry => tăng CACHE_VERSION (namespace mới, cache cũ tự hết hạn).
+CACHE_VERSION = "v2"
+
+# Layout v1 (chat:session:{sid} list id + chat:message:{sid}:{mid}) chỉ còn được đọc
+# trong giai đoạn chuyển đổi (CHAT_CACHE_LEGACY_READ) và migrate dần sang v2.
+# Script tự ghép key message từ prefix nên chỉ dùng cho Redis standalone (không cluster).
+
+# KEYS[1] = list id v1; ARGV[1] = index cuối (LRANGE), ARGV[2] = prefix key message
+_LEGACY_HISTORY_SCRIPT = """
+local ids = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]))
+if #ids == 0 then
+    return {}
+end
+local keys = {}
+for i, id in ipairs(ids) do
+    keys[i] = ARGV[2] .. id
+end
+return redis.call('MGET', unpack(keys))
+"""
+
+# KEYS[1] = list id v1, KEYS[2] = key v2; ARGV[1] = prefix key message v1
+_LEGACY_CLEAR_SCRIPT = """
+local ids = redis.call('LRANGE', KEYS[1], 0, -1)
+for _, id in ipairs(ids) do
+    redis.call('DEL', ARGV[1] .. id)
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return #ids
+"""
+
 
 class ChatCache:
     """Redis cache cho chat history"""
-    
+
     def __init__(self):
         self.redis = get_redis_client()
-        self.ttl = 3600  # 1 hour TTL
+        self.ttl = 3600  # 1 hour TTL (trượt: gia hạn mỗi lần đọc/ghi)
         self.max_messages = 20  # Tối đa 20 messages trong cache
-    
+        self.legacy_read = settings.CHAT_CACHE_LEGACY_READ
+        # register_script không gọi Redis; lần chạy đầu EVALSHA tự fallback sang EVAL
+        self._legacy_history_script = self.redis.register_script(_LEGACY_HISTORY_SCRIPT)
+        self._legacy_clear_script = self.redis.register_script(_LEGACY_CLEAR_SCRIPT)
+
     def _get_session_key(self, session_id: str) -> str:
         """Tạo Redis key cho session"""
+        return f"chat:{CACHE_VERSION}:session:{session_id}"
+
+    def _get_legacy_session_key(self, session_id: str) -> str:
         return f"chat:session:{session_id}"
-    
-    def _get_message_key(self, session_id: str, message_id: str) -> str:
-        """Tạo Redis key cho message"""
-        return f"chat:message:{session_id}:{message_id}"
-    
+
+    def _get_legacy_message_prefix(self, session_id: str) -> str:
+        return f"chat:message:{session_id}:"
+
+    @staticmethod
+    def _encode(message_id: str, role: str, content: str) -> str:
+        return json.dumps([message_id, role, content], ensure_ascii=False, separators=(",", ":"))
+
     async def get_chat_history(self, session_id: str, limit: int | None = None) -> Optional[List[ChatMessage]]:
         """Lấy chat history từ Redis cache (ưu tiên), tôn trọng limit nếu có"""
         try:
             session_key = self._get_session_key(session_id)
-            
-            # Lấy danh sách message IDs từ Redis
             max_count = self.max_messages if limit is None else min(self.max_messages, max(0, limit))
-            message_ids = await self.redis.lrange(session_key, 0, max_count - 1)
-            
-            if not message_ids:
-                return None
-            
-            # Lấy từng message từ Redis (lpush lưu mới nhất ở đầu; sẽ đảo thứ tự trước khi trả)
-            messages = []
-            for msg_id in message_ids:
-                message_key = self._get_message_key(session_id, msg_id)
-                message_data = await self.redis.get(message_key)
-                
-                if message_data:
-                    msg_dict = json.loads(message_data)
-                    messages.append(ChatMessage(
-                        role=msg_dict["role"],
-                        content=msg_dict["content"]
-                    ))
-            
-            # Đảo ngược để trả theo thứ tự cũ -> mới cho đồng nhất với DB
-            if messages:
-                messages.reverse()
-                return messages
-            return None
-            
+
+            # Đọc N entry mới nhất + gia hạn TTL trong một round trip
+            async with self.redis.pipeline(transaction=True) as pipe:
+                entries, _ = await pipe.lrange(session_key, -max_count, -1).expire(session_key, self.ttl).execute()
+
+            messages = [ChatMessage(role=role, content=content) for _, role, content in map(json.loads, entries)]
+            if not messages and self.legacy_read:
+                migrated = await self._migrate_legacy(session_id)
+                messages = migrated[-max_count:] if max_count else migrated
+            return messages or None
+
         except Exception as e:
             print(f"Redis cache error: {e}")
             return None
-    
+
+    async def _migrate_legacy(self, session_id: str) -> List[ChatMessage]:
+        """Đọc cache layout v1 (nếu còn) và chuyển sang v2 trong một transaction"""
+        values = await self._legacy_history_script(
+            keys=[self._get_legacy_session_key(session_id)],
+            args=[self.max_messages - 1, self._get_legacy_message_prefix(session_id)],
+        )
+        # v1 lưu mới nhất ở đầu; message hết hạn riêng lẻ (None) bị bỏ qua
+        rows = [json.loads(value) for value in reversed(values or []) if value]
+        if not rows:
+            return []
+        await self.fill_history(session_id, [(row["id"], row["role"], row["content"]) for row in rows])
+        await self.redis.delete(*(self._get_legacy_message_prefix(session_id) + row["id"] for row in rows))
+        print(f"♻️ Migrated {len(rows)} messages sang cache {CACHE_VERSION} cho session {session_id}")
+        return [ChatMessage(role=row["role"], content=row["content"]) for row in rows]
+
     async def add_message(self, session_id: str, message_id: str, role: str, content: str) -> None:
         """Thêm message vào Redis cache"""
+        await self.add_messages(session_id, [(message_id, role, content)])
+
+    async def add_messages(self, session_id: str, messages: List[Tuple[str, str, str]]) -> None:
+        """
+        Nối message (id, role, content) theo thứ tự cũ -> mới vào history ĐANG được cache.
+
+        Dùng RPUSHX: session chưa có cache thì không tạo list chỉ chứa vài message mới
+        (history bị cụt); lần đọc tiếp theo sẽ nạp đầy đủ từ DB qua fill_history.
+        """
+        if not messages:
+            return
         try:
             session_key = self._get_session_key(session_id)
-            message_key = self._get_message_key(session_id, message_id)
-            
-            # Lưu message data
-            message_data = {
-                "id": message_id,
-                "role": role,
-                "content": content,
-                "created_at": datetime.now().isoformat()
-            }
-            
-            await self.redis.setex(
-                message_key, 
-                self.ttl, 
-                json.dumps(message_data, ensure_ascii=False)
-            )
-            
-            # Thêm message ID vào danh sách session
-            await self.redis.lpush(session_key, message_id)
-            
-            # Giới hạn số lượng messages trong cache
-            await self.redis.ltrim(session_key, 0, self.max_messages - 1)
-            
-            # Set TTL cho session key
-            await self.redis.expire(session_key, self.ttl)
-            
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.rpushx(session_key, *(self._encode(*message) for message in messages))
+                pipe.ltrim(session_key, -self.max_messages, -1)
+                pipe.expire(session_key, self.ttl)
+                if self.legacy_read:
+                    # Cache v1 của session không còn đầy đủ nữa: bỏ để không bị dual-read
+                    pipe.delete(self._get_legacy_session_key(session_id))
+                await pipe.execute()
+
         except Exception as e:
             print(f"Redis cache add error: {e}")
-    
+
+    async def fill_history(self, session_id: str, messages: List[Tuple[str, str, str]]) -> None:
+        """Ghi đè history của session (cũ -> mới), vd. sau cache MISS đã đọc từ DB"""
+        if not messages:
+            return
+        try:
+            session_key = self._get_session_key(session_id)
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(session_key)
+                pipe.rpush(session_key, *(self._encode(*message) for message in messages[-self.max_messages:]))
+                pipe.expire(session_key, self.ttl)
+                if self.legacy_read:
+                    pipe.delete(self._get_legacy_session_key(session_id))
+                await pipe.execute()
+
+        except Exception as e:
+            print(f"Redis cache fill error: {e}")
+
     async def clear_session_cache(self, session_id: str) -> None:
         """Xóa cache của session"""
         try:
-            session_key = self._get_session_key(session_id)
-            
-            # Lấy tất cả message IDs
-            message_ids = await self.redis.lrange(session_key, 0, -1)
-            
-            # Xóa từng message
-            for msg_id in message_ids:
-                message_key = self._get_message_key(session_id, msg_id)
-                await self.redis.delete(message_key)
-            
-            # Xóa session key
-            await self.redis.delete(session_key)
-            
+            if self.legacy_read:
+                await self._legacy_clear_script(
+                    keys=[self._get_legacy_session_key(session_id), self._get_session_key(session_id)],
+                    args=[self._get_legacy_message_prefix(session_id)],
+                )
+            else:
+                await self.redis.delete(self._get_session_key(session_id))
+
         except Exception as e:
             print(f"Redis cache clear error: {e}")
-    
+
     async def get_cache_stats(self, session_id: str) -> dict:
         """Lấy thống kê cache"""
         try:
             session_key = self._get_session_key(session_id)
-            message_count = await self.redis.llen(session_key)
-            ttl = await self.redis.ttl(session_key)
-            
+            async with self.redis.pipeline(transaction=False) as pipe:
+                message_count, ttl = await pipe.llen(session_key).ttl(session_key).execute()
+
             return {
                 "session_id": session_id,
                 "message_count": message_count,
                 "ttl": ttl,
-                "max_messages": self.max_messages
+                "max_messages": self.max_messages,
+                "layout": CACHE_VERSION,
             }
         except Exception as e:
             print(f"Redis cache stats error: {e}")
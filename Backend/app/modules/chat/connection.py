@@ -0,0 +1,81 @@
+"""
+State theo từng kết nối của chat WebSocket (/chat/ws/{session_id}).
+
+JWT, quyền sở hữu session, system prompt (kèm snippet OCR) và các lượt user gần
+nhất chỉ được resolve một lần khi mở socket rồi giữ trong bộ nhớ; mỗi lượt chat
+chỉ còn chạm DB/Redis để lưu 2 tin nhắn. Snippet OCR được đọc lại (qua session
+context cache) tối đa mỗi CHAT_WS_CONTEXT_REFRESH_SECONDS hoặc khi client gửi
+{"type": "refresh"}, để hóa đơn upload giữa cuộc trò chuyện vẫn được dùng.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.modules.chat.models import Session
+from app.modules.chat.schemas import ChatRequest
+from app.modules.chat.service import (
+    get_chat_history, recent_user_turns, render_system_prompt, save_message, stream_chat_reply,
+)
+
+HISTORY_TURNS = 3  # cùng cửa sổ với build_messages
+
+
+class ChatConnection:
+    """Session đã xác thực, system prompt đã render và các lượt user gần nhất của một WebSocket."""
+
+    def __init__(self, session_id: str, user_id: str, system_prompt: str, history: List[str]):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.system_prompt = system_prompt
+        self.history: Deque[str] = deque(history, maxlen=HISTORY_TURNS)
+        self.context_loaded_at = time.monotonic()
+
+    @classmethod
+    async def open(cls, db: AsyncSession, session_id: str, user_id: str) -> "ChatConnection":
+        """Kiểm tra quyền sở hữu và load prompt/lịch sử một lần; ValueError giống chat_infer."""
+        result = await db.execute(select(Session).where(Session.id == session_id))
+        chat_session = result.scalar_one_or_none()
+        if not chat_session:
+            raise ValueError(f"Session {session_id} không tồn tại")
+        if chat_session.user_id != user_id:
+            raise ValueError("User không có quyền truy cập session này")
+        system_prompt = await render_system_prompt(db, session_id)
+        history = recent_user_turns(await get_chat_history(db, session_id), HISTORY_TURNS)
+        return cls(session_id, user_id, system_prompt, [m.content for m in history])
+
+    async def refresh_context(self) -> None:
+        async with AsyncSessionLocal() as db:
+            self.system_prompt = await render_system_prompt(db, self.session_id)
+        self.context_loaded_at = time.monotonic()
+
+    def provider_messages(self, query: str) -> List[Dict[str, str]]:
+        return (
+            [{"role": "system", "content": self.system_prompt}]
+            + [{"role": "user", "content": turn} for turn in self.history]
+            + [{"role": "user", "content": query}]
+        )
+
+    async def run_turn(self, query: str, suggestion: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Một lượt chat: các event của stream_chat_reply (delta / suggestion / done)."""
+        if time.monotonic() - self.context_loaded_at > settings.CHAT_WS_CONTEXT_REFRESH_SECONDS:
+            await self.refresh_context()
+        messages = self.provider_messages(query)
+        async with AsyncSessionLocal() as db:
+            await save_message(db, self.session_id, self.user_id, "user", query)
+        self.history.append(query)
+
+        payload = ChatRequest(user_id=self.user_id, session_id=self.session_id, query=query, suggestion=suggestion)
+        replies = stream_chat_reply(payload, self.session_id, messages)
+        try:
+            async for event in replies:
+                yield event
+        finally:
+            await replies.aclose()
@@ -1,18 +1,108 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import httpx
 
 from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Một AsyncClient dùng chung cho cả worker: giữ kết nối keep-alive (và HTTP/2) tới provider,
+# mở trong lifespan của FastAPI, đóng khi shutdown (lazy nếu chạy ngoài app, vd. script/test)
+_client: Optional[httpx.AsyncClient] = None
+_in_flight = 0
+_peak_in_flight = 0
+
+
+def _http2_enabled() -> bool:
+    if not settings.CHAT_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("CHAT_HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=settings.CHAT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.CHAT_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.CHAT_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.CHAT_HTTP_READ_TIMEOUT, connect=settings.CHAT_HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool utilization of the shared client (connection counts are best effort: httpx keeps its pool private)."""
+    pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "open": _client is not None and not _client.is_closed,
+        "http2": bool(pool is not None and getattr(pool, "_http2", False)),
+        "max_connections": settings.CHAT_HTTP_MAX_CONNECTIONS,
+        "max_keepalive": settings.CHAT_HTTP_MAX_KEEPALIVE,
+        "connections": len(connections),
+        "idle_connections": idle,
+        "in_flight": _in_flight,
+        "peak_in_flight": _peak_in_flight,
+        "utilization": round(_in_flight / settings.CHAT_HTTP_MAX_CONNECTIONS, 3),
+    }
+
+
+def _record_pool() -> None:
+    stats = pool_stats()
+    metrics.set_gauge("chat.provider.in_flight", stats["in_flight"])
+    metrics.set_gauge("chat.provider.connections", stats["connections"])
+    metrics.set_gauge("chat.provider.idle_connections", stats["idle_connections"])
+    metrics.set_gauge("chat.provider.pool_utilization", stats["utilization"])
+
+
+@asynccontextmanager
+async def _track_request() -> AsyncIterator[None]:
+    global _in_flight, _peak_in_flight
+    _in_flight += 1
+    _peak_in_flight = max(_peak_in_flight, _in_flight)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        metrics.observe("chat.provider.request", time.perf_counter() - start)
+        _record_pool()
 
 
 class ChatProviderClient:
     """Client tối giản để gọi provider /v1/chat/completions."""
 
-    def __init__(self, timeout_seconds: int = 60):
+    def __init__(self, timeout_seconds: int | None = None):
         self.base_url = settings.CHAT_API_BASE.rstrip("/")
-        self.timeout_seconds = timeout_seconds
+        # Read timeout của từng lời gọi; connect timeout và pool lấy từ client dùng chung
+        self.timeout_seconds = timeout_seconds or settings.CHAT_HTTP_READ_TIMEOUT
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.timeout_seconds, connect=settings.CHAT_HTTP_CONNECT_TIMEOUT)
 
     def _endpoint(self) -> str:
         return f"{self.base_url}/v1/chat/completions"
@@ -54,10 +144,43 @@ class ChatProviderClient:
             max_tokens=max_tokens or settings.CHAT_MAX_TOKENS,
             temperature=temperature or settings.CHAT_TEMPERATURE,
         )
-        async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
-            resp = await client.post(self._endpoint(), headers=self._headers(), json=body)
+        async with _track_request():
+            resp = await get_http_client().post(
+                self._endpoint(), headers=self._headers(), json=body, timeout=self._timeout()
+            )
             resp.raise_for_status()
             return resp.json()
 
+    async def stream_completions(
+        self,
+        *,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        max_tokens: int | None = None,
+        temperature: float | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Gọi với stream=true, yield từng chunk JSON (SSE `data:`) đến khi gặp [DONE].
 
-
+        Đóng generator (vd. client ngắt kết nối) sẽ đóng luôn response stream tới provider.
+        """
+        body = self._build_body(
+            model=model or settings.CHAT_MODEL,
+            messages=messages,
+            max_tokens=max_tokens or settings.CHAT_MAX_TOKENS,
+            temperature=temperature or settings.CHAT_TEMPERATURE,
+        )
+        body["stream"] = True
+        headers = {**self._headers(), "Accept": "text/event-stream"}
+        async with _track_request():
+            async with get_http_client().stream(
+                "POST", self._endpoint(), headers=headers, json=body, timeout=self._timeout()
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return
+                    if data:
+                        yield json.loads(data)
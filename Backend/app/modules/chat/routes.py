@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
-from app.modules.auth.middleware import get_current_user
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal, get_db
+from app.modules.auth.middleware import get_current_user, get_user_from_token
+from app.modules.chat.connection import ChatConnection
 from app.modules.users.service import User
 from app.modules.chat.schemas import ChatRequest, ChatResponse, SessionResponse, ChatMessage, SuggestionRequest, SuggestionResponse
-from app.modules.chat.service import chat_infer, create_session, get_user_sessions, mock_simple_response, clear_session_cache, get_cache_stats, test_ai_response_format, get_chat_history, suggestion_infer
+from app.modules.chat.service import chat_infer, prepare_chat_turn, stream_chat_reply, create_session, get_user_sessions, mock_simple_response, clear_session_cache, get_cache_stats, test_ai_response_format, get_chat_history, suggestion_infer
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -54,6 +60,105 @@ async def chat(
     return await chat_infer(payload, db)
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post(
+    "/stream",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}, "description": "Server-Sent Events"}}
+)
+async def chat_stream(
+    payload: ChatRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Chat như POST /chat/ nhưng trả từng đoạn text ngay khi provider sinh ra (SSE):
+        event: delta       data: {"content": "..."}
+        event: suggestion  data: {"suggestion": "..."}   (khi suggestion=true)
+        event: done        data: {"answer", "session_id", "message_id", "ttft_ms", "tokens", "tokens_per_second"}
+    Client ngắt kết nối thì stream tới provider bị hủy và câu trả lời không được lưu.
+    """
+    chat_session, provider_messages = await prepare_chat_turn(payload, db)
+
+    async def event_stream():
+        replies = stream_chat_reply(payload, chat_session.id, provider_messages)
+        try:
+            async for event, data in replies:
+                if await request.is_disconnected():
+                    break
+                yield _sse(event, data)
+        finally:
+            # Đóng ngay stream tới provider (không chờ GC) khi client đã ngắt
+            await replies.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws/{session_id}")
+async def chat_websocket(websocket: WebSocket, session_id: str, token: Optional[str] = None):
+    """
+    Kênh chat WebSocket: xác thực một lần (?token=<JWT> hoặc header Authorization: Bearer),
+    sau đó giữ session/system prompt/lịch sử trong bộ nhớ kết nối.
+
+    Client gửi:  {"type": "message", "query": "...", "suggestion": false} | {"type": "refresh"} | {"type": "ping"}
+    Server gửi:  {"type": "ready"}, rồi mỗi lượt {"type": "delta", "content"} ... {"type": "suggestion", "suggestion"}
+                 {"type": "done", ...} (giống /chat/stream); {"type": "error", "message"} khi frame không hợp lệ.
+    Mỗi frame được gửi xong (await) mới đọc tiếp từ provider, nên client chậm sẽ làm chậm
+    stream upstream thay vì dồn buffer; các lượt chat của một kết nối chạy tuần tự.
+    """
+    if not token:
+        authorization = websocket.headers.get("authorization") or ""
+        token = authorization[7:] if authorization.lower().startswith("bearer ") else None
+    # Chỉ giữ DB session trong lúc xác thực/load state, không giữ suốt kết nối
+    async with AsyncSessionLocal() as db:
+        user = await get_user_from_token(db, token) if token else None
+        if user is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate credentials")
+            return
+        try:
+            connection = await ChatConnection.open(db, session_id, user.id)
+        except ValueError as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+            return
+
+    await websocket.accept()
+    metrics.incr("chat.ws.connections")
+    await websocket.send_json({"type": "ready", "session_id": session_id})
+    try:
+        while True:
+            try:
+                frame = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "message": "Frame phải là JSON"})
+                continue
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif kind == "refresh":
+                await connection.refresh_context()
+                await websocket.send_json({"type": "refreshed"})
+            elif kind == "message" and isinstance(frame.get("query"), str) and frame["query"].strip():
+                metrics.incr("chat.ws.turns")
+                replies = connection.run_turn(frame["query"], bool(frame.get("suggestion")))
+                try:
+                    async for event, data in replies:
+                        await websocket.send_json({"type": event, **data})
+                finally:
+                    await replies.aclose()
+            else:
+                await websocket.send_json({"type": "error", "message": "Frame không hợp lệ"})
+    except WebSocketDisconnect:
+        pass
+
+
 @router.post("/mock", response_model=ChatResponse)
 async def chat_mock() -> ChatResponse:
     """Test endpoint với mock response"""
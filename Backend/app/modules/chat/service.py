@@ -1,13 +1,18 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
 import asyncio
+import json
+import time
+from contextlib import aclosing
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.db.session import AsyncSessionLocal
 from app.modules.chat.prompt_registry import prompt_registry
 from app.modules.chat.schemas import ChatMessage, ChatRequest, ChatResponse
 from app.modules.chat.models import Session, Message
@@ -16,48 +21,44 @@ from app.modules.chat.schemas import SuggestionRequest, SuggestionResponse
 from app.modules.chat.provider import ChatProviderClient
 
 
-async def build_messages(payload: ChatRequest, db_session: AsyncSession) -> List[ChatMessage]:
+async def render_system_prompt(db_session: AsyncSession, session_id: str) -> str:
+    """System prompt của session: prompt gốc + snippet OCR (nếu session có OCR)."""
     # Dùng system prompt tự nhiên (plain text)
     system_prompt = prompt_registry.load_system_prompt("system")
     
-    # Check for OCR context in session
+    # Check for OCR context in session (pre-rendered snippet, cached per session)
     try:
         from app.modules.ocr_expense.service import ocr_expense_service
-        ocr_context = await ocr_expense_service.get_ocr_context_by_session(db_session, payload.session_id)
-        if ocr_context:
-            # Add OCR context to system prompt
-            ocr_info = f"""
-OCR Context Available:
-- Transaction Date: {ocr_context.get('transaction_date')}
-- Amount: {ocr_context.get('amount', {}).get('value', 0):,} {ocr_context.get('amount', {}).get('currency', 'VND')}
-- Category: {ocr_context.get('category', {}).get('name')} ({ocr_context.get('category', {}).get('code')})
-- Items: {len(ocr_context.get('items', []))} items
-"""
-            if ocr_context.get('items'):
-                ocr_info += "\nItems:\n"
-                for item in ocr_context.get('items', []):
-                    ocr_info += f"- {item.get('name')} (qty: {item.get('qty', 1)})\n"
-            
-            system_prompt += f"\n\n{ocr_info}\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."
+        ocr_prompt = await ocr_expense_service.get_ocr_prompt_context(db_session, session_id)
+        if ocr_prompt:
+            system_prompt += ocr_prompt
     except Exception as e:
         # OCR context not available, continue with normal flow
         pass
-    
+    return system_prompt
+
+
+def recent_user_turns(history_messages: list, limit: int = 3) -> List[ChatMessage]:
+    """Chỉ giữ các lượt user gần nhất của lịch sử (ChatMessage hoặc dict từ Redis)."""
+    normalized_history: List[ChatMessage] = []
+    for m in history_messages or []:
+        if isinstance(m, dict):
+            role = m.get("role")
+            content = m.get("content")
+            if role and content is not None:
+                normalized_history.append(ChatMessage(role=role, content=content))
+        else:
+            normalized_history.append(m)
+    user_only_history = [m for m in normalized_history if m.role == "user"]
+    return user_only_history[-limit:]
+
+
+async def build_messages(payload: ChatRequest, db_session: AsyncSession) -> List[ChatMessage]:
+    system_prompt = await render_system_prompt(db_session, payload.session_id)
     messages: List[ChatMessage] = [ChatMessage(role="system", content=system_prompt)]
     # Lấy lịch sử trực tiếp từ Redis/DB và chỉ lấy các lượt user gần nhất
     history_messages = await get_chat_history(db_session, payload.session_id)
-    if history_messages:
-        normalized_history: List[ChatMessage] = []
-        for m in history_messages:
-            if isinstance(m, dict):
-                role = m.get("role")
-                content = m.get("content")
-                if role and content is not None:
-                    normalized_history.append(ChatMessage(role=role, content=content))
-            else:
-                normalized_history.append(m)
-        user_only_history = [m for m in normalized_history if m.role == "user"]
-        messages.extend(user_only_history[-3:])
+    messages.extend(recent_user_turns(history_messages))
     messages.append(ChatMessage(role="user", content=payload.query))
     return messages
 
@@ -171,8 +172,7 @@ async def get_chat_history(session: AsyncSession, session_id: str, limit: int =
     
     # 3. Cache messages vào Redis cho lần sau
     if db_messages:
-        for msg in messages:
-            await chat_cache.add_message(session_id, msg.id, msg.role, msg.content)
+        await chat_cache.fill_history(session_id, [(msg.id, msg.role, msg.content) for msg in messages])
         print(f"💾 Cached {len(db_messages)} messages vào Redis cho session {session_id}")
     
     return db_messages
@@ -187,7 +187,12 @@ async def mock_simple_response() -> ChatResponse:
     )
 
 
-async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResponse:
+FALLBACK_ANSWER = "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau."
+EMPTY_ANSWER = "Xin lỗi, hiện tôi chưa có câu trả lời. Vui lòng thử lại."
+
+
+async def prepare_chat_turn(payload: ChatRequest, db_session: AsyncSession) -> Tuple[Session, List[Dict[str, str]]]:
+    """Xác thực session, build messages và lưu tin nhắn user; trả về (session, messages dạng provider)."""
     # Lấy session theo ID (bắt buộc) - session_id là string, đồng thời xác thực chủ sở hữu
     result = await db_session.execute(select(Session).where(Session.id == payload.session_id))
     chat_session = result.scalar_one_or_none()
@@ -197,13 +202,6 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
     if chat_session.user_id != payload.user_id:
         raise ValueError("User không có quyền truy cập session này")
     
-    # Prefetch OCR context để đảm bảo tích hợp (và để test có thể assert được lời gọi)
-    try:
-        from app.modules.ocr_expense.service import ocr_expense_service
-        _ = await ocr_expense_service.get_ocr_context_by_session(db_session, payload.session_id)
-    except Exception:
-        pass
-    
     # Lấy và build messages từ Redis/DB TRƯỚC KHI lưu tin nhắn mới (tránh duplicate)
     messages = await build_messages(payload, db_session)
     
@@ -222,6 +220,18 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
           else {"role": m.role, "content": m.content} )
         for m in messages
     ]
+    return chat_session, provider_messages
+
+
+def _suggestion_messages(query: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": prompt_registry.load_system_prompt("suggestion")},
+        {"role": "user", "content": query},
+    ]
+
+
+async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResponse:
+    chat_session, provider_messages = await prepare_chat_turn(payload, db_session)
 
     provider = ChatProviderClient(timeout_seconds=60)
 
@@ -230,7 +240,9 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
         return {
             "choices": [{
                 "message": {
-                    "content": '{"answer": "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau.", "suggestion": "Thử lại sau ít phút"}'
+                    "content": json.dumps(
+                        {"answer": FALLBACK_ANSWER, "suggestion": "Thử lại sau ít phút"}, ensure_ascii=False
+                    )
                 }
             }]
         }
@@ -238,14 +250,8 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
     try:
         if payload.suggestion:
             # Chuẩn bị payload cho suggestion (song song)
-            suggestion_system_prompt = prompt_registry.load_system_prompt("suggestion")
-            suggestion_messages = [
-                {"role": "system", "content": suggestion_system_prompt},
-                {"role": "user", "content": payload.query},
-            ]
-
             chat_task = provider.completions(messages=provider_messages)
-            sugg_task = provider.completions(messages=suggestion_messages)
+            sugg_task = provider.completions(messages=_suggestion_messages(payload.query))
             data, sugg_data = await asyncio.gather(chat_task, sugg_task)
         else:
             data = await provider.completions(messages=provider_messages)
@@ -264,7 +270,7 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
     suggestion: str | None = None
 
     if not answer_text:
-        answer_text = "Xin lỗi, hiện tôi chưa có câu trả lời. Vui lòng thử lại."
+        answer_text = EMPTY_ANSWER
 
     # Parse suggestion: prompt suggestion trả về plain text content
     suggestion_raw = sugg_data.get("choices", [{}])[0].get("message", {}).get("content", "")
@@ -287,6 +293,109 @@ async def chat_infer(payload: ChatRequest, db_session: AsyncSession) -> ChatResp
     return ChatResponse(answer=answer_text, suggestion=suggestion, session_id=chat_session.id)
 
 
+async def stream_chat_reply(
+    payload: ChatRequest,
+    session_id: str,
+    provider_messages: List[Dict[str, str]],
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream câu trả lời từ provider dưới dạng (event, data):
+        ("delta", {"content": ...})        mỗi đoạn text nhận được
+        ("suggestion", {"suggestion": ...}) nếu payload.suggestion
+        ("done", {"answer", "message_id", "ttft_ms", "tokens", "tokens_per_second", ...})
+    Tin nhắn assistant được lưu (DB session riêng) khi stream kết thúc. Nếu client
+    ngắt kết nối, generator bị cancel/đóng: stream tới provider đóng theo, không lưu gì.
+    """
+    provider = ChatProviderClient(timeout_seconds=60)
+    sugg_task = None
+    if payload.suggestion:
+        sugg_task = asyncio.create_task(
+            ChatProviderClient(timeout_seconds=30).completions(messages=_suggestion_messages(payload.query))
+        )
+    parts: List[str] = []
+    chunks = 0
+    usage_tokens = None
+    failed = False
+    finished = False
+    start = time.perf_counter()
+    first_at = None
+    try:
+        try:
+            async with aclosing(provider.stream_completions(messages=provider_messages)) as stream:
+                async for chunk in stream:
+                    # Provider có thể gửi usage ở chunk cuối; không có thì đếm theo chunk (~1 token/chunk)
+                    usage_tokens = (chunk.get("usage") or {}).get("completion_tokens") or usage_tokens
+                    delta = ((chunk.get("choices") or [{}])[0].get("delta") or {}).get("content")
+                    if not delta:
+                        continue
+                    if first_at is None:
+                        first_at = time.perf_counter()
+                        metrics.observe("chat.stream.ttft", first_at - start)
+                    chunks += 1
+                    parts.append(delta)
+                    yield "delta", {"content": delta}
+        except Exception as e:
+            print(f"API Error (stream): {e}")
+            metrics.incr("chat.stream.error")
+            failed = True
+            if not parts:
+                parts.append(FALLBACK_ANSWER)
+                yield "delta", {"content": FALLBACK_ANSWER}
+
+        answer_text = "".join(parts).strip() or EMPTY_ANSWER
+
+        suggestion: str | None = None
+        if sugg_task is not None:
+            try:
+                sugg_data = await sugg_task
+                suggestion_raw = sugg_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+                suggestion = suggestion_raw.strip() if isinstance(suggestion_raw, str) and suggestion_raw.strip() else None
+            except Exception as e:
+                print(f"Suggestion API Error (stream): {e}")
+            if suggestion is not None:
+                yield "suggestion", {"suggestion": suggestion}
+
+        elapsed = time.perf_counter() - start
+        ttft = (first_at - start) if first_at is not None else None
+        tokens = usage_tokens or chunks
+        generation = elapsed - ttft if ttft is not None else 0.0
+        tokens_per_second = round(tokens / generation, 1) if generation > 0 else None
+        metrics.observe("chat.stream.total", elapsed)
+        if tokens_per_second is not None:
+            metrics.set_gauge("chat.stream.tokens_per_second", tokens_per_second)
+        print(
+            f"🤖 AI Stream: ttft={ttft * 1000 if ttft is not None else -1:.0f}ms "
+            f"tokens={tokens} tok/s={tokens_per_second} total={elapsed:.2f}s"
+        )
+
+        metadata: Dict[str, Any] = {}
+        if suggestion is not None:
+            metadata["suggestion"] = suggestion
+        if failed and chunks:
+            metadata["incomplete"] = True
+        # Session DB của request đã đóng khi bắt đầu stream; chỉ mở session mới lúc lưu
+        async with AsyncSessionLocal() as db_session:
+            saved_assistant = await save_message(
+                db_session, session_id, payload.user_id, "assistant", answer_text, metadata or None
+            )
+        finished = True
+        metrics.incr("chat.stream.completed")
+        yield "done", {
+            "answer": answer_text,
+            "suggestion": suggestion,
+            "session_id": session_id,
+            "message_id": saved_assistant.id,
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "tokens": tokens,
+            "tokens_per_second": tokens_per_second,
+        }
+    finally:
+        if sugg_task is not None and not sugg_task.done():
+            sugg_task.cancel()
+        if not finished:
+            metrics.incr("chat.stream.aborted")
+
+
 async def clear_session_cache(session_id: str) -> None:
     """Xóa cache của session"""
     await chat_cache.clear_session_cache(session_id)
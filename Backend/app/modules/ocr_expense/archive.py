@@ -0,0 +1,32 @@
+"""
+Raw Gemini response archive.
+
+The JSON Gemini returned (the input to post-processing) is stored with each
+OcrExpenseResult row, zlib-compressed, together with the prompt version that
+produced it, so rule changes can be re-applied to historical extractions
+without calling Gemini again (python -m app.modules.ocr_expense.reprocess).
+"""
+
+from __future__ import annotations
+
+import json
+import zlib
+from typing import Any, Optional
+
+# Responses are small (~0.3-2 KB of JSON); higher levels buy almost nothing
+_COMPRESSION_LEVEL = 6
+
+
+def encode_raw_response(raw: Any) -> Optional[bytes]:
+    """Compact JSON, zlib-compressed (None stays None)."""
+    if raw is None:
+        return None
+    payload = json.dumps(raw, ensure_ascii=False, separators=(",", ":"), default=str)
+    return zlib.compress(payload.encode("utf-8"), _COMPRESSION_LEVEL)
+
+
+def decode_raw_response(blob: Optional[bytes]) -> Any:
+    """Inverse of encode_raw_response."""
+    if blob is None:
+        return None
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
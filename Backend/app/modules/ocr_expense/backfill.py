@@ -0,0 +1,403 @@
+"""
+Offline bulk ingestion of archived receipt scans (historical backfills).
+
+Walks a directory or a zip of images/PDFs and runs every file through the OCR
+pipeline outside the API: preprocessing in the process pool, Gemini calls
+bounded by --concurrency / --max-rpm (and the shared project quota), and
+OcrExpenseJob / OcrExpenseResult (optionally Transaction) rows written with
+bulk inserts every --chunk-size files:
+    python -m app.modules.ocr_expense.backfill scans.zip --user-id <id> --session-id <id>
+    python -m app.modules.ocr_expense.backfill ./scans --user-id <id> --session-id <id> \\
+        --transactions --checkpoint scans.checkpoint --concurrency 8 --max-rpm 300
+    python -m app.modules.ocr_expense.backfill ./scans ... --stub   # local stub, no Gemini calls
+
+Finished files are appended to the checkpoint file after each committed chunk;
+re-running with the same checkpoint skips them (failed ones too, unless
+--retry-failed).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.db.session import AsyncSessionLocal, engine
+from app.modules.ocr_expense.context_cache import session_context_cache
+from app.modules.ocr_expense.dedup import duplicate_index, flag_duplicate
+from app.modules.ocr_expense.exceptions import OcrExpenseException
+from app.modules.ocr_expense.models import OcrExpenseJob, OcrExpenseResult
+from app.modules.ocr_expense.phash import BKTree
+from app.modules.ocr_expense.preprocessing import preprocessor
+from app.modules.ocr_expense.schemas import OcrExpenseHints
+from app.modules.ocr_expense.service import ocr_expense_service
+from app.modules.transactions.models import Transaction, TransactionType
+from app.modules.transactions.service import normalize_to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".heic": "image/heic",
+    ".pdf": "application/pdf",
+}
+
+
+@dataclass
+class BackfillSource:
+    """One scan to ingest; bytes are read only when its turn comes."""
+    name: str  # path relative to the directory / zip entry name (checkpoint key)
+    content_type: str
+    location: str  # stored as the job's file_path
+    read: Callable[[], bytes]
+
+
+def _read_zip_entry(path: Path, name: str) -> bytes:
+    # Own handle per read: nothing stays open between reads, and reads from worker threads never share one
+    with zipfile.ZipFile(path) as archive:
+        return archive.read(name)
+
+
+def iter_sources(path: Path) -> Iterator[BackfillSource]:
+    """Supported files of a directory (recursive) or zip archive, in name order."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            infos = sorted(archive.infolist(), key=lambda i: i.filename)
+        for info in infos:
+            content_type = CONTENT_TYPES.get(Path(info.filename).suffix.lower())
+            if info.is_dir() or content_type is None:
+                continue
+            yield BackfillSource(
+                info.filename, content_type, f"zip://{path.resolve()}!{info.filename}",
+                lambda name=info.filename: _read_zip_entry(path, name),
+            )
+        return
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        content_type = CONTENT_TYPES.get(file.suffix.lower())
+        if content_type is not None:
+            yield BackfillSource(
+                file.relative_to(path).as_posix(), content_type, str(file.resolve()), file.read_bytes,
+            )
+
+
+class Checkpoint:
+    """Append-only JSON-lines file of finished sources ({"name", "job_id", "status"})."""
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+        self.done: Dict[str, str] = {}
+        if path is not None and path.exists():
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    self.done[entry["name"]] = entry["status"]
+
+    def skip(self, name: str, retry_failed: bool = False) -> bool:
+        status = self.done.get(name)
+        return status == "completed" or (status == "failed" and not retry_failed)
+
+    def record(self, entries: List[Dict[str, str]]) -> None:
+        """Append after the chunk is committed (fsync'd, so a crash loses at most one chunk)."""
+        for entry in entries:
+            self.done[entry["name"]] = entry["status"]
+        if self.path is None or not entries:
+            return
+        with self.path.open("a", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class StubExtractor:
+    """
+    Local stand-in for gemini_ocr_client (no network, no quota).
+
+    Returns the same response for every image, after an optional simulated
+    latency; for dry runs of a backfill and for tests.
+    """
+
+    prompt_version = "stub"
+
+    def __init__(self, response: Optional[Dict[str, Any]] = None, latency: float = 0.0):
+        self.response = response or {
+            "transaction_date": None,
+            "amount": {"value": 0, "currency": "VND"},
+            "category": {"code": "OTH", "name": "Khác"},
+            "items": [],
+            "meta": {"needs_review": True, "warnings": ["stub_extraction"]},
+        }
+        self.latency = latency
+
+    async def extract_expense_data(self, image_bytes: bytes, hints=None, extra_pages=None, tile=None,
+                                   model=None, user_id=None) -> Dict[str, Any]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return json.loads(json.dumps(self.response))
+
+
+class _Pacer:
+    """Spaces pipeline starts to at most rpm per minute (0 = unpaced)."""
+
+    def __init__(self, rpm: int):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass
+class BackfillStats:
+    total: int = 0
+    skipped: int = 0
+    completed: int = 0
+    failed: int = 0
+    transactions: int = 0
+    elapsed_seconds: float = 0.0
+    errors: Dict[str, int] = field(default_factory=dict)
+
+
+def _transaction_row(user_id: str, result: Dict[str, Any], source: BackfillSource) -> Optional[Dict[str, Any]]:
+    """Expense row for a trusted result (needs_review / zero amounts are left to the user)."""
+    amount = (result.get("amount") or {}).get("value") or 0
+    if amount <= 0 or (result.get("meta") or {}).get("needs_review"):
+        return None
+    items = ", ".join(item["name"] for item in result.get("items") or [])
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "amount": Decimal(amount),
+        "type": TransactionType.EXPENSE,
+        "category": (result.get("category") or {}).get("name"),
+        "note": (items or Path(source.name).name)[:255],
+        "occurred_at": normalize_to_naive_utc(datetime.strptime(result["transaction_date"], "%Y-%m-%d")),
+        "created_at": datetime.now(),
+    }
+
+
+async def run_backfill(
+    db: AsyncSession,
+    sources: Iterator[BackfillSource],
+    user_id: str,
+    session_id: str,
+    checkpoint: Optional[Checkpoint] = None,
+    client: Any = None,
+    hints: Optional[OcrExpenseHints] = None,
+    concurrency: int = 4,
+    max_rpm: int = 0,
+    chunk_size: int = 50,
+    create_transactions: bool = False,
+    retry_failed: bool = False,
+) -> BackfillStats:
+    """
+    Ingest sources through the OCR pipeline; rows are bulk-inserted and committed every chunk_size files.
+
+    At most `concurrency` files are in flight (and in memory); results come
+    back in completion order.
+    """
+    checkpoint = checkpoint or Checkpoint(None)
+    stats = BackfillStats()
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    pacer = _Pacer(max_rpm)
+
+    pending: List[BackfillSource] = []
+    for source in sources:
+        stats.total += 1
+        if checkpoint.skip(source.name, retry_failed):
+            stats.skipped += 1
+        else:
+            pending.append(source)
+    logger.info("[OCR] Backfill: %d files (%d already done)", stats.total, stats.skipped)
+
+    async def run_one(source: BackfillSource):
+        async with semaphore:
+            await pacer.wait()
+            t0 = time.perf_counter()
+            job_id = str(uuid.uuid4())
+            data = b""
+            try:
+                data = await asyncio.to_thread(source.read)
+                # No DB access from concurrent tasks; duplicates are checked when collecting
+                output = await ocr_expense_service.run_pipeline(
+                    data, source.content_type, hints, user_id=user_id, client=client
+                )
+                return source, job_id, len(data), output, None, time.perf_counter() - t0
+            except Exception as e:
+                message = e.message if isinstance(e, OcrExpenseException) else str(e)
+                logger.warning("[OCR] Backfill file %s failed: %s", source.name, message)
+                return source, job_id, len(data), None, e, time.perf_counter() - t0
+
+    job_rows: List[Dict[str, Any]] = []
+    result_rows: List[Dict[str, Any]] = []
+    transaction_rows: List[Dict[str, Any]] = []
+    entries: List[Dict[str, str]] = []
+    hashes: List[Tuple[str, str]] = []
+    seen = BKTree()
+
+    async def flush() -> None:
+        if not job_rows:
+            return
+        t0 = time.perf_counter()
+        await db.execute(insert(OcrExpenseJob), job_rows)
+        if result_rows:
+            await db.execute(insert(OcrExpenseResult), result_rows)
+        if transaction_rows:
+            await db.execute(insert(Transaction), transaction_rows)
+        await db.commit()
+        checkpoint.record(entries)
+        for job_id, phash in hashes:
+            duplicate_index.add(user_id, phash, job_id)
+        if result_rows:
+            await session_context_cache.invalidate(session_id)
+        logger.info(
+            "[OCR] Backfill committed %d jobs / %d results / %d transactions in %.3fs (%d/%d done)",
+            len(job_rows), len(result_rows), len(transaction_rows), time.perf_counter() - t0,
+            stats.completed + stats.failed, len(pending),
+        )
+        for rows in (job_rows, result_rows, transaction_rows, entries, hashes):
+            rows.clear()
+
+    tasks = [asyncio.create_task(run_one(source)) for source in pending]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            source, job_id, size, output, error, elapsed = await next_done
+            now = datetime.now()
+            saved = False
+            if output is not None:
+                result, phash = output.result, output.phash
+                if phash and duplicate_index.enabled:
+                    earlier = await duplicate_index.find(db, user_id, phash)
+                    if earlier is not None or seen.search(int(phash, 16), duplicate_index.threshold):
+                        flag_duplicate(result)
+                    seen.add(int(phash, 16), job_id)
+                    hashes.append((job_id, phash))
+                result_rows.append(ocr_expense_service.result_row(job_id, result, elapsed, output))
+                if create_transactions:
+                    transaction = _transaction_row(user_id, result, source)
+                    if transaction is not None:
+                        transaction_rows.append(transaction)
+                        stats.transactions += 1
+                        saved = True
+                stats.completed += 1
+            else:
+                stats.failed += 1
+                kind = type(error).__name__
+                stats.errors[kind] = stats.errors.get(kind, 0) + 1
+            job_rows.append({
+                "id": job_id,
+                "session_id": session_id,
+                "user_id": user_id,
+                "original_filename": Path(source.name).name[:255],
+                "file_path": source.location[:500],
+                "file_size": size,
+                "content_type": source.content_type,
+                "profile": "historical",
+                "hints": (hints.model_dump(exclude_none=True) if hints else None),
+                "status": "completed" if error is None else "failed",
+                "saved_to_transactions": saved,
+                "created_at": now,
+                "started_at": now,
+                "completed_at": now,
+                "error_message": str(error)[:1000] if error is not None else None,
+                "retry_count": 0,
+                "phash": output.phash if output is not None else None,
+            })
+            entries.append({"name": source.name, "job_id": job_id, "status": job_rows[-1]["status"]})
+            if len(job_rows) >= chunk_size:
+                await flush()
+        await flush()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    stats.elapsed_seconds = round(time.perf_counter() - started, 3)
+    return stats
+
+
+async def _run(args: argparse.Namespace) -> BackfillStats:
+    if args.preprocess_workers is not None:
+        preprocessor.workers = args.preprocess_workers
+    client = None
+    if args.stub is not None:
+        response = json.loads(Path(args.stub).read_text(encoding="utf-8")) if args.stub else None
+        client = StubExtractor(response, latency=args.stub_latency)
+    hints = OcrExpenseHints(**json.loads(args.hints)) if args.hints else None
+    try:
+        async with AsyncSessionLocal() as db:
+            return await run_backfill(
+                db,
+                iter_sources(Path(args.path)),
+                user_id=args.user_id,
+                session_id=args.session_id,
+                checkpoint=Checkpoint(Path(args.checkpoint) if args.checkpoint else None),
+                client=client,
+                hints=hints,
+                concurrency=args.concurrency,
+                max_rpm=args.max_rpm,
+                chunk_size=max(1, args.chunk_size),
+                create_transactions=args.transactions,
+                retry_failed=args.retry_failed,
+            )
+    finally:
+        preprocessor.shutdown()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest archived receipt scans (directory or zip)")
+    parser.add_argument("path", help="Directory (searched recursively) or .zip of JPEG/PNG/HEIC/PDF scans")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--session-id", required=True, help="Session the jobs are attached to")
+    parser.add_argument("--checkpoint", help="Checkpoint file; re-run with the same file to resume")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in an earlier run")
+    parser.add_argument("--transactions", action="store_true",
+                        help="Also create expense transactions (results without needs_review)")
+    parser.add_argument("--hints", help='Extraction hints as JSON, e.g. \'{"language": "vi"}\'')
+    parser.add_argument("--concurrency", type=int, default=settings.OCR_BATCH_CONCURRENCY,
+                        help="Files in flight")
+    parser.add_argument("--max-rpm", type=int, default=0,
+                        help="Files started per minute (0 = only the shared Gemini quota applies)")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Files per bulk insert / commit")
+    parser.add_argument("--preprocess-workers", type=int, help="Preprocessing processes (default OCR_PREPROCESS_WORKERS)")
+    parser.add_argument("--stub", nargs="?", const="", default=None,
+                        help="Use the local stub instead of Gemini (optional JSON response file)")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="Simulated stub latency (seconds)")
+    args = parser.parse_args()
+
+    configure_logging(level=settings.LOG_LEVEL)
+    stats = asyncio.run(_run(args))
+    print(json.dumps(stats.__dict__, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Content-hash cache for OCR results.
+
+Key: ocr:result:{sha256(upload bytes + prompt version + hints)} -> JSON
+{"result": {...}, "processing_time": <seconds of the original run>,
+"phash": <perceptual hash of the upload, for the near-duplicate check on a hit>}.
+Redis is the fast path; ocr_expense_jobs.content_hash is the durable fallback.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.redis.client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class OcrResultCache:
+    """Redis cache of validated OCR results keyed by content hash"""
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.enabled = settings.OCR_RESULT_CACHE_ENABLED
+        self.ttl = settings.OCR_RESULT_CACHE_TTL
+
+    def _get_key(self, content_hash: str) -> str:
+        return f"ocr:result:{content_hash}"
+
+    def content_hash(self, data: bytes, prompt_version: str, hints: Optional[Dict[str, Any]] = None) -> str:
+        """SHA-256 over the upload bytes, prompt version and the hints that affect extraction."""
+        # debug only changes response enrichment, not what Gemini extracts
+        relevant = {k: v for k, v in (hints or {}).items() if v is not None and k != "debug"}
+        digest = hashlib.sha256(data)
+        digest.update(b"\0" + prompt_version.encode("utf-8"))
+        digest.update(b"\0" + json.dumps(relevant, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    async def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return {"result", "processing_time", "phash"} or None; Redis errors count as a miss."""
+        if not self.enabled:
+            return None
+        try:
+            raw = await self.redis.get(self._get_key(content_hash))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning("[OCR] Result cache read failed: %s", e)
+            return None
+
+    async def set(
+        self,
+        content_hash: str,
+        result: Dict[str, Any],
+        processing_time: float,
+        phash: Optional[str] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        try:
+            payload = json.dumps(
+                {"result": result, "processing_time": processing_time, "phash": phash}, ensure_ascii=False
+            )
+            await self.redis.setex(self._get_key(content_hash), self.ttl, payload)
+        except Exception as e:
+            logger.warning("[OCR] Result cache write failed: %s", e)
+
+
+# Global cache instance
+ocr_result_cache = OcrResultCache()
@@ -0,0 +1,87 @@
+"""
+Per-session OCR context cache.
+
+Key: ocr:context:{session_id} -> JSON {"result": {...} | null, "prompt": "..." | null}
+The latest OCR result of a chat session and its pre-rendered system-prompt
+snippet. null marks a session without OCR (negative entry), so ordinary chat
+turns skip the join over ocr_expense_results / ocr_expense_jobs entirely.
+
+Completed extractions write through (sync, worker, batch); the backfill and
+reprocess CLIs invalidate the sessions they touch. Entries filled from the DB on a miss use SET NX so they never
+overwrite a newer write-through.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.redis.client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class SessionOcrContextCache:
+    """Redis cache of the latest OCR context per chat session"""
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.enabled = settings.OCR_CONTEXT_CACHE_ENABLED
+        self.ttl = settings.OCR_CONTEXT_CACHE_TTL
+
+    def _get_key(self, session_id: str) -> str:
+        return f"ocr:context:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Cached {"result", "prompt"} (both None: session has no OCR), or None on a miss / Redis error."""
+        if not self.enabled:
+            return None
+        try:
+            raw = await self.redis.get(self._get_key(session_id))
+            entry = json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning("[OCR] Context cache read failed: %s", e)
+            entry = None
+        self._record(entry)
+        return entry
+
+    async def set(
+        self,
+        session_id: str,
+        result: Optional[Dict[str, Any]],
+        prompt: Optional[str],
+        only_if_missing: bool = False,
+    ) -> None:
+        """Store the session's context; only_if_missing for fills from a DB read (never clobbers a write-through)."""
+        if not self.enabled:
+            return
+        try:
+            payload = json.dumps({"result": result, "prompt": prompt}, ensure_ascii=False, default=str)
+            await self.redis.set(self._get_key(session_id), payload, ex=self.ttl, nx=only_if_missing)
+        except Exception as e:
+            logger.warning("[OCR] Context cache write failed: %s", e)
+
+    async def invalidate(self, *session_ids: str) -> None:
+        if not self.enabled or not session_ids:
+            return
+        try:
+            await self.redis.delete(*(self._get_key(session_id) for session_id in session_ids))
+        except Exception as e:
+            logger.warning("[OCR] Context cache invalidation failed: %s", e)
+
+    def _record(self, entry: Optional[Dict[str, Any]]) -> None:
+        if entry is None:
+            metrics.incr("ocr.context_cache.miss")
+        else:
+            metrics.incr("ocr.context_cache.hit")
+            if entry.get("result") is None:
+                metrics.incr("ocr.context_cache.hit.empty")
+        hits = metrics.get_counter("ocr.context_cache.hit")
+        metrics.set_gauge("ocr.context_cache.hit_rate", hits / (hits + metrics.get_counter("ocr.context_cache.miss")))
+
+
+# Global session context cache instance
+session_context_cache = SessionOcrContextCache()
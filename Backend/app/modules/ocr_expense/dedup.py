@@ -0,0 +1,114 @@
+"""
+Near-duplicate receipt detection.
+
+Each user's perceptual hashes (ocr_expense_jobs.phash) are loaded into an
+in-process BK-tree on first lookup and reloaded after
+OCR_DUPLICATE_INDEX_REFRESH_SECONDS, so hashes written by other API/worker
+processes are picked up. Hashes committed by this process are added
+immediately.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.modules.ocr_expense.models import OcrExpenseJob
+from app.modules.ocr_expense.phash import BKTree
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_WARNING = "possible_duplicate"
+
+
+@dataclass
+class DuplicateMatch:
+    job_id: str
+    distance: int
+
+
+class DuplicateIndex:
+    """Per-user BK-trees of receipt hashes, bounded to the most recently used users."""
+
+    def __init__(self, max_users: int = 1024):
+        self.policy = settings.OCR_DUPLICATE_POLICY
+        self.threshold = settings.OCR_DUPLICATE_HAMMING_THRESHOLD
+        self.refresh_seconds = settings.OCR_DUPLICATE_INDEX_REFRESH_SECONDS
+        self.max_users = max_users
+        self._trees: "OrderedDict[str, tuple[float, BKTree]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy in ("warn", "reuse")
+
+    async def find(self, db: AsyncSession, user_id: str, phash: Optional[str]) -> Optional[DuplicateMatch]:
+        """Closest earlier receipt of this user within the Hamming threshold, if any."""
+        if not self.enabled or not phash:
+            return None
+        t0 = time.perf_counter()
+        try:
+            tree = await self._get_tree(db, user_id)
+        except Exception as e:
+            logger.warning("[OCR] Duplicate index load failed for user=%s: %s", user_id, e)
+            return None
+        matches = tree.search(int(phash, 16), self.threshold)
+        metrics.observe("ocr.dedup.lookup", time.perf_counter() - t0)
+        if not matches:
+            return None
+        distance, job_id = matches[0]
+        metrics.incr("ocr.dedup.matches")
+        logger.info("[OCR] Possible duplicate of job=%s (distance=%d) for user=%s", job_id, distance, user_id)
+        return DuplicateMatch(job_id=job_id, distance=distance)
+
+    def add(self, user_id: str, phash: Optional[str], job_id: str) -> None:
+        """Record a committed job's hash (only if the user's tree is loaded; otherwise the next load sees it)."""
+        if not phash:
+            return
+        entry = self._trees.get(user_id)
+        if entry is not None:
+            entry[1].add(int(phash, 16), job_id)
+
+    async def _get_tree(self, db: AsyncSession, user_id: str) -> BKTree:
+        entry = self._trees.get(user_id)
+        now = time.monotonic()
+        if entry is not None and now - entry[0] < self.refresh_seconds:
+            self._trees.move_to_end(user_id)
+            return entry[1]
+
+        result = await db.execute(
+            select(OcrExpenseJob.id, OcrExpenseJob.phash).where(
+                OcrExpenseJob.user_id == user_id,
+                OcrExpenseJob.phash.isnot(None),
+                OcrExpenseJob.status == "completed",
+            )
+        )
+        tree = BKTree()
+        for job_id, phash in result.all():
+            tree.add(int(phash, 16), job_id)
+
+        self._trees[user_id] = (now, tree)
+        self._trees.move_to_end(user_id)
+        while len(self._trees) > self.max_users:
+            self._trees.popitem(last=False)
+        return tree
+
+
+def flag_duplicate(result_data: dict) -> dict:
+    """Prepend the possible_duplicate warning (keeping the 3-warning cap) and request review."""
+    meta = result_data.setdefault("meta", {})
+    warnings = [w for w in (meta.get("warnings") or []) if w != DUPLICATE_WARNING]
+    meta["warnings"] = [DUPLICATE_WARNING] + warnings[:2]
+    meta["needs_review"] = True
+    return result_data
+
+
+# Global duplicate index
+duplicate_index = DuplicateIndex()
@@ -30,6 +30,17 @@ class SchemaViolationError(OcrExpenseException):
         super().__init__(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, code="SCHEMA_VIOLATION", message=message, detail=detail)
 
 
+class LowImageQualityError(OcrExpenseException):
+    def __init__(self, message: str, detail: any = None):
+        super().__init__(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, code="IMAGE_QUALITY_LOW", message=message, detail=detail)
+
+
+class ServiceBusyError(OcrExpenseException):
+    def __init__(self, message: str, retry_after: int = 1, detail: any = None):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, code="OCR_BUSY", message=message, detail=detail)
+        self.headers = {"Retry-After": str(retry_after)}
+
+
 class InternalError(OcrExpenseException):
     def __init__(self, message: str, detail: any = None):
         super().__init__(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, code="INTERNAL_ERROR", message=message, detail=detail)
@@ -39,6 +50,7 @@ async def ocr_expense_exception_handler(request: Request, exc: OcrExpenseExcepti
     return JSONResponse(
         status_code=exc.status_code,
         content=exc.detail,
+        headers=getattr(exc, "headers", None),
     )
 
 
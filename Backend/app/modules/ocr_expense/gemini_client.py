@@ -1,20 +1,162 @@
 """
 Simplified Gemini OCR Client - Refactored for JSON mode only.
 Removes financial mode and JSON repair methods.
+
+The static parts of a request (system prompt, response schema, generation
+config) are built once per process into an immutable GeminiRequestTemplate,
+rebuilt only when prompts/system.txt changes (mtime). Hint/page/tile prompt
+variants are memoized per template. With GEMINI_CONTEXT_CACHE_ENABLED the
+system prompt is stored once on Gemini (context caching) and requests only
+carry the variant text and the images.
+
+Every call first takes quota from the shared Gemini rate limiter (see
+ratelimit.py); 429/503 answers are retried with full-jitter exponential
+backoff until GEMINI_QUEUE_DEADLINE_SECONDS, then GeminiBusyError.
 """
 
+import asyncio
+import hashlib
 import logging
 import json
+import random
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.modules.ocr_expense.ratelimit import GeminiBusyError, estimate_tokens, gemini_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+PROMPT_FILE = Path(__file__).parent / "prompts" / "system.txt"
+
+FALLBACK_PROMPT = """You are an invoice extractor. Return EXACTLY ONE JSON object matching this schema:
+
+{
+  "transaction_date": "YYYY-MM-DD",
+  "amount": { "value": <int>, "currency": "VND" },
+  "category": { "code": "FNB|GRO|TRA|UTI|ENT|OTH", "name": "<vi>" },
+  "items": [ { "name": "<string>", "qty": <int> } ],
+  "meta": { "needs_review": <bool>, "warnings": [] }
+}
+
+Extract invoice data and return only the JSON object."""
+
+# Memoized prompt variants per template (hint values are user input, so keep it bounded)
+_MAX_PROMPT_VARIANTS = 256
+# After a failed context-cache creation (e.g. prompt below the model's minimum), retry after this long
+_CONTEXT_CACHE_RETRY_SECONDS = 600
+# Recreate a context cache this long before it expires
+_CONTEXT_CACHE_RENEW_SECONDS = 60
+# Gemini answers that mean "quota/capacity, try again later"
+_RETRYABLE_STATUS = (429, 503)
+
+
+def _build_response_schema() -> types.Schema:
+    """Response schema for structured JSON output (Gemini Structured Output)."""
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "transaction_date": types.Schema(
+                type=types.Type.STRING,
+                description="Transaction date in YYYY-MM-DD format"
+            ),
+            "amount": types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "value": types.Schema(
+                        type=types.Type.INTEGER,
+                        description="Amount value as integer"
+                    ),
+                    "currency": types.Schema(
+                        type=types.Type.STRING,
+                        description="Currency code, always 'VND'"
+                    )
+                },
+                required=["value", "currency"],
+                description="Amount information with value and currency"
+            ),
+            "category": types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "code": types.Schema(
+                        type=types.Type.STRING,
+                        description="Category code: FNB, GRO, TRA, UTI, ENT, or OTH"
+                    ),
+                    "name": types.Schema(
+                        type=types.Type.STRING,
+                        description="Category name in Vietnamese"
+                    )
+                },
+                required=["code", "name"],
+                description="Transaction category information"
+            ),
+            "items": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "name": types.Schema(
+                            type=types.Type.STRING,
+                            description="Item name"
+                        ),
+                        "qty": types.Schema(
+                            type=types.Type.INTEGER,
+                            description="Item quantity"
+                        )
+                    },
+                    required=["name", "qty"],
+                    description="Individual item information"
+                ),
+                description="List of items in the transaction"
+            ),
+            "meta": types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "needs_review": types.Schema(
+                        type=types.Type.BOOLEAN,
+                        description="Whether this transaction needs manual review"
+                    ),
+                    "warnings": types.Schema(
+                        type=types.Type.ARRAY,
+                        items=types.Schema(type=types.Type.STRING),
+                        description="List of warning messages"
+                    )
+                },
+                required=["needs_review", "warnings"],
+                description="Metadata about transaction processing"
+            )
+        },
+        required=["transaction_date", "amount", "category", "items", "meta"]
+    )
+
+
+RESPONSE_SCHEMA = _build_response_schema()
+
+
+@dataclass(frozen=True)
+class GeminiRequestTemplate:
+    """Request parts that only change with the prompt file (never mutated; rebuilt instead)."""
+    system_prompt: str
+    prompt_mtime: Optional[float]
+    # Identifies prompt + model; part of the OCR result cache key
+    prompt_version: str
+    config: types.GenerateContentConfig
+    # (language, timezone, items_expected, page_count, tile) -> prompt suffix
+    variants: Dict[tuple, str] = field(default_factory=dict, compare=False)
+
+
+@dataclass
+class _ContextCacheEntry:
+    name: Optional[str]  # None: creation failed, retry after expires_at
+    prompt_version: str
+    expires_at: float
+
 
 class GeminiOcrClient:
     """Simplified Gemini OCR client for expense extraction."""
@@ -23,6 +165,23 @@ class GeminiOcrClient:
         self.model_name = settings.GEMINI_MODEL_NAME
         self.api_key = settings.GEMINI_API_KEY
         self.base_url = getattr(settings, "GEMINI_API_BASE_URL", None)
+        self.max_concurrency = max(1, settings.GEMINI_MAX_CONCURRENCY)
+        self.timeout_seconds = settings.GEMINI_TIMEOUT_SECONDS
+        self.context_cache_enabled = settings.GEMINI_CONTEXT_CACHE_ENABLED
+        self.context_cache_ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+        self.queue_deadline_seconds = settings.GEMINI_QUEUE_DEADLINE_SECONDS
+        self.retry_max_attempts = max(1, settings.GEMINI_RETRY_MAX_ATTEMPTS)
+        self.retry_base_delay = settings.GEMINI_RETRY_BASE_DELAY
+        self.rate_limiter = gemini_rate_limiter
+        # Semaphore and cache lock are bound lazily to the running loop (see _get_semaphore)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cache_lock: Optional[asyncio.Lock] = None
+        self._cache_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._template: Optional[GeminiRequestTemplate] = None
+        self._context_caches: Dict[str, _ContextCacheEntry] = {}
+        # Configs with cached_content set, one per cache handle
+        self._cached_configs: Dict[str, types.GenerateContentConfig] = {}
 
         if not self.api_key:
             logger.error("GEMINI_API_KEY is not set. Please configure it in .env")
@@ -39,11 +198,124 @@ class GeminiOcrClient:
         except Exception as e:
             logger.error(f"Failed to initialize Gemini client: {e}")
             raise
+
+    @property
+    def prompt_version(self) -> str:
+        """Short hash of the prompt file and model name (changes invalidate cached results)."""
+        return self.get_template().prompt_version
+
+    def get_template(self) -> GeminiRequestTemplate:
+        """Current request template; rebuilt when prompts/system.txt changes on disk."""
+        try:
+            mtime = PROMPT_FILE.stat().st_mtime
+        except OSError:
+            mtime = None
+        template = self._template
+        if template is None or template.prompt_mtime != mtime:
+            template = self._template = self._build_template(mtime)
+        return template
+
+    def _build_template(self, mtime: Optional[float]) -> GeminiRequestTemplate:
+        try:
+            prompt = PROMPT_FILE.read_text(encoding="utf-8")
+            logger.info("[OCR] Loaded prompt from file: %s (len=%d)", PROMPT_FILE, len(prompt))
+        except Exception as e:
+            logger.error("[OCR] Failed to load prompt file, using fallback: %s", e)
+            prompt, mtime = FALLBACK_PROMPT, None
+        prompt_bytes = prompt.encode("utf-8") if mtime is not None else b"fallback"
+        digest = hashlib.sha256(prompt_bytes + b"\0" + self.model_name.encode("utf-8"))
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=RESPONSE_SCHEMA,
+            temperature=getattr(settings, "GEMINI_TEMPERATURE", 0.2),
+            top_p=0.85,
+            top_k=20,
+            max_output_tokens=max(1024, settings.GEMINI_MAX_TOKENS),
+        )
+        self._cached_configs.clear()
+        return GeminiRequestTemplate(
+            system_prompt=prompt,
+            prompt_mtime=mtime,
+            prompt_version=digest.hexdigest()[:12],
+            config=config,
+        )
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Return the concurrency semaphore for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def _get_cache_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._cache_lock is None or self._cache_lock_loop is not loop:
+            self._cache_lock = asyncio.Lock()
+            self._cache_lock_loop = loop
+        return self._cache_lock
+
+    async def _get_context_cache(self, model_name: str, template: GeminiRequestTemplate) -> Optional[str]:
+        """Name of a live context cache holding the system prompt for model_name (None: send inline)."""
+        if not self.context_cache_enabled:
+            return None
+        entry = self._context_caches.get(model_name)
+        now = time.monotonic()
+        if entry is not None and entry.prompt_version == template.prompt_version:
+            if entry.name is None and now < entry.expires_at:
+                return None
+            if entry.name is not None and now < entry.expires_at - _CONTEXT_CACHE_RENEW_SECONDS:
+                return entry.name
+
+        async with self._get_cache_lock():
+            # Re-check after the wait: a caller ahead in the lock may have created the cache or just failed to
+            entry = self._context_caches.get(model_name)
+            now = time.monotonic()
+            if entry is not None and entry.prompt_version == template.prompt_version:
+                if entry.name is None and now < entry.expires_at:
+                    return None
+                if entry.name is not None and now < entry.expires_at - _CONTEXT_CACHE_RENEW_SECONDS:
+                    return entry.name
+            try:
+                cached = await asyncio.wait_for(
+                    self.client.aio.caches.create(
+                        model=model_name,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=template.system_prompt,
+                            display_name=f"ocr-expense-{template.prompt_version}",
+                            ttl=f"{self.context_cache_ttl}s",
+                        ),
+                    ),
+                    timeout=self.timeout_seconds,
+                )
+            except Exception as e:
+                logger.warning("[OCR] Gemini context cache unavailable for model=%s, sending prompt inline: %s", model_name, e)
+                metrics.incr("ocr.gemini.context_cache.errors")
+                self._context_caches[model_name] = _ContextCacheEntry(
+                    None, template.prompt_version, now + _CONTEXT_CACHE_RETRY_SECONDS
+                )
+                return None
+            metrics.incr("ocr.gemini.context_cache.created")
+            logger.info("[OCR] Created Gemini context cache %s for model=%s", cached.name, model_name)
+            self._context_caches[model_name] = _ContextCacheEntry(
+                cached.name, template.prompt_version, now + self.context_cache_ttl
+            )
+            return cached.name
+
+    def _config_for_cache(self, template: GeminiRequestTemplate, cache_name: str) -> types.GenerateContentConfig:
+        config = self._cached_configs.get(cache_name)
+        if config is None:
+            config = self._cached_configs[cache_name] = template.config.model_copy(update={"cached_content": cache_name})
+        return config
     
     async def extract_expense_data(
         self, 
         image_bytes: bytes, 
-        hints: Optional[Dict] = None
+        hints: Optional[Dict] = None,
+        extra_pages: Optional[List[bytes]] = None,
+        tile: Optional[Tuple[int, int, str]] = None,
+        model: Optional[str] = None,
+        user_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Extract expense data from image using Gemini Vision API.
@@ -51,120 +323,48 @@ class GeminiOcrClient:
         Args:
             image_bytes: Image data as bytes
             hints: Optional hints for extraction
+            extra_pages: Following pages of a multi-page document (sent as
+                additional image parts in the same request)
+            tile: (index, count, axis) when image_bytes is one tile of a long receipt;
+                axis is the tile order, vertical (top-to-bottom) or horizontal (left-to-right)
+            model: Model override (defaults to GEMINI_MODEL_NAME)
+            user_id: Requesting user, for fair queueing on the rate limiter
             
         Returns:
             Dictionary containing extracted expense data
         """
-        import time as _time
-        
-        _t0 = _time.perf_counter()
+        _t0 = time.perf_counter()
+        model_name = model or self.model_name
         
         try:
-            # Build prompt with hints
-            prompt = self._build_expense_prompt(hints)
+            template = self.get_template()
+            page_count = 1 + len(extra_pages or [])
+            suffix = self._prompt_suffix(template, hints, page_count, tile)
             
-            # Create image part (google.genai types)
-            image = types.Part.from_bytes(
-                data=image_bytes,
-                mime_type="image/jpeg",
-            )
-            
-            # Define response schema for structured JSON output (Gemini Structured Output)
-            # This guarantees LLM returns valid JSON with required fields
-            response_schema = types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "transaction_date": types.Schema(
-                        type=types.Type.STRING,
-                        description="Transaction date in YYYY-MM-DD format"
-                    ),
-                    "amount": types.Schema(
-                        type=types.Type.OBJECT,
-                        properties={
-                            "value": types.Schema(
-                                type=types.Type.INTEGER,
-                                description="Amount value as integer"
-                            ),
-                            "currency": types.Schema(
-                                type=types.Type.STRING,
-                                description="Currency code, always 'VND'"
-                            )
-                        },
-                        required=["value", "currency"],
-                        description="Amount information with value and currency"
-                    ),
-                    "category": types.Schema(
-                        type=types.Type.OBJECT,
-                        properties={
-                            "code": types.Schema(
-                                type=types.Type.STRING,
-                                description="Category code: FNB, GRO, TRA, UTI, ENT, or OTH"
-                            ),
-                            "name": types.Schema(
-                                type=types.Type.STRING,
-                                description="Category name in Vietnamese"
-                            )
-                        },
-                        required=["code", "name"],
-                        description="Transaction category information"
-                    ),
-                    "items": types.Schema(
-                        type=types.Type.ARRAY,
-                        items=types.Schema(
-                            type=types.Type.OBJECT,
-                            properties={
-                                "name": types.Schema(
-                                    type=types.Type.STRING,
-                                    description="Item name"
-                                ),
-                                "qty": types.Schema(
-                                    type=types.Type.INTEGER,
-                                    description="Item quantity"
-                                )
-                            },
-                            required=["name", "qty"],
-                            description="Individual item information"
-                        ),
-                        description="List of items in the transaction"
-                    ),
-                    "meta": types.Schema(
-                        type=types.Type.OBJECT,
-                        properties={
-                            "needs_review": types.Schema(
-                                type=types.Type.BOOLEAN,
-                                description="Whether this transaction needs manual review"
-                            ),
-                            "warnings": types.Schema(
-                                type=types.Type.ARRAY,
-                                items=types.Schema(type=types.Type.STRING),
-                                description="List of warning messages"
-                            )
-                        },
-                        required=["needs_review", "warnings"],
-                        description="Metadata about transaction processing"
-                    )
-                },
-                required=["transaction_date", "amount", "category", "items", "meta"]
-            )
+            # Create image parts (google.genai types), one per page in order
+            images = [
+                types.Part.from_bytes(data=page_bytes, mime_type="image/jpeg")
+                for page_bytes in [image_bytes, *(extra_pages or [])]
+            ]
 
             # JSON mode with structured output enforcement
             if not self.client:
                 raise RuntimeError("Gemini client is not initialized")
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[prompt, image],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    response_schema=response_schema,
-                    temperature=getattr(settings, "GEMINI_TEMPERATURE", 0.2),
-                    top_p=0.85,
-                    top_k=20,
-                    max_output_tokens=max(1024, settings.GEMINI_MAX_TOKENS),
-                ),
-            )
-            logger.info("[OCR] Using Gemini response schema enforcement ✅")
+            cache_name = await self._get_context_cache(model_name, template)
+            if cache_name is not None:
+                # System prompt lives in the context cache; only the variant text travels
+                contents = ([suffix.strip()] if suffix else []) + images
+                config = self._config_for_cache(template, cache_name)
+            else:
+                contents = [template.system_prompt + suffix, *images]
+                config = template.config
+            tokens = estimate_tokens(template.system_prompt + suffix, [image_bytes, *(extra_pages or [])])
+            response, _t_acquired = await self._generate_with_retry(model_name, contents, config, tokens, user_id)
             
-            logger.info("[OCR] Gemini generate_content finished in %.3fs (mode=json, model=%s)", _time.perf_counter() - _t0, self.model_name)
+            logger.info(
+                "[OCR] Gemini generate_content finished in %.3fs (queued=%.3fs, mode=json, model=%s, pages=%d, context_cache=%s)",
+                time.perf_counter() - _t0, _t_acquired - _t0, model_name, page_count, cache_name is not None,
+            )
             
             # Parse response
             result_text = (getattr(response, "text", None) or "").strip()
@@ -202,49 +402,112 @@ class GeminiOcrClient:
                 logger.error(f"[OCR] Unexpected error parsing response: {e}")
                 raise ValueError(f"Failed to parse response: {e}")
             
+        except GeminiBusyError:
+            raise
+        except asyncio.TimeoutError:
+            logger.error("Gemini OCR extraction timed out after %.1fs", self.timeout_seconds)
+            raise RuntimeError(f"OCR extraction failed: Gemini call timed out after {self.timeout_seconds}s")
         except Exception as e:
             logger.error(f"Gemini OCR extraction failed: {e}")
             raise RuntimeError(f"OCR extraction failed: {e}")
     
-    def _build_expense_prompt(self, hints: Optional[Dict] = None) -> str:
-        """Build the expense extraction prompt by loading from file."""
-        
-        # Load prompt from file
-        prompt_file = Path(__file__).parent / "prompts" / "system.txt"
-        
-        try:
-            prompt = prompt_file.read_text(encoding="utf-8")
-            logger.info("[OCR] Loaded prompt from file: %s", prompt_file)
-        except Exception as e:
-            logger.error("[OCR] Failed to load prompt file, using fallback: %s", e)
-            # Fallback prompt
-            prompt = """You are an invoice extractor. Return EXACTLY ONE JSON object matching this schema:
+    async def _generate_with_retry(
+        self,
+        model_name: str,
+        contents: List[Any],
+        config: types.GenerateContentConfig,
+        tokens: int,
+        user_id: Optional[str],
+    ) -> Tuple[Any, float]:
+        """generate_content under the rate limiter; returns (response, time the slot was acquired)."""
+        deadline = time.monotonic() + self.queue_deadline_seconds
+        for attempt in range(self.retry_max_attempts):
+            await self.rate_limiter.acquire(model_name, tokens, user_id, deadline)
+            try:
+                # Use the async surface so the event loop keeps serving other requests
+                # while Gemini works; the semaphore caps in-flight calls per process.
+                async with self._get_semaphore():
+                    acquired = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(
+                            model=model_name,
+                            contents=contents,
+                            config=config,
+                        ),
+                        timeout=self.timeout_seconds,
+                    )
+                return response, acquired
+            except errors.APIError as e:
+                if e.code not in _RETRYABLE_STATUS:
+                    raise
+                metrics.incr(f"ocr.gemini.status.{e.code}")
+                # Full jitter: uniform over [0, base * 2^attempt] spreads retries from all workers
+                delay = random.uniform(0, self.retry_base_delay * 2 ** attempt)
+                if attempt + 1 >= self.retry_max_attempts or time.monotonic() + delay > deadline:
+                    raise GeminiBusyError(
+                        f"Gemini returned {e.code} after {attempt + 1} attempt(s)",
+                        retry_after=max(1.0, self.retry_base_delay * 2 ** (attempt + 1)),
+                    ) from e
+                logger.warning("[OCR] Gemini returned %s, retrying in %.2fs (attempt %d)", e.code, delay, attempt + 1)
+                metrics.incr("ocr.gemini.retries")
+                await asyncio.sleep(delay)
+        raise GeminiBusyError("Gemini retries exhausted")  # unreachable: the last attempt returns or raises
 
-{
-  "transaction_date": "YYYY-MM-DD",
-  "amount": { "value": <int>, "currency": "VND" },
-  "category": { "code": "FNB|GRO|TRA|UTI|ENT|OTH", "name": "<vi>" },
-  "items": [ { "name": "<string>", "qty": <int> } ],
-  "meta": { "needs_review": <bool>, "warnings": [] }
-}
+    def _build_expense_prompt(
+        self,
+        hints: Optional[Dict] = None,
+        page_count: int = 1,
+        tile: Optional[Tuple[int, int, str]] = None,
+    ) -> str:
+        """Full expense extraction prompt: system prompt plus the hint/page/tile variant."""
+        template = self.get_template()
+        return template.system_prompt + self._prompt_suffix(template, hints, page_count, tile)
 
-Extract invoice data and return only the JSON object."""
+    def _prompt_suffix(
+        self,
+        template: GeminiRequestTemplate,
+        hints: Optional[Dict] = None,
+        page_count: int = 1,
+        tile: Optional[Tuple[int, int, str]] = None,
+    ) -> str:
+        """Hint/page/tile text appended to the system prompt (memoized per template)."""
+        hints = hints or {}
+        key = (hints.get("language"), hints.get("timezone"), bool(hints.get("items_expected")), page_count, tile)
+        suffix = template.variants.get(key)
+        if suffix is not None:
+            return suffix
 
-        # Add hints if provided
-        if hints:
-            hint_lines = []
-            if hints.get("language"):
-                hint_lines.append(f"- Ngôn ngữ: {hints['language']}")
-            if hints.get("timezone"):
-                hint_lines.append(f"- Múi giờ: {hints['timezone']}")
-            if hints.get("items_expected"):
-                hint_lines.append("- Khuyến khích trích xuất items nếu có thể")
-            
-            if hint_lines:
-                prompt = f"{prompt}\n\nGợi ý:\n" + "\n".join(hint_lines)
+        suffix = ""
+        hint_lines = []
+        if hints.get("language"):
+            hint_lines.append(f"- Ngôn ngữ: {hints['language']}")
+        if hints.get("timezone"):
+            hint_lines.append(f"- Múi giờ: {hints['timezone']}")
+        if hints.get("items_expected"):
+            hint_lines.append("- Khuyến khích trích xuất items nếu có thể")
+        if hint_lines:
+            suffix += "\n\nGợi ý:\n" + "\n".join(hint_lines)
 
-        logger.info("[OCR] OCR prompt prepared (len=%d). Preview: %s", len(prompt), prompt[:120].replace("\n", " "))
-        return prompt
+        if page_count > 1:
+            suffix += (
+                f"\n\nHoá đơn gồm {page_count} trang, ảnh được gửi theo thứ tự trang. "
+                "Gộp items của tất cả các trang và lấy tổng tiền cuối cùng của hoá đơn."
+            )
+
+        if tile is not None:
+            index, count, axis = tile
+            order = "từ trái sang phải" if axis == "horizontal" else "từ trên xuống"
+            suffix += (
+                f"\n\nẢnh là phần {index + 1}/{count} ({order}) của một hoá đơn dài, "
+                "các phần liền kề chồng lên nhau một đoạn. Chỉ trích xuất items nhìn thấy trong phần này. "
+                "Nếu phần này không có dòng tổng tiền thì đặt amount.value=0."
+            )
+
+        if len(template.variants) >= _MAX_PROMPT_VARIANTS:
+            template.variants.clear()
+        template.variants[key] = suffix
+        logger.debug("[OCR] Prompt variant prepared %s (len=%d)", key, len(template.system_prompt) + len(suffix))
+        return suffix
 
     async def test_connection(self) -> bool:
         """Test Gemini API connection."""
@@ -253,12 +516,16 @@ Extract invoice data and return only the JSON object."""
         
         try:
             # Simple test with minimal content
-            response = self.client.generate_content(
-                contents=["Test connection"],
-                generation_config=types.GenerationConfig(
-                    max_output_tokens=10,
-                    temperature=0.0
-                )
+            response = await asyncio.wait_for(
+                self.client.aio.models.generate_content(
+                    model=self.model_name,
+                    contents=["Test connection"],
+                    config=types.GenerateContentConfig(
+                        max_output_tokens=10,
+                        temperature=0.0
+                    )
+                ),
+                timeout=self.timeout_seconds,
             )
             return response.text is not None
         except Exception as e:
@@ -4,7 +4,7 @@ from datetime import datetime
 from typing import Optional
 import uuid
 
-from sqlalchemy import ForeignKey, JSON, String, Text, Boolean, Integer, Float
+from sqlalchemy import ForeignKey, JSON, String, Text, Boolean, Integer, Float, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -28,6 +28,10 @@ class OcrExpenseJob:
     # Processing configuration
     profile: Mapped[str] = mapped_column(String(50), default="generic")  # generic, financial, historical
     hints: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # language, timezone, items_expected
+    # sha256(upload bytes + prompt version + hints); lookup key for the OCR result cache
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    # 64-bit dHash (hex) of the upright image; near-duplicate detection per user
+    phash: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
     
     # Job status
     status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, processing, completed, failed
@@ -71,6 +75,11 @@ class OcrExpenseResult:
     processing_time: Mapped[float] = mapped_column(Float, nullable=False)  # seconds
     word_count: Mapped[int] = mapped_column(Integer, nullable=False)
     
+    # Raw Gemini JSON (zlib, see archive.py) and the prompt version that produced it; input for reprocessing.
+    # Deferred: regular result reads never load the blob
+    raw_response: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True, deferred=True)
+    prompt_version: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    
     # Timestamps
     created_at: Mapped[datetime] = mapped_column(default=func.now(), nullable=False)
     
@@ -0,0 +1,76 @@
+"""
+Perceptual hashing for near-duplicate receipt detection.
+
+dhash() is a 64-bit difference hash computed with NumPy on a 9x8 grayscale
+thumbnail; two photos of the same paper receipt land within a few bits of
+each other. BKTree indexes hashes by Hamming distance so a lookup only
+visits a small part of a user's history.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8  # 8x8 gradient bits = 64-bit hash, 16 hex chars
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> str:
+    """Difference hash: sign of horizontal gradients on a (hash_size+1) x hash_size thumbnail."""
+    thumb = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits).tobytes().hex()
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over integer hashes with Hamming distance."""
+
+    def __init__(self):
+        # node = (hash, values, {distance: child})
+        self._root: Optional[Tuple[int, List[Any], Dict[int, tuple]]] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_value: int, value: Any) -> None:
+        self._size += 1
+        if self._root is None:
+            self._root = (hash_value, [value], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (hash_value, [value], {})
+                return
+            node = child
+
+    def search(self, hash_value: int, radius: int) -> List[Tuple[int, Any]]:
+        """All (distance, value) pairs within radius, closest first."""
+        matches: List[Tuple[int, Any]] = []
+        if self._root is None:
+            return matches
+        stack = [self._root]
+        while stack:
+            node_hash, values, children = stack.pop()
+            distance = hamming(hash_value, node_hash)
+            if distance <= radius:
+                matches.extend((distance, value) for value in values)
+            # Triangle inequality: only subtrees with |d - distance| <= radius can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
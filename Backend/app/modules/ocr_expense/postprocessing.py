@@ -1,259 +1,172 @@
 """
 Post-processing rules for OCR expense extraction.
 Implements date defaulting, cash/change guard, amount normalization, and items cleanup.
+
+The rules are registered per schema path on the compiled result schema
+(validation.CompiledSchema), so normalizing and validating a result is a
+single traversal. Rules that flag a problem record it on the run context;
+the meta rule runs last (meta is the last property in the schema) and
+merges those warnings.
 """
 
 import re
 import logging
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 import pytz
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.modules.ocr_expense.validation import MISSING, CompiledSchema, is_valid_date, schema_validator
 
 logger = logging.getLogger(__name__)
 
+_AMOUNT_NOISE = re.compile(r'[.,₫đ\s]')
+# Totals above this (VND) are flagged for review
+_HIGH_AMOUNT = 10_000_000
+_MAX_WARNINGS = 3
+
+
+@dataclass
+class _RuleContext:
+    timezone: Any
+    # YYYY-MM-DD used when the receipt date is missing (default: today in timezone)
+    extraction_date: Optional[str] = None
+    warnings: List[str] = field(default_factory=list)
+    needs_review: bool = False
+
+    def flag(self, warning: str) -> None:
+        self.warnings.append(warning)
+        self.needs_review = True
+
 
 class OcrPostProcessor:
     """Post-processes OCR results according to spec rules."""
-    
+
     def __init__(self):
         self.default_timezone = pytz.timezone(settings.OCR_DEFAULT_TIMEZONE)
-    
+        self.pipeline = CompiledSchema(schema_validator.schema, rules={
+            "transaction_date": self._default_date,
+            "amount.value": self._normalize_amount_value,
+            "amount.currency": lambda value, ctx: "VND",
+            "items": lambda value, ctx: value if isinstance(value, list) else [],
+            "items[]": self._cleanup_item,
+            "meta": self._finalize_meta,
+        })
+
     def post_process(self, llm_result: Dict[str, Any], hints: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Apply post-processing rules to LLM result.
-        
+
         Args:
             llm_result: Raw result from Gemini API
-            hints: Optional hints (timezone, etc.)
-            
+            hints: Optional hints (timezone; extraction_date when reprocessing a stored response)
+
         Returns:
             Post-processed result
         """
+        result, errors = self.process(llm_result, hints)
+        if errors:
+            metrics.incr("ocr.schema.violations")
+            logger.warning("[OCR] Result violates the schema after post-processing: %s", errors)
+        return result
+
+    def apply_rules(self, llm_result: Dict[str, Any], context: Optional[Dict] = None) -> Dict[str, Any]:
+        """Same as post_process; context carries the timezone."""
+        return self.post_process(llm_result, context)
+
+    def process(self, llm_result: Dict[str, Any], hints: Optional[Dict] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """Normalize and validate in one pass; returns (result, schema errors)."""
+        if not self._validate_basic_schema(llm_result):
+            raise ValueError("Post-processing failed: Invalid basic schema: missing required fields")
         try:
-            result = llm_result.copy()
-            
-            # 1. Validate schema (basic check)
-            if not self._validate_basic_schema(result):
-                raise ValueError("Invalid basic schema: missing required fields")
-            
-            # 2. Normalize amount
-            result = self._normalize_amount(result)
-            
-            # 3. Date strategy = extraction_date
-            result = self._handle_date_defaulting(result, hints)
-            
-            # 4. Cash/Change guard (autocorrect)
-            result = self._apply_cash_change_guard(result)
-            
-            # 5. Items cleanup
-            result = self._cleanup_items(result)
-            
-            # 6. Meta finalize
-            result = self._finalize_meta(result)
-            
-            return result
-            
+            hints = hints or {}
+            context = _RuleContext(timezone=hints.get("timezone"), extraction_date=hints.get("extraction_date"))
+            return self.pipeline.run(llm_result, context)
         except Exception as e:
             logger.error(f"Post-processing failed: {e}")
             raise ValueError(f"Post-processing failed: {e}")
-    
+
     def _validate_basic_schema(self, result: Dict[str, Any]) -> bool:
         """Basic schema validation - check required fields."""
-        required_fields = ["amount", "category"]
-        
-        for field in required_fields:
-            if field not in result:
-                return False
-        
-        # Check amount structure
-        if not isinstance(result["amount"], dict) or "value" not in result["amount"]:
-            return False
-        
-        # Check category structure
-        if not isinstance(result["category"], dict) or "code" not in result["category"]:
-            return False
-        
-        return True
-    
-    def _normalize_amount(self, result: Dict[str, Any]) -> Dict[str, Any]:
-        """Normalize amount to integer VND."""
-        try:
-            amount = result["amount"]
-            value = amount["value"]
-            
-            # Convert to string first to handle various formats
-            if isinstance(value, str):
-                # Remove common separators and currency symbols
-                value = re.sub(r'[.,₫đ\s]', '', value)
-                value = int(value) if value.isdigit() else 0
-            elif isinstance(value, (int, float)):
-                value = int(value)
-            else:
-                value = 0
-            
-            # Ensure non-negative
-            value = max(0, value)
-            
-            result["amount"]["value"] = value
-            result["amount"]["currency"] = "VND"
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Amount normalization failed: {e}")
-            result["amount"]["value"] = 0
-            result["amount"]["currency"] = "VND"
-            return result
-    
-    def _handle_date_defaulting(self, result: Dict[str, Any], hints: Optional[Dict] = None) -> Dict[str, Any]:
-        """Handle date defaulting strategy."""
-        try:
-            transaction_date = result.get("transaction_date", "")
-            
-            # Check if date is valid
-            if not self._is_valid_date(transaction_date):
-                # Use extraction date
-                timezone_str = hints.get("timezone") if hints else None
-                tz = pytz.timezone(timezone_str) if timezone_str else self.default_timezone
-                
-                extraction_date = datetime.now(tz).strftime("%Y-%m-%d")
-                result["transaction_date"] = extraction_date
-                
-                # Add warning
-                if "meta" not in result:
-                    result["meta"] = {}
-                if "warnings" not in result["meta"]:
-                    result["meta"]["warnings"] = []
-                
-                result["meta"]["warnings"].append("date_defaulted_to_extraction")
-                result["meta"]["needs_review"] = True
-                
-                logger.info(f"Date defaulted to extraction date: {extraction_date}")
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Date defaulting failed: {e}")
-            # Fallback to current date
-            result["transaction_date"] = datetime.now(self.default_timezone).strftime("%Y-%m-%d")
-            return result
-    
-    def _is_valid_date(self, date_str: str) -> bool:
-        """Check if date string is valid YYYY-MM-DD format."""
-        if not isinstance(date_str, str):
+        if not isinstance(result, dict):
             return False
-        
-        # Check format
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', date_str):
-            return False
-        
-        # Check if it's a valid date
+        amount = result.get("amount")
+        category = result.get("category")
+        return (
+            isinstance(amount, dict) and "value" in amount
+            and isinstance(category, dict) and "code" in category
+        )
+
+    def _default_date(self, value: Any, ctx: _RuleContext) -> str:
+        """Date strategy = extraction_date when the extracted date is missing or invalid."""
+        if is_valid_date(value):
+            return value
+        extraction_date = ctx.extraction_date
+        if extraction_date is None:
+            extraction_date = datetime.now(self._resolve_timezone(ctx.timezone)).strftime("%Y-%m-%d")
+        ctx.flag("date_defaulted_to_extraction")
+        logger.info(f"Date defaulted to extraction date: {extraction_date}")
+        return extraction_date
+
+    def _resolve_timezone(self, name: Optional[str]):
+        """Timezone hint, falling back to the default timezone when missing or unknown."""
+        if not name:
+            return self.default_timezone
         try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            return True
-        except ValueError:
-            return False
-    
-    def _apply_cash_change_guard(self, result: Dict[str, Any]) -> Dict[str, Any]:
+            return pytz.timezone(name)
+        except pytz.UnknownTimeZoneError:
+            logger.warning(f"Unknown timezone hint {name!r}, using {self.default_timezone.zone}")
+            return self.default_timezone
+
+    def _normalize_amount_value(self, value: Any, ctx: _RuleContext) -> int:
         """
-        Apply cash/change guard to auto-correct amount.
-        This is a simplified version - in practice, you'd need the original text.
+        Normalize amount to a non-negative integer VND.
+
+        Cash/change guard (simplified): without the original text we cannot
+        recompute due = cash - change, so unusually high totals are flagged
+        for review instead.
         """
-        try:
-            # This is a placeholder implementation
-            # In a real implementation, you'd analyze the original text for:
-            # - "PHƯƠNG THỨC THANH TOÁN" | "TIỀN MẶT"/"CARD"
-            # - "TIỀN THỐI LẠI"/"CHANGE"
-            # - Calculate: due = cash - change
-            
-            # For now, we'll just ensure the amount is reasonable
-            amount_value = result["amount"]["value"]
-            
-            # If amount seems too high (over 10M VND), flag for review
-            if amount_value > 10000000:
-                if "meta" not in result:
-                    result["meta"] = {}
-                if "warnings" not in result["meta"]:
-                    result["meta"]["warnings"] = []
-                
-                result["meta"]["warnings"].append("amount_seems_high")
-                result["meta"]["needs_review"] = True
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Cash/change guard failed: {e}")
-            return result
-    
-    def _cleanup_items(self, result: Dict[str, Any]) -> Dict[str, Any]:
-        """Clean up items array - drop uncertain items."""
-        try:
-            items = result.get("items", [])
-            if not isinstance(items, list):
-                result["items"] = []
-                return result
-            
-            cleaned_items = []
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-                
-                name = item.get("name", "").strip()
-                qty = item.get("qty", 1)
-                
-                # Drop items with empty name
-                if not name:
-                    continue
-                
-                # Ensure qty is valid
-                if not isinstance(qty, int) or qty < 1:
-                    qty = 1
-                
-                cleaned_items.append({
-                    "name": name,
-                    "qty": qty
-                })
-            
-            result["items"] = cleaned_items
-            return result
-            
-        except Exception as e:
-            logger.error(f"Items cleanup failed: {e}")
-            result["items"] = []
-            return result
-    
-    def _finalize_meta(self, result: Dict[str, Any]) -> Dict[str, Any]:
-        """Finalize metadata - ensure meta exists and warnings are deduplicated."""
-        try:
-            if "meta" not in result:
-                result["meta"] = {}
-            
-            meta = result["meta"]
-            
-            # Ensure needs_review exists
-            if "needs_review" not in meta:
-                meta["needs_review"] = False
-            
-            # Deduplicate and limit warnings
-            if "warnings" in meta and isinstance(meta["warnings"], list):
-                warnings = list(set(meta["warnings"]))  # Remove duplicates
-                warnings = [w for w in warnings if isinstance(w, str) and w.strip()]  # Filter valid strings
-                meta["warnings"] = warnings[:3]  # Cap at 3 warnings
-            else:
-                meta["warnings"] = []
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"Meta finalization failed: {e}")
-            result["meta"] = {
-                "needs_review": True,
-                "warnings": ["post_processing_error"]
-            }
-            return result
+        if isinstance(value, str):
+            # Remove common separators and currency symbols
+            value = _AMOUNT_NOISE.sub('', value)
+            value = int(value) if value.isdigit() else 0
+        elif isinstance(value, (int, float)):
+            value = int(value)
+        else:
+            value = 0
+        value = max(0, value)
+        if value > _HIGH_AMOUNT:
+            ctx.flag("amount_seems_high")
+        return value
+
+    def _cleanup_item(self, item: Any, ctx: _RuleContext) -> Any:
+        """Drop uncertain items (not an object, or no name); default qty to 1."""
+        if not isinstance(item, dict):
+            return MISSING
+        name = item.get("name")
+        name = name.strip() if isinstance(name, str) else ""
+        if not name:
+            return MISSING
+        qty = item.get("qty", 1)
+        if not isinstance(qty, int) or isinstance(qty, bool) or qty < 1:
+            qty = 1
+        return {"name": name, "qty": qty}
+
+    def _finalize_meta(self, meta: Any, ctx: _RuleContext) -> Dict[str, Any]:
+        """Ensure meta exists; merge warnings (rule warnings first), deduplicate (in order) and cap them."""
+        meta = dict(meta) if isinstance(meta, dict) else {}
+        warnings = meta.get("warnings")
+        # Rule warnings explain needs_review (and reprocess reads the date one): never cap them away
+        warnings = ctx.warnings + (warnings if isinstance(warnings, list) else [])
+        meta["warnings"] = list(dict.fromkeys(w for w in warnings if isinstance(w, str) and w.strip()))[:_MAX_WARNINGS]
+        if ctx.needs_review:
+            meta["needs_review"] = True
+        else:
+            meta.setdefault("needs_review", False)
+        return meta
 
 
 # Global post-processor instance
-post_processor = OcrPostProcessor()
\ No newline at end of file
+post_processor = OcrPostProcessor()
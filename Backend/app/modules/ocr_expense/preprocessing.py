@@ -1,155 +1,674 @@
 """
 Image preprocessing service for OCR expense extraction.
 Handles auto-rotation, deskew, contrast adjustment, and resizing.
+
+JPEGs are decoded straight to near-target size (draft mode + reduce), the
+light enhancements run after downscaling, and output is encoded to a byte
+budget. A pixel-count guard rejects decompression bombs before decoding.
+PDF pages are rendered by poppler directly at target size, a few at a time.
+Tall receipts keep their short side and are cut into overlapping tiles.
+Photos can be cropped to the receipt and deskewed before resizing
+(OCR_AUTOCROP_ENABLED, off by default). A NumPy quality gate (blur,
+exposure, framing) then scores the downscaled image; OCR_QUALITY_GATE picks
+whether a failed check is only flagged for review (warn, the default),
+rejected before any Gemini call (reject), or skipped (off).
+Uploads that are already small, upright baseline JPEGs (our mobile client
+sends these) are detected from the header and forwarded byte-for-byte: only
+the hash, quality gate and draft copy are computed (passthrough fast path).
+
+CPU-bound work runs in a process pool (OCR_PREPROCESS_WORKERS): workers
+receive raw upload bytes and return encoded JPEG bytes plus per-stage timings.
 """
 
+import asyncio
 import io
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 import logging
+import multiprocessing
 
-from PIL import Image, ImageOps, ImageEnhance
+from PIL import Image, ImageEnhance
 import pdf2image
 
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.modules.ocr_expense.localization import localize_receipt
+from app.modules.ocr_expense.phash import dhash
+from app.modules.ocr_expense.quality import QualityThresholds, assess_quality, quality_issue
+from app.modules.ocr_expense.tiling import needs_tiling, split_into_tiles, tile_axis, working_size
 
 logger = logging.getLogger(__name__)
 
 
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds the decoded pixel budget (decompression bomb guard)."""
+
+
+class ImageQualityError(ValueError):
+    """Raised by the quality gate (OCR_QUALITY_GATE=reject) for photos too blurry, dark or empty to read."""
+
+    def __init__(self, reason: str, scores: Dict[str, float], seconds: float = 0.0):
+        # args are kept so the error pickles back from pool workers
+        super().__init__(reason, scores, seconds)
+        self.reason = reason
+        self.scores = scores
+        self.seconds = seconds
+
+    def __str__(self) -> str:
+        return f"Image quality too low ({self.reason}): {self.scores}"
+
+
+@dataclass(frozen=True)
+class PreprocessOptions:
+    """Pipeline parameters passed to pool workers (snapshot of settings)."""
+    max_dimension: int
+    dpi: int
+    jpeg_quality: int
+    min_jpeg_quality: int
+    target_bytes: int
+    max_pixels: int
+    pdf_max_pages: int = 5
+    pdf_render_threads: int = 2
+    tile_aspect_threshold: float = 0.0  # 0 disables tiling
+    tile_overlap: float = 0.15
+    tile_max_tiles: int = 6
+    draft_dimension: int = 0  # >0: also encode a low-resolution copy for two-tier OCR
+    autocrop: bool = False
+    autocrop_margin: float = 0.03
+    deskew_max_angle: float = 0.0
+    quality_gate: str = "off"  # reject | warn | off
+    quality_thresholds: Optional[QualityThresholds] = None
+    passthrough: bool = False  # forward in-bounds JPEGs untouched
+
+    @classmethod
+    def from_settings(cls) -> "PreprocessOptions":
+        return cls(
+            max_dimension=settings.OCR_MAX_DIMENSION,
+            dpi=settings.OCR_DPI,
+            jpeg_quality=settings.OCR_JPEG_QUALITY,
+            min_jpeg_quality=settings.OCR_JPEG_MIN_QUALITY,
+            target_bytes=settings.OCR_TARGET_BYTES,
+            max_pixels=settings.OCR_MAX_IMAGE_PIXELS,
+            pdf_max_pages=settings.OCR_PDF_MAX_PAGES,
+            pdf_render_threads=settings.OCR_PDF_RENDER_THREADS,
+            tile_aspect_threshold=settings.OCR_TILE_ASPECT_THRESHOLD,
+            tile_overlap=settings.OCR_TILE_OVERLAP,
+            tile_max_tiles=settings.OCR_TILE_MAX_TILES,
+            draft_dimension=settings.OCR_TIER1_MAX_DIMENSION if settings.OCR_TIERED_ENABLED else 0,
+            autocrop=settings.OCR_AUTOCROP_ENABLED,
+            autocrop_margin=settings.OCR_AUTOCROP_MARGIN,
+            deskew_max_angle=settings.OCR_DESKEW_MAX_ANGLE,
+            quality_gate=settings.OCR_QUALITY_GATE,
+            quality_thresholds=QualityThresholds(
+                min_sharpness=settings.OCR_QUALITY_MIN_SHARPNESS,
+                min_brightness=settings.OCR_QUALITY_MIN_BRIGHTNESS,
+                max_brightness=settings.OCR_QUALITY_MAX_BRIGHTNESS,
+                min_coverage=settings.OCR_QUALITY_MIN_COVERAGE,
+            ),
+            passthrough=settings.OCR_PASSTHROUGH_ENABLED,
+        )
+
+
+@dataclass
+class PreprocessResult:
+    """Output of a preprocessing run (picklable, returned by pool workers)."""
+    image_bytes: bytes
+    timings: Dict[str, float] = field(default_factory=dict)
+    # 64-bit perceptual hash (hex) of the upright image, for near-duplicate detection
+    phash: Optional[str] = None
+    # Multi-page PDFs: every rendered page in order (image_bytes is pages[0])
+    pages: List[bytes] = field(default_factory=list)
+    # Tall images and single-page PDFs with a tall page: overlapping tiles along the long side
+    # (image_bytes is the whole image at max_dimension)
+    tiles: List[bytes] = field(default_factory=list)
+    # Order of the tiles: vertical (top-to-bottom) or horizontal (left-to-right)
+    tile_axis: str = "vertical"
+    # Quality gate scores (photos only) and the failed check when OCR_QUALITY_GATE=warn
+    quality: Optional[Dict[str, float]] = None
+    quality_issue: Optional[str] = None
+    # Low-resolution copy (draft_dimension) for the first OCR tier; single images/pages only
+    draft_bytes: Optional[bytes] = None
+    # True when image_bytes is the original upload (fast path, nothing re-encoded)
+    passthrough: bool = False
+
+
+# EXIF orientation tag -> transpose that brings the image upright
+_ORIENTATION_TAG = 0x0112
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+# --- Worker functions (run inside the process pool; must stay module-level) ---
+
+def _preprocess_image_bytes(data: bytes, options: PreprocessOptions) -> PreprocessResult:
+    """Decode an uploaded image straight to near-target size and preprocess it."""
+    timings: Dict[str, float] = {}
+    try:
+        t0 = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as image:
+            # Header is parsed lazily: check the pixel budget before decoding anything
+            _check_pixel_budget(image.size, options.max_pixels)
+            orientation = image.getexif().get(_ORIENTATION_TAG, 1)
+            if _can_pass_through(image, len(data), orientation, options):
+                return _pass_through(image, data, options, timings, t0)
+            if image.format == "JPEG":
+                # DCT-domain downscale (1/2, 1/4, 1/8) while decoding; result stays >= target
+                image.draft("RGB", _working_target(image.size, options))
+            image.load()
+            timings["decode"] = time.perf_counter() - t0
+            return _preprocess_image_object(image, options, timings, orientation, photo=True)
+    except (ImageTooLargeError, ImageQualityError):
+        raise
+    except Exception as e:
+        logger.error(f"Image preprocessing failed: {e}")
+        raise ValueError(f"Image preprocessing failed: {e}")
+
+
+def _preprocess_pdf_bytes(
+    data: bytes,
+    options: PreprocessOptions,
+    first_page: Optional[int] = None,
+    last_page: Optional[int] = None,
+) -> PreprocessResult:
+    """
+    Render PDF pages straight at the target size and preprocess each one.
+
+    Pages are rasterized by poppler with `-scale-to max_dimension` (no
+    full-DPI bitmap), `pdf_render_threads` pages at a time in parallel, and
+    each chunk is encoded before the next is rendered, so peak memory is
+    bounded by render_threads x one target-size page. At most pdf_max_pages
+    pages are processed.
+
+    A single tall page (e.g. a printed till roll) is rendered at the tiling
+    working size instead and returned with its tiles, like a tall photo.
+    Multi-page documents are not tiled: each page is one Gemini image part.
+    """
+    timings: Dict[str, float] = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pdf_path = Path(tmp_dir) / "upload.pdf"
+            pdf_path.write_bytes(data)
+
+            page_count = int(pdf2image.pdfinfo_from_path(str(pdf_path))["Pages"])
+            first = max(1, first_page or 1)
+            last = min(page_count, last_page or page_count, first + max(1, options.pdf_max_pages) - 1)
+            if first > last:
+                raise ValueError(f"Page range {first_page}-{last_page} is outside the document (pages: {page_count})")
+
+            render_size = options.max_dimension
+            if first == last:
+                page_size = _pdf_page_size(pdf_path, first, options.dpi)
+                if page_size is not None and needs_tiling(page_size, options.tile_aspect_threshold):
+                    render_size = working_size(
+                        page_size, options.max_dimension, options.tile_overlap, options.tile_max_tiles
+                    )
+
+            threads = max(1, options.pdf_render_threads)
+            pages: List[bytes] = []
+            tiles: List[bytes] = []
+            axis = "vertical"
+            phash: Optional[str] = None
+            draft_bytes: Optional[bytes] = None
+            for chunk_start in range(first, last + 1, threads):
+                chunk_end = min(last, chunk_start + threads - 1)
+                t0 = time.perf_counter()
+                images = pdf2image.convert_from_path(
+                    str(pdf_path),
+                    dpi=options.dpi,
+                    size=render_size,
+                    first_page=chunk_start,
+                    last_page=chunk_end,
+                    thread_count=chunk_end - chunk_start + 1,
+                )
+                timings["rasterize"] = timings.get("rasterize", 0.0) + time.perf_counter() - t0
+                if not images:
+                    raise ValueError("Failed to convert PDF to image")
+
+                for image in images:
+                    page_timings: Dict[str, float] = {}
+                    page = _preprocess_image_object(image, options, page_timings)
+                    image.close()
+                    pages.append(page.image_bytes)
+                    tiles, axis = page.tiles, page.tile_axis
+                    phash = phash or page.phash
+                    draft_bytes = draft_bytes or page.draft_bytes
+                    for stage, seconds in page_timings.items():
+                        timings[stage] = timings.get(stage, 0.0) + seconds
+                del images
+
+        logger.info("Rendered PDF pages %d-%d of %d at <=%spx", first, last, page_count, render_size)
+        return PreprocessResult(
+            image_bytes=pages[0],
+            timings=timings,
+            phash=phash,
+            pages=pages,
+            tiles=tiles if len(pages) == 1 else [],
+            tile_axis=axis,
+            draft_bytes=draft_bytes if len(pages) == 1 else None,
+        )
+
+    except ImageTooLargeError:
+        raise
+    except Exception as e:
+        logger.error(f"PDF preprocessing failed: {e}")
+        raise ValueError(f"PDF preprocessing failed: {e}")
+
+
+def _pdf_page_size(pdf_path: Path, page: int, dpi: int) -> Optional[Tuple[int, int]]:
+    """Pixel size of one page at `dpi` (page rotation applied), from pdfinfo; None if not reported."""
+    info = pdf2image.pdfinfo_from_path(str(pdf_path), first_page=page, last_page=page)
+    match = re.match(r"([\d.]+) x ([\d.]+)", str(info.get(f"Page {page:4d} size", "")))
+    if match is None:
+        return None
+    width, height = (round(float(points) * dpi / 72) for points in match.groups())
+    if str(info.get(f"Page {page:4d} rot", "0")).strip() in ("90", "270"):
+        width, height = height, width
+    return width, height
+
+
+def _preprocess_image_object(
+    image: Image.Image,
+    options: PreprocessOptions,
+    timings: Dict[str, float],
+    orientation: Optional[int] = None,
+    photo: bool = False,
+) -> PreprocessResult:
+    """
+    Preprocess PIL Image object.
+
+    Steps:
+    1. Box-reduce by an integer factor while still far above target size
+    2. Auto-rotate based on EXIF, convert to RGB if needed
+    3. Photos: crop to the receipt and straighten small rotations
+    4. Resize to max dimension (tall images: short side only), then compute the perceptual hash
+       and (photos) run the quality gate
+    5. Light contrast/sharpness/brightness enhancement (on the small image)
+    6. Encode JPEG within the byte budget; tall images are also cut into tiles
+    """
+    try:
+        _check_pixel_budget(image.size, options.max_pixels)
+        if orientation is None:
+            orientation = image.getexif().get(_ORIENTATION_TAG, 1)
+
+        # Step 1: Cheap integer reduction towards the target size
+        t0 = time.perf_counter()
+        target = _working_target(image.size, options)
+        factor = min(image.width // target[0], image.height // target[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        timings["reduce"] = time.perf_counter() - t0
+
+        # Step 2: Auto-rotate based on EXIF and normalise mode
+        t0 = time.perf_counter()
+        transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+        if transpose is not None:
+            image = image.transpose(transpose)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        timings["orient"] = time.perf_counter() - t0
+
+        # Step 3: Drop the table/background around the receipt (fewer pixels to resize, encode and send)
+        crop_box = None
+        frame_scale = 1.0
+        if photo and options.autocrop:
+            t0 = time.perf_counter()
+            frame_scale = _working_target(image.size, options)[0] / image.width
+            image, crop_box, angle = localize_receipt(image, options.autocrop_margin, options.deskew_max_angle)
+            timings["localize"] = time.perf_counter() - t0
+            if crop_box is not None:
+                logger.info("Cropped to receipt %s (deskew %.1f deg)", crop_box, angle)
+
+        # Step 4: Resize to max dimension
+        t0 = time.perf_counter()
+        target = _working_target(image.size, options)
+        if crop_box is not None and not needs_tiling(image.size, options.tile_aspect_threshold):
+            # Keep the receipt at the scale it had in the full frame: same legibility, fewer pixels
+            target = (max(1, round(image.width * frame_scale)), max(1, round(image.height * frame_scale)))
+        image = _resize_image(image, options.max_dimension, target)
+        timings["resize"] = time.perf_counter() - t0
+
+        # Hash before enhancement so it reflects the receipt, not our filters
+        t0 = time.perf_counter()
+        phash = dhash(image)
+        timings["phash"] = time.perf_counter() - t0
+
+        # Quality gate on the small image: reject before enhancement/encoding, well before Gemini
+        quality = issue = None
+        if photo:
+            quality, issue = _check_quality(image, options, timings)
+
+        # Step 5: Enhancement runs after downscaling (~10x fewer pixels)
+        t0 = time.perf_counter()
+        image = _enhance_image(image)
+        timings["enhance"] = time.perf_counter() - t0
+
+        # Step 6: Encode to the byte budget
+        tiles: List[bytes] = []
+        axis = tile_axis(image.size)
+        if needs_tiling(image.size, options.tile_aspect_threshold):
+            t0 = time.perf_counter()
+            tiles = [
+                _encode_jpeg(tile, options)
+                for tile in split_into_tiles(image, options.max_dimension, options.tile_overlap)
+            ]
+            timings["tile"] = time.perf_counter() - t0
+            image = _resize_image(image, options.max_dimension)
+        t0 = time.perf_counter()
+        image_bytes = _encode_jpeg(image, options)
+        timings["encode"] = time.perf_counter() - t0
+        draft_bytes = None
+        if options.draft_dimension > 0 and not tiles:
+            t0 = time.perf_counter()
+            draft_bytes = _encode_jpeg(_resize_image(image, options.draft_dimension), options)
+            timings["draft"] = time.perf_counter() - t0
+        return PreprocessResult(
+            image_bytes=image_bytes,
+            timings=timings,
+            phash=phash,
+            tiles=tiles,
+            tile_axis=axis,
+            quality=quality,
+            quality_issue=issue,
+            draft_bytes=draft_bytes,
+        )
+
+    except (ImageTooLargeError, ImageQualityError):
+        raise
+    except Exception as e:
+        logger.error(f"Image object preprocessing failed: {e}")
+        raise ValueError(f"Image preprocessing failed: {e}")
+
+
+def _can_pass_through(image: Image.Image, size_bytes: int, orientation: int, options: PreprocessOptions) -> bool:
+    """Header-only check: an upright baseline-colour JPEG already within size and byte bounds."""
+    return (
+        options.passthrough
+        and image.format == "JPEG"
+        and image.mode in ("RGB", "L")
+        and not image.info.get("progressive")
+        and orientation == 1
+        and max(image.size) <= options.max_dimension
+        and size_bytes <= options.target_bytes
+        and not needs_tiling(image.size, options.tile_aspect_threshold)
+    )
+
+
+def _pass_through(
+    image: Image.Image,
+    data: bytes,
+    options: PreprocessOptions,
+    timings: Dict[str, float],
+    t0: float,
+) -> PreprocessResult:
+    """
+    Fast path: forward the upload untouched.
+
+    The image is decoded only for the perceptual hash, the quality gate and
+    the tier-1 draft; with neither of the last two enabled a 1/8-scale DCT
+    decode is enough for the hash. Auto-crop and enhancement are skipped,
+    since they would require a re-encode.
+    """
+    if options.quality_gate == "off" and options.draft_dimension <= 0:
+        image.draft(image.mode, (max(1, image.width // 8), max(1, image.height // 8)))
+    image.load()
+    timings["decode"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    phash = dhash(image)
+    timings["phash"] = time.perf_counter() - t0
+    quality, issue = _check_quality(image, options, timings)
+    draft_bytes = None
+    if options.draft_dimension > 0:
+        t0 = time.perf_counter()
+        draft_bytes = _encode_jpeg(_resize_image(image, options.draft_dimension), options)
+        timings["draft"] = time.perf_counter() - t0
+    return PreprocessResult(
+        image_bytes=data,
+        timings=timings,
+        phash=phash,
+        quality=quality,
+        quality_issue=issue,
+        draft_bytes=draft_bytes,
+        passthrough=True,
+    )
+
+
+def _check_quality(
+    image: Image.Image,
+    options: PreprocessOptions,
+    timings: Dict[str, float],
+) -> Tuple[Optional[Dict[str, float]], Optional[str]]:
+    """Run the quality gate on a photo at working size; raises ImageQualityError in reject mode."""
+    if options.quality_gate == "off" or options.quality_thresholds is None:
+        return None, None
+    t0 = time.perf_counter()
+    quality = assess_quality(image)
+    issue = quality_issue(quality, options.quality_thresholds)
+    timings["quality"] = time.perf_counter() - t0
+    if issue is not None and options.quality_gate == "reject":
+        raise ImageQualityError(issue, quality, timings["quality"])
+    return quality, issue
+
+
+def _check_pixel_budget(size: Tuple[int, int], max_pixels: int) -> None:
+    width, height = size
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image too large: {width}x{height} exceeds {max_pixels} pixels"
+        )
+
+
+def _target_size(size: Tuple[int, int], max_dim: int) -> Tuple[int, int]:
+    """Size the image will have after capping its long side at max_dim."""
+    width, height = size
+    if width <= max_dim and height <= max_dim:
+        return width, height
+    scale = min(max_dim / width, max_dim / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _working_target(size: Tuple[int, int], options: PreprocessOptions) -> Tuple[int, int]:
+    """Pipeline working size: long side capped at max_dimension, or short side only for tall images."""
+    if needs_tiling(size, options.tile_aspect_threshold):
+        return working_size(size, options.max_dimension, options.tile_overlap, options.tile_max_tiles)
+    return _target_size(size, options.max_dimension)
+
+
+def _encode_jpeg(image: Image.Image, options: PreprocessOptions) -> bytes:
+    """Encode as JPEG, stepping quality down until the output fits target_bytes."""
+    quality = options.jpeg_quality
+    while True:
+        img_bytes = io.BytesIO()
+        image.save(img_bytes, format='JPEG', quality=quality)
+        if img_bytes.tell() <= options.target_bytes or quality <= options.min_jpeg_quality:
+            return img_bytes.getvalue()
+        quality = max(options.min_jpeg_quality, quality - 10)
+
+
+def _enhance_image(image: Image.Image) -> Image.Image:
+    """Apply light enhancement to improve OCR accuracy."""
+    try:
+        # Light contrast enhancement
+        enhancer = ImageEnhance.Contrast(image)
+        image = enhancer.enhance(1.2)  # 20% increase
+
+        # Light sharpness enhancement
+        enhancer = ImageEnhance.Sharpness(image)
+        image = enhancer.enhance(1.1)  # 10% increase
+
+        # Light brightness adjustment
+        enhancer = ImageEnhance.Brightness(image)
+        image = enhancer.enhance(1.05)  # 5% increase
+
+        return image
+
+    except Exception as e:
+        logger.warning(f"Image enhancement failed, using original: {e}")
+        return image
+
+
+def _resize_image(
+    image: Image.Image,
+    max_dim: int,
+    target: Optional[Tuple[int, int]] = None,
+) -> Image.Image:
+    """Resize image to max dimension (or an explicit target size) while preserving aspect ratio."""
+    try:
+        width, height = image.size
+        new_width, new_height = target or _target_size(image.size, max_dim)
+
+        if (new_width, new_height) == (width, height):
+            return image
+
+        # Resize with high quality
+        resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+        logger.info(f"Resized image from {width}x{height} to {new_width}x{new_height}")
+        return resized
+
+    except Exception as e:
+        logger.error(f"Image resize failed: {e}")
+        raise ValueError(f"Image resize failed: {e}")
+
+
 class ImagePreprocessor:
     """Handles image preprocessing for OCR."""
-    
+
     def __init__(self):
         self.max_dimension = settings.OCR_MAX_DIMENSION
         self.dpi = settings.OCR_DPI
-    
+        self.options = PreprocessOptions.from_settings()
+        self.workers = settings.OCR_PREPROCESS_WORKERS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_flight = 0
+
     async def preprocess_file(self, file_path: str, content_type: str) -> bytes:
         """
         Preprocess file based on content type.
-        
+
         Args:
             file_path: Path to the file
             content_type: MIME type of the file
-            
+
         Returns:
             Preprocessed image as bytes
         """
+        data = await asyncio.to_thread(Path(file_path).read_bytes)
+        result = await self.preprocess_bytes(data, content_type)
+        return result.image_bytes
+
+    async def preprocess_bytes(
+        self,
+        data: bytes,
+        content_type: str,
+        first_page: Optional[int] = None,
+        last_page: Optional[int] = None,
+    ) -> PreprocessResult:
+        """
+        Preprocess raw upload bytes in the worker pool.
+
+        Args:
+            data: Uploaded file content
+            content_type: MIME type of the file
+            first_page: First PDF page to render (1-based, PDFs only)
+            last_page: Last PDF page to render (capped at OCR_PDF_MAX_PAGES pages)
+
+        Returns:
+            PreprocessResult with JPEG bytes and per-stage timings
+        """
         if content_type == "application/pdf":
-            return await self._preprocess_pdf(file_path)
+            return await self._submit(_preprocess_pdf_bytes, data, self.options, first_page, last_page)
         elif content_type.startswith("image/"):
-            return await self._preprocess_image(file_path)
+            t0 = time.perf_counter()
+            result = await self._submit(_preprocess_image_bytes, data, self.options)
+            self._record_passthrough(result, time.perf_counter() - t0)
+            return result
         else:
             raise ValueError(f"Unsupported content type: {content_type}")
-    
-    async def _preprocess_pdf(self, file_path: str) -> bytes:
-        """Convert PDF first page to image and preprocess."""
-        try:
-            # Convert first page to image
-            images = pdf2image.convert_from_path(
-                file_path,
-                dpi=self.dpi,
-                first_page=1,
-                last_page=1
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """Create the process pool on first use (None when pooling is disabled)."""
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            # spawn: forking a threaded event-loop process is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
             )
-            
-            if not images:
-                raise ValueError("Failed to convert PDF to image")
-            
-            image = images[0]
-            return await self._preprocess_image_object(image)
-            
-        except Exception as e:
-            logger.error(f"PDF preprocessing failed: {e}")
-            raise ValueError(f"PDF preprocessing failed: {e}")
-    
-    async def _preprocess_image(self, file_path: str) -> bytes:
-        """Preprocess image file."""
-        try:
-            with Image.open(file_path) as image:
-                return await self._preprocess_image_object(image)
-        except Exception as e:
-            logger.error(f"Image preprocessing failed: {e}")
-            raise ValueError(f"Image preprocessing failed: {e}")
-    
-    async def _preprocess_image_object(self, image: Image.Image) -> bytes:
-        """
-        Preprocess PIL Image object.
-        
-        Steps:
-        1. Auto-rotate based on EXIF
-        2. Convert to RGB if needed
-        3. Light deskew and contrast adjustment
-        4. Resize to max dimension
-        """
+            logger.info("[OCR] Preprocessing pool started | workers=%d", self.workers)
+        return self._executor
+
+    async def _submit(self, fn: Callable[..., PreprocessResult], *args) -> PreprocessResult:
+        """Run a worker function off the event loop and record pool metrics."""
+        self._in_flight += 1
+        self._publish_queue_depth()
+        t0 = time.perf_counter()
         try:
-            # Step 1: Auto-rotate based on EXIF
-            image = ImageOps.exif_transpose(image)
-            
-            # Step 2: Convert to RGB if needed
-            if image.mode not in ('RGB', 'L'):
-                image = image.convert('RGB')
-            
-            # Step 3: Light deskew and contrast adjustment
-            image = await self._enhance_image(image)
-            
-            # Step 4: Resize to max dimension
-            image = await self._resize_image(image)
-            
-            # Convert to bytes
-            img_bytes = io.BytesIO()
-            image.save(img_bytes, format='JPEG', quality=95, optimize=True)
-            return img_bytes.getvalue()
-            
-        except Exception as e:
-            logger.error(f"Image object preprocessing failed: {e}")
+            executor = self._get_executor()
+            if executor is None:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        except ImageQualityError as e:
+            metrics.incr(f"ocr.quality.rejected.{e.reason}")
+            metrics.observe("ocr.preprocess.quality", e.seconds)
+            raise
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM); drop the pool so the next call starts a fresh one
+            logger.error(f"Preprocessing pool broken, restarting: {e}")
+            self._executor = None
             raise ValueError(f"Image preprocessing failed: {e}")
-    
-    async def _enhance_image(self, image: Image.Image) -> Image.Image:
-        """Apply light enhancement to improve OCR accuracy."""
-        try:
-            # Light contrast enhancement
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.2)  # 20% increase
-            
-            # Light sharpness enhancement
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(1.1)  # 10% increase
-            
-            # Light brightness adjustment
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(1.05)  # 5% increase
-            
-            return image
-            
-        except Exception as e:
-            logger.warning(f"Image enhancement failed, using original: {e}")
-            return image
-    
-    async def _resize_image(self, image: Image.Image) -> Image.Image:
-        """Resize image to max dimension while preserving aspect ratio."""
-        try:
-            width, height = image.size
-            max_dim = self.max_dimension
-            
-            # Calculate new dimensions
-            if width <= max_dim and height <= max_dim:
-                return image
-            
-            # Calculate scaling factor
-            scale_factor = min(max_dim / width, max_dim / height)
-            new_width = int(width * scale_factor)
-            new_height = int(height * scale_factor)
-            
-            # Resize with high quality
-            resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            logger.info(f"Resized image from {width}x{height} to {new_width}x{new_height}")
-            return resized
-            
-        except Exception as e:
-            logger.error(f"Image resize failed: {e}")
-            raise ValueError(f"Image resize failed: {e}")
-    
+        finally:
+            self._in_flight -= 1
+            self._publish_queue_depth()
+
+        total = time.perf_counter() - t0
+        for stage, seconds in result.timings.items():
+            metrics.observe(f"ocr.preprocess.{stage}", seconds)
+        metrics.observe("ocr.preprocess.total", total)
+        metrics.observe("ocr.preprocess.wait", max(0.0, total - sum(result.timings.values())))
+        return result
+
+    def _record_passthrough(self, result: PreprocessResult, seconds: float) -> None:
+        """Track how often image uploads take the fast path and the time it saves vs the full pipeline."""
+        if result.passthrough:
+            metrics.incr("ocr.preprocess.passthrough")
+            full = metrics.get_timing("ocr.preprocess.image.full")
+            if full.count:
+                metrics.observe("ocr.preprocess.passthrough.saved", max(0.0, full.total / full.count - seconds))
+        else:
+            metrics.incr("ocr.preprocess.image.full")
+            metrics.observe("ocr.preprocess.image.full", seconds)
+        passthrough = metrics.get_counter("ocr.preprocess.passthrough")
+        metrics.set_gauge(
+            "ocr.preprocess.passthrough.rate",
+            passthrough / (passthrough + metrics.get_counter("ocr.preprocess.image.full")),
+        )
+
+    def _publish_queue_depth(self) -> None:
+        metrics.set_gauge("ocr.preprocess.in_flight", self._in_flight)
+        metrics.set_gauge("ocr.preprocess.queue_depth", max(0, self._in_flight - max(1, self.workers)))
+
+    def shutdown(self) -> None:
+        """Stop the worker pool (called on application shutdown)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
     def get_image_info(self, image_bytes: bytes) -> dict:
         """Get image information for debugging."""
         try:
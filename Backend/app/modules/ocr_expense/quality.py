@@ -0,0 +1,110 @@
+"""
+Image quality gate for receipt photos.
+
+Runs with NumPy on the downscaled grayscale image (a few milliseconds) so
+unusable photos can be rejected before the Gemini call:
+
+- sharpness: variance of the 4-neighbour Laplacian over the receipt region
+  (blurred text has weak second derivatives)
+- brightness: mean luminance; dark_clip / bright_clip are the fractions of
+  crushed (<16) and blown-out (>240) pixels
+- coverage: fraction of grid cells with local contrast (text, paper edges);
+  a blank page or a photo of a plain surface scores ~0
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+# Coverage grid and the luminance std-dev that makes a cell "content" (text, edges)
+_GRID = 16
+_CELL_CONTRAST = 8.0
+
+# Reason -> warning code (also the `reason` of a rejection)
+QUALITY_WARNINGS = {
+    "blurry": "image_blurry",
+    "too_dark": "image_too_dark",
+    "too_bright": "image_overexposed",
+    "no_receipt": "receipt_not_found",
+}
+
+QUALITY_MESSAGES = {
+    "blurry": "Ảnh bị mờ, vui lòng chụp lại rõ nét hơn",
+    "too_dark": "Ảnh quá tối, vui lòng chụp ở nơi đủ sáng",
+    "too_bright": "Ảnh bị chói sáng, vui lòng chụp lại",
+    "no_receipt": "Không tìm thấy hoá đơn trong ảnh, vui lòng chụp lại toàn bộ hoá đơn",
+}
+
+
+@dataclass(frozen=True)
+class QualityThresholds:
+    min_sharpness: float
+    min_brightness: float
+    max_brightness: float
+    min_coverage: float
+
+
+def assess_quality(image: Image.Image) -> Dict[str, float]:
+    """Sharpness, exposure and framing scores of an (already downscaled) image."""
+    gray = np.asarray(image.convert("L"), dtype=np.float32)
+    height, width = gray.shape
+
+    # Content cells (local contrast, which survives blur) -> bounding box of the receipt
+    cell_h, cell_w = max(1, height // _GRID), max(1, width // _GRID)
+    rows, cols = height // cell_h, width // cell_w
+    cells = gray[:rows * cell_h, :cols * cell_w].reshape(rows, cell_h, cols, cell_w)
+    content = cells.std(axis=(1, 3)) > _CELL_CONTRAST
+    coverage = float(content.mean())
+
+    region = gray
+    if content.any():
+        cell_rows, cell_cols = np.nonzero(content)
+        region = gray[
+            cell_rows.min() * cell_h:(cell_rows.max() + 1) * cell_h,
+            cell_cols.min() * cell_w:(cell_cols.max() + 1) * cell_w,
+        ]
+
+    sharpness = 0.0
+    if region.shape[0] >= 3 and region.shape[1] >= 3:
+        laplacian = (
+            region[:-2, 1:-1] + region[2:, 1:-1] + region[1:-1, :-2] + region[1:-1, 2:]
+            - 4 * region[1:-1, 1:-1]
+        )
+        sharpness = float(laplacian.var())
+
+    return {
+        "sharpness": round(sharpness, 1),
+        "brightness": round(float(gray.mean()), 1),
+        "dark_clip": round(float((gray < 16).mean()), 3),
+        "bright_clip": round(float((gray > 240).mean()), 3),
+        "coverage": round(coverage, 3),
+    }
+
+
+def quality_issue(scores: Dict[str, float], thresholds: QualityThresholds) -> Optional[str]:
+    """First failed check (framing, then exposure, then blur), or None if the photo is usable."""
+    if scores["coverage"] < thresholds.min_coverage:
+        return "no_receipt"
+    if scores["brightness"] < thresholds.min_brightness:
+        return "too_dark"
+    if scores["brightness"] > thresholds.max_brightness:
+        return "too_bright"
+    if scores["sharpness"] < thresholds.min_sharpness:
+        return "blurry"
+    return None
+
+
+def attach_quality(result_data: dict, scores: Dict[str, float], issue: Optional[str] = None) -> dict:
+    """Put the scores in meta.quality; a failed check (warn mode) adds its warning and requests review."""
+    meta = result_data.setdefault("meta", {})
+    meta["quality"] = scores
+    if issue is not None:
+        warning = QUALITY_WARNINGS[issue]
+        warnings = [w for w in (meta.get("warnings") or []) if w != warning]
+        meta["warnings"] = [warning] + warnings[:2]
+        meta["needs_review"] = True
+    return result_data
@@ -0,0 +1,126 @@
+"""
+Redis-backed queue for asynchronous OCR jobs.
+
+Layout:
+- ocr:jobs:queue            list of pending job ids (LPUSH in, BLMOVE out)
+- ocr:jobs:processing       list of job ids claimed by a worker (reliable queue)
+- ocr:jobs:delayed          zset of job ids waiting out a retry backoff (score = ready-at epoch)
+- ocr:job:{id}:payload      base64 upload bytes, expires after OCR_JOB_PAYLOAD_TTL
+- ocr:job:{id}:progress     JSON {"status", "stage", ...} polled by the SSE stream
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.redis.client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Move due ids from the delayed zset onto the queue atomically, so two workers never push the same id
+_PROMOTE_DUE_LUA = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('LPUSH', KEYS[2], id)
+end
+return ids
+"""
+
+
+class OcrJobQueue:
+    """Redis list queue + payload/progress keys for OCR jobs"""
+
+    queue_key = "ocr:jobs:queue"
+    processing_key = "ocr:jobs:processing"
+    delayed_key = "ocr:jobs:delayed"
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.payload_ttl = settings.OCR_JOB_PAYLOAD_TTL
+        self._promote_due_script = self.redis.register_script(_PROMOTE_DUE_LUA)
+
+    def _payload_key(self, job_id: str) -> str:
+        return f"ocr:job:{job_id}:payload"
+
+    def _progress_key(self, job_id: str) -> str:
+        return f"ocr:job:{job_id}:progress"
+
+    async def enqueue(self, job_id: str, data: bytes) -> None:
+        """Store the upload bytes and push the job id onto the queue."""
+        # Client uses decode_responses=True, so binary payloads are stored base64-encoded
+        encoded = base64.b64encode(data).decode("ascii")
+        progress = json.dumps({"status": "pending", "stage": "queued"})
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(self._payload_key(job_id), self.payload_ttl, encoded)
+            pipe.setex(self._progress_key(job_id), self.payload_ttl, progress)
+            pipe.lpush(self.queue_key, job_id)
+            await pipe.execute()
+
+    async def dequeue(self, timeout: float = 5.0) -> Optional[str]:
+        """Block until a job id is available and move it to the processing list."""
+        await self.promote_due()
+        return await self.redis.blmove(self.queue_key, self.processing_key, timeout, "RIGHT", "LEFT")
+
+    async def ack(self, job_id: str) -> None:
+        """Remove a finished job id from the processing list."""
+        await self.redis.lrem(self.processing_key, 0, job_id)
+
+    async def requeue(self, job_id: str, delay: float = 0.0) -> None:
+        """Release a claimed job id and schedule it for a retry after delay seconds."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing_key, 0, job_id)
+            if delay > 0:
+                pipe.zadd(self.delayed_key, {job_id: time.time() + delay})
+            else:
+                pipe.lpush(self.queue_key, job_id)
+            await pipe.execute()
+
+    async def promote_due(self, limit: int = 100) -> List[str]:
+        """Move delayed retries whose backoff has elapsed onto the queue."""
+        return await self._promote_due_script(
+            keys=[self.delayed_key, self.queue_key], args=[time.time(), limit]
+        )
+
+    async def recover_processing(self) -> List[str]:
+        """Move ids left in the processing list (crashed workers) back onto the queue."""
+        recovered = []
+        while True:
+            job_id = await self.redis.lmove(self.processing_key, self.queue_key, "RIGHT", "LEFT")
+            if job_id is None:
+                return recovered
+            recovered.append(job_id)
+
+    async def load_payload(self, job_id: str) -> Optional[bytes]:
+        encoded = await self.redis.get(self._payload_key(job_id))
+        if encoded is None:
+            return None
+        return base64.b64decode(encoded)
+
+    async def delete_payload(self, job_id: str) -> None:
+        await self.redis.delete(self._payload_key(job_id))
+
+    async def set_progress(self, job_id: str, status: str, **fields: Any) -> None:
+        """Publish job progress; failures are logged and ignored (the DB row is authoritative)."""
+        try:
+            payload = json.dumps({"status": status, **fields}, ensure_ascii=False)
+            await self.redis.setex(self._progress_key(job_id), self.payload_ttl, payload)
+        except Exception as e:
+            logger.warning("[OCR] Failed to publish progress for job=%s: %s", job_id, e)
+
+    async def get_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis.get(self._progress_key(job_id))
+        except Exception as e:
+            logger.warning("[OCR] Failed to read progress for job=%s: %s", job_id, e)
+            return None
+        return json.loads(raw) if raw else None
+
+
+# Global queue instance
+ocr_job_queue = OcrJobQueue()
@@ -0,0 +1,208 @@
+"""
+Quota-aware rate limiting for Gemini calls.
+
+Two token buckets per model (requests/minute and tokens/minute) live in Redis
+and are debited atomically by a Lua script using the Redis clock, so every API
+and worker process shares the same quota. A request that does not fit waits
+for the refill (up to GEMINI_QUEUE_DEADLINE_SECONDS) instead of hitting
+Gemini's 429.
+
+Within a process, waiters take turns round-robin per user (FairQueue), so a
+30-receipt batch from one user cannot starve a single upload from another.
+
+Redis errors fail open: the call proceeds unthrottled and the 429 retry in
+GeminiOcrClient is the backstop.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import io
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, List, Optional
+
+from PIL import Image
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.redis.client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills 258 tokens per 768x768 image tile (one tile for images <= 384px)
+_TOKENS_PER_IMAGE_TILE = 258
+# Typical structured receipt response; counted up front because TPM includes output
+_EXPECTED_OUTPUT_TOKENS = 400
+# Vietnamese prompt text averages ~3 characters per token
+_CHARS_PER_TOKEN = 3
+
+# KEYS[1] = requests bucket, KEYS[2] = tokens bucket
+# ARGV[1] = requests/minute, ARGV[2] = tokens/minute (<= 0: unlimited), ARGV[3] = tokens needed
+# Returns 0 when both buckets were debited, otherwise the milliseconds until they can be.
+_TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local function level(key, capacity)
+  local state = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens, ts = tonumber(state[1]), tonumber(state[2])
+  if tokens == nil or ts == nil then return capacity end
+  return math.min(capacity, tokens + (now - ts) * capacity / 60000)
+end
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local wait, requests, tokens = 0, 0, 0
+if rpm > 0 then
+  requests = level(KEYS[1], rpm)
+  if requests < 1 then wait = math.max(wait, (1 - requests) * 60000 / rpm) end
+end
+if tpm > 0 then
+  cost = math.min(cost, tpm)
+  tokens = level(KEYS[2], tpm)
+  if tokens < cost then wait = math.max(wait, (cost - tokens) * 60000 / tpm) end
+end
+if wait > 0 then return math.ceil(wait) end
+if rpm > 0 then
+  redis.call('HSET', KEYS[1], 'tokens', requests - 1, 'ts', now)
+  redis.call('PEXPIRE', KEYS[1], 120000)
+end
+if tpm > 0 then
+  redis.call('HSET', KEYS[2], 'tokens', tokens - cost, 'ts', now)
+  redis.call('PEXPIRE', KEYS[2], 120000)
+end
+return 0
+"""
+
+
+class GeminiBusyError(RuntimeError):
+    """Gemini quota could not be obtained (or kept returning 429/503) within the deadline."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(prompt: str, images: List[bytes]) -> int:
+    """Rough input + output token count for TPM accounting (image size read from the header only)."""
+    total = len(prompt) // _CHARS_PER_TOKEN + _EXPECTED_OUTPUT_TOKENS
+    for data in images:
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                width, height = image.size
+        except Exception:
+            total += _TOKENS_PER_IMAGE_TILE
+            continue
+        if width <= 384 and height <= 384:
+            total += _TOKENS_PER_IMAGE_TILE
+        else:
+            total += _TOKENS_PER_IMAGE_TILE * math.ceil(width / 768) * math.ceil(height / 768)
+    return total
+
+
+class FairQueue:
+    """One holder at a time; waiting callers are served round-robin by key (user)."""
+
+    def __init__(self):
+        self._held = False
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    @asynccontextmanager
+    async def turn(self, key: str, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold the queue for the body; asyncio.TimeoutError if no turn within `timeout` seconds."""
+        if self._held or self._waiters:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(key, deque()).append(future)
+            try:
+                await asyncio.wait_for(future, timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                if future.done() and not future.cancelled():
+                    self._release()  # the turn was handed over just as we were cancelled
+                else:
+                    self._discard(key, future)
+                raise
+        else:
+            self._held = True
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _discard(self, key: str, future: asyncio.Future) -> None:
+        queue = self._waiters.get(key)
+        if queue is not None and future in queue:
+            queue.remove(future)
+            if not queue:
+                del self._waiters[key]
+
+    def _release(self) -> None:
+        while self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiters.move_to_end(key)  # this user goes to the back of the line
+            else:
+                del self._waiters[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._held = False
+
+
+class GeminiRateLimiter:
+    """Redis-backed RPM/TPM token buckets shared by all processes, with per-user fair queueing."""
+
+    def __init__(self):
+        self.redis = get_redis_client()
+        self.rpm = settings.GEMINI_RPM_LIMIT
+        self.tpm = settings.GEMINI_TPM_LIMIT
+        self._script = self.redis.register_script(_TOKEN_BUCKET_LUA)
+        self._queue = FairQueue()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _keys(self, model: str) -> List[str]:
+        return [f"ocr:gemini:ratelimit:{model}:rpm", f"ocr:gemini:ratelimit:{model}:tpm"]
+
+    async def acquire(self, model: str, tokens: int, user_id: Optional[str], deadline: float) -> None:
+        """Wait for one request and `tokens` tokens of quota; GeminiBusyError if not before `deadline`."""
+        if not self.enabled:
+            return
+        t0 = time.monotonic()
+        metrics.set_gauge("ocr.gemini.ratelimit.waiting", self._queue.waiting + 1)
+        try:
+            async with self._queue.turn(user_id or "anonymous", timeout=max(0.0, deadline - t0)):
+                while True:
+                    try:
+                        wait_ms = int(await self._script(keys=self._keys(model), args=[self.rpm, self.tpm, tokens]))
+                    except Exception as e:
+                        logger.warning("[OCR] Gemini rate limiter unavailable, proceeding unthrottled: %s", e)
+                        metrics.incr("ocr.gemini.ratelimit.errors")
+                        return
+                    if wait_ms <= 0:
+                        return
+                    if time.monotonic() + wait_ms / 1000 > deadline:
+                        metrics.incr("ocr.gemini.ratelimit.rejected")
+                        raise GeminiBusyError(
+                            f"Gemini quota exhausted for model {model}", retry_after=wait_ms / 1000
+                        )
+                    await asyncio.sleep(wait_ms / 1000)
+        except asyncio.TimeoutError:
+            # Other callers held the queue until the deadline passed
+            metrics.incr("ocr.gemini.ratelimit.rejected")
+            raise GeminiBusyError(f"Gemini rate limiter queue is full for model {model}")
+        finally:
+            metrics.observe("ocr.gemini.ratelimit.wait", time.monotonic() - t0)
+            metrics.set_gauge("ocr.gemini.ratelimit.waiting", self._queue.waiting)
+
+
+# Global rate limiter instance
+gemini_rate_limiter = GeminiRateLimiter()
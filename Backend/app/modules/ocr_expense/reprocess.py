@@ -0,0 +1,253 @@
+"""
+Offline re-post-processing of archived Gemini responses.
+
+After a rule change in OcrPostProcessor (the amount_seems_high threshold, the
+warning cap, ...), re-apply the current rules and schema to historical
+extractions without calling Gemini again:
+    python -m app.modules.ocr_expense.reprocess --dry-run            # diff summary only
+    python -m app.modules.ocr_expense.reprocess --batch-size 1000
+    python -m app.modules.ocr_expense.reprocess --after-id <last_id> # resume an interrupted run
+
+Rows are read by keyset pagination on the primary key, one batch in memory at
+a time, and changed rows are written with one bulk UPDATE per batch. What the
+pipeline adds after post-processing (quality scores/warning, possible_duplicate)
+is carried over from the stored meta, and a date that was defaulted keeps the
+original extraction date.
+
+After each committed batch the per-session OCR context cache of the affected
+chat sessions is invalidated, so chat picks up the new values. The OCR context
+messages already saved into those chat sessions are history and are not rewritten.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.db.session import AsyncSessionLocal, engine
+from app.modules.ocr_expense.archive import decode_raw_response
+from app.modules.ocr_expense.context_cache import session_context_cache
+from app.modules.ocr_expense.dedup import DUPLICATE_WARNING, flag_duplicate
+from app.modules.ocr_expense.models import OcrExpenseJob, OcrExpenseResult
+from app.modules.ocr_expense.postprocessing import post_processor
+from app.modules.ocr_expense.quality import QUALITY_WARNINGS, attach_quality
+
+logger = logging.getLogger(__name__)
+
+# Columns derived from the post-processed result
+RESULT_FIELDS = (
+    "transaction_date", "amount_value", "amount_currency",
+    "category_code", "category_name", "items_json", "meta_json",
+)
+_QUALITY_ISSUES = {warning: issue for issue, warning in QUALITY_WARNINGS.items()}
+_DATE_DEFAULTED = "date_defaulted_to_extraction"
+
+
+@dataclass
+class ReprocessStats:
+    """Diff summary of a reprocessing run."""
+    scanned: int = 0
+    changed: int = 0
+    failed: int = 0
+    schema_violations: int = 0
+    last_id: Optional[str] = None
+    # column -> rows where it changed; "+warning" / "-warning" -> rows that gained/lost it
+    fields: Counter = field(default_factory=Counter)
+    warnings: Counter = field(default_factory=Counter)
+    samples: List[Dict[str, Any]] = field(default_factory=list)
+
+    def record(self, row_id: str, old: Dict[str, Any], new: Dict[str, Any], changed: List[str], max_samples: int) -> None:
+        self.changed += 1
+        self.fields.update(changed)
+        old_warnings = set((old.get("meta_json") or {}).get("warnings") or [])
+        new_warnings = set((new.get("meta_json") or {}).get("warnings") or [])
+        self.warnings.update(f"+{w}" for w in new_warnings - old_warnings)
+        self.warnings.update(f"-{w}" for w in old_warnings - new_warnings)
+        if len(self.samples) < max_samples:
+            self.samples.append({"id": row_id, "changes": {f: [old[f], new[f]] for f in changed}})
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "scanned": self.scanned,
+            "changed": self.changed,
+            "unchanged": self.scanned - self.changed - self.failed,
+            "failed": self.failed,
+            "schema_violations": self.schema_violations,
+            "last_id": self.last_id,
+            "fields": dict(self.fields.most_common()),
+            "warnings": dict(self.warnings.most_common()),
+            "samples": self.samples,
+        }
+
+
+def _extraction_date(row: Any, timezone: str) -> Optional[str]:
+    """Date the original extraction would have defaulted to."""
+    warnings = (row.meta_json or {}).get("warnings") or []
+    if _DATE_DEFAULTED in warnings and row.transaction_date:
+        return row.transaction_date
+    if row.created_at is None:
+        return None
+    created_at = row.created_at
+    if created_at.tzinfo is None:
+        created_at = pytz.utc.localize(created_at)
+    return created_at.astimezone(pytz.timezone(timezone)).strftime("%Y-%m-%d")
+
+
+def _carry_over_annotations(result: Dict[str, Any], old_meta: Dict[str, Any]) -> None:
+    """Re-apply what _run_pipeline adds after post-processing, in the same order."""
+    warnings = old_meta.get("warnings") or []
+    if isinstance(old_meta.get("quality"), dict):
+        issue = next((_QUALITY_ISSUES[w] for w in warnings if w in _QUALITY_ISSUES), None)
+        attach_quality(result, old_meta["quality"], issue)
+    if DUPLICATE_WARNING in warnings:
+        flag_duplicate(result)
+
+
+def reprocess_row(row: Any, timezone: str = settings.OCR_DEFAULT_TIMEZONE) -> Tuple[Dict[str, Any], List[str]]:
+    """Column values for one stored result under the current rules, and its schema errors."""
+    raw = decode_raw_response(row.raw_response)
+    result, errors = post_processor.process(raw, {
+        "timezone": timezone,
+        "extraction_date": _extraction_date(row, timezone),
+    })
+    _carry_over_annotations(result, row.meta_json or {})
+    amount = result.get("amount") or {}
+    category = result.get("category") or {}
+    return {
+        "transaction_date": result.get("transaction_date"),
+        "amount_value": amount.get("value"),
+        "amount_currency": amount.get("currency"),
+        "category_code": category.get("code"),
+        "category_name": category.get("name"),
+        "items_json": result.get("items"),
+        "meta_json": result.get("meta"),
+    }, errors
+
+
+async def reprocess_results(
+    db: AsyncSession,
+    batch_size: int = 500,
+    dry_run: bool = False,
+    prompt_version: Optional[str] = None,
+    after_id: Optional[str] = None,
+    limit: Optional[int] = None,
+    max_samples: int = 5,
+) -> ReprocessStats:
+    """
+    Stream archived responses through the current post-processor and update changed rows.
+
+    Commits once per batch (nothing is written with dry_run) and then drops the
+    session context cache of the affected sessions; stats.last_id is the resume
+    point after an interruption.
+    """
+    columns = [getattr(OcrExpenseResult, name) for name in RESULT_FIELDS]
+    stats = ReprocessStats(last_id=after_id)
+    while limit is None or stats.scanned < limit:
+        query = (
+            select(
+                OcrExpenseResult.id, OcrExpenseResult.job_id, OcrExpenseResult.created_at,
+                OcrExpenseResult.raw_response, *columns,
+            )
+            .where(OcrExpenseResult.raw_response.is_not(None))
+            .order_by(OcrExpenseResult.id)
+            .limit(batch_size if limit is None else min(batch_size, limit - stats.scanned))
+        )
+        if prompt_version:
+            query = query.where(OcrExpenseResult.prompt_version == prompt_version)
+        if stats.last_id is not None:
+            query = query.where(OcrExpenseResult.id > stats.last_id)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            break
+
+        updates = []
+        job_ids = set()
+        for row in rows:
+            stats.scanned += 1
+            try:
+                new, errors = reprocess_row(row)
+            except Exception as e:
+                stats.failed += 1
+                logger.warning("[OCR] Reprocessing result=%s failed: %s", row.id, e)
+                continue
+            if errors:
+                stats.schema_violations += 1
+            old = {name: getattr(row, name) for name in RESULT_FIELDS}
+            changed = [name for name in RESULT_FIELDS if new[name] != old[name]]
+            if changed:
+                stats.record(row.id, old, new, changed, max_samples)
+                updates.append({"id": row.id, **new})
+                job_ids.add(row.job_id)
+        stats.last_id = rows[-1].id
+
+        if updates and not dry_run:
+            await db.execute(update(OcrExpenseResult), updates)
+            await db.commit()
+            await _invalidate_session_contexts(db, job_ids)
+        logger.info(
+            "[OCR] Reprocessed %d results (changed=%d, failed=%d, last_id=%s)",
+            stats.scanned, stats.changed, stats.failed, stats.last_id,
+        )
+    return stats
+
+
+async def _invalidate_session_contexts(db: AsyncSession, job_ids: set) -> None:
+    """Drop the cached OCR prompt context of the chat sessions whose results were rewritten."""
+    session_ids = (await db.execute(
+        select(OcrExpenseJob.session_id).where(OcrExpenseJob.id.in_(job_ids)).distinct()
+    )).scalars().all()
+    await session_context_cache.invalidate(*session_ids)
+
+
+async def _run(args: argparse.Namespace) -> ReprocessStats:
+    started = datetime.now()
+    try:
+        async with AsyncSessionLocal() as db:
+            stats = await reprocess_results(
+                db,
+                batch_size=max(1, args.batch_size),
+                dry_run=args.dry_run,
+                prompt_version=args.prompt_version,
+                after_id=args.after_id,
+                limit=args.limit,
+                max_samples=args.samples,
+            )
+    finally:
+        await engine.dispose()
+    logger.info("[OCR] Reprocessing finished in %s", datetime.now() - started)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-apply post-processing rules to archived Gemini responses",
+        epilog="The session OCR context cache is invalidated for rewritten results; OCR context "
+        "messages already saved in chat sessions keep the old values.",
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="Rows read and updated per round trip")
+    parser.add_argument("--dry-run", action="store_true", help="Report the diff summary without writing")
+    parser.add_argument("--prompt-version", help="Only results extracted with this prompt version")
+    parser.add_argument("--after-id", help="Resume after this result id (last_id of an earlier run)")
+    parser.add_argument("--limit", type=int, help="Stop after this many rows")
+    parser.add_argument("--samples", type=int, default=5, help="Changed rows to include in the summary")
+    args = parser.parse_args()
+
+    configure_logging(level=settings.LOG_LEVEL)
+    stats = asyncio.run(_run(args))
+    print(json.dumps(stats.summary(), ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
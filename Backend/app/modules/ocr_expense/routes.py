@@ -1,15 +1,21 @@
 """
 Simplified OCR Expense Routes - Option 2 Implementation.
-Only 1 endpoint: POST /api/v1/ocr/expense:extract (synchronous)
+POST /api/v1/ocr/expense:extract (mode=sync, or mode=async -> 202 + job_id)
+POST /api/v1/ocr/expense:batchExtract (up to OCR_BATCH_SIZE files, NDJSON stream)
+GET  /api/v1/ocr/jobs/{job_id} and /api/v1/ocr/jobs/{job_id}/events (SSE progress)
 """
 
+import asyncio
+import json
 import logging
-from typing import Optional
+import time
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.session import get_db
+from app.db.session import get_db, AsyncSessionLocal
 from app.modules.auth.middleware import get_current_user
 from app.modules.users.service import User
 from app.modules.ocr_expense.exceptions import (
@@ -17,6 +23,7 @@ from app.modules.ocr_expense.exceptions import (
     SchemaViolationError, InternalError
 )
 from app.modules.ocr_expense.service import ocr_expense_service
+from app.modules.ocr_expense.queue import ocr_job_queue
 from app.modules.ocr_expense.schemas import (
     OcrExpenseHints, OcrExpenseResult, OcrExpenseJobResponse, OcrExpenseExtractRequest
 )
@@ -26,6 +33,25 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/ocr", tags=["ocr-expense"])
 
 
+def _parse_hints(hints: Optional[str], debug: bool) -> OcrExpenseHints:
+    """Parse the hints JSON form field and carry the debug flag into it."""
+    # Parse hints if provided
+    parsed_hints = None
+    if hints:
+        try:
+            hints_dict = json.loads(hints)
+            parsed_hints = OcrExpenseHints(**hints_dict)
+        except Exception as e:
+            raise FileValidationError(f"Invalid hints format: {str(e)}")
+    
+    # Ensure debug flag carried into hints for response enrichment
+    if parsed_hints is None:
+        parsed_hints = OcrExpenseHints()
+    # if client sent debug form flag, honor it (don't overwrite true)
+    parsed_hints.debug = parsed_hints.debug or bool(debug)
+    return parsed_hints
+
+
 @router.post(
     "/expense:extract",
     response_model=OcrExpenseJobResponse,
@@ -44,7 +70,8 @@ router = APIRouter(prefix="/ocr", tags=["ocr-expense"])
                             "session_id": {"type": "string", "title": "Session Id"},
                             "user_id": {"type": "string", "title": "User Id"},
                             "hints": {"anyOf": [{"type": "string"}, {"type": "null"}], "title": "Hints"},
-                            "debug": {"type": "boolean", "title": "Debug", "default": False}
+                            "debug": {"type": "boolean", "title": "Debug", "default": False},
+                            "mode": {"type": "string", "enum": ["sync", "async"], "title": "Mode", "default": "sync"}
                         }
                     }
                 }
@@ -53,13 +80,14 @@ router = APIRouter(prefix="/ocr", tags=["ocr-expense"])
     }
 )
 async def extract_expense_sync(
+    response: Response,
     req: OcrExpenseExtractRequest = Depends(OcrExpenseExtractRequest.as_form),
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ) -> OcrExpenseJobResponse:
     """
-    Extract expense data from uploaded file (synchronous).
+    Extract expense data from uploaded file.
     
     Args:
         session_id: Chat session ID
@@ -67,27 +95,27 @@ async def extract_expense_sync(
         file: Image or PDF file
         hints: Optional hints as JSON string
         debug: Include debug information
+        mode: "sync" (default) waits for the result; "async" enqueues the job
+            and returns 202 with status=pending (poll GET /ocr/jobs/{job_id})
         db: Database session
         
     Returns:
         OCR result with session context
     """
     try:
-        # Parse hints if provided
-        parsed_hints = None
-        if req.hints:
-            try:
-                import json
-                hints_dict = json.loads(req.hints)
-                parsed_hints = OcrExpenseHints(**hints_dict)
-            except Exception as e:
-                raise FileValidationError(f"Invalid hints format: {str(e)}")
-        
-        # Ensure debug flag carried into hints for response enrichment
-        if parsed_hints is None:
-            parsed_hints = OcrExpenseHints()
-        # if client sent debug form flag, honor it (don't overwrite true)
-        parsed_hints.debug = parsed_hints.debug or bool(req.debug)
+        parsed_hints = _parse_hints(req.hints, req.debug)
+
+        if req.mode == "async":
+            # Enqueue for the OCR worker pool and return immediately
+            response.status_code = 202
+            return await ocr_expense_service.submit_expense_job(
+                db=db,
+                session_id=req.session_id,
+                user_id=req.user_id,
+                file=file,
+                hints=parsed_hints,
+                profile="generic"
+            )
 
         # Process OCR synchronously
         result = await ocr_expense_service.extract_expense_sync(
@@ -108,6 +136,50 @@ async def extract_expense_sync(
         raise InternalError(f"OCR extraction failed: {str(e)}")
 
 
+@router.post(
+    "/expense:batchExtract",
+    summary="OcrBatchExtract",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}, "description": "One JSON object per line"}}
+)
+async def extract_expense_batch(
+    session_id: str = Form(...),
+    user_id: str = Form(...),
+    hints: Optional[str] = Form(None),
+    debug: bool = Form(False),
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Extract expense data from up to OCR_BATCH_SIZE files in one request.
+    
+    Files are processed with bounded parallelism (OCR_BATCH_CONCURRENCY) and
+    streamed back as NDJSON in completion order:
+        {"type": "result", "index": 0, "job_id": ..., "status": "completed", "result": {...}}
+        {"type": "result", "index": 3, "job_id": ..., "status": "failed", "error": {"code": ..., "message": ...}}
+        {"type": "summary", "total": 30, "completed": 29, "failed": 1, "persisted": true, ...}
+    All job/result rows are bulk-inserted once every file has finished.
+    """
+    parsed_hints = _parse_hints(hints, debug)
+    # Read uploads before streaming starts: form files are closed with the request
+    uploads = await ocr_expense_service.read_batch_uploads(files)
+
+    async def ndjson_stream():
+        # The request-scoped session is closed once streaming starts; use a fresh one
+        async with AsyncSessionLocal() as session:
+            async for record in ocr_expense_service.extract_expense_batch(
+                db=session,
+                session_id=session_id,
+                user_id=user_id,
+                uploads=uploads,
+                hints=parsed_hints,
+                profile="generic"
+            ):
+                yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint for OCR service."""
@@ -118,6 +190,95 @@ async def health_check():
     }
 
 
+@router.get(
+    "/jobs/{job_id}",
+    response_model=OcrExpenseJobResponse,
+    summary="Get OCR job status"
+)
+async def get_ocr_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> OcrExpenseJobResponse:
+    """
+    Get status (and result, once completed) of an OCR job.
+    
+    Args:
+        job_id: OCR job ID
+        db: Database session
+        current_user: Current authenticated user
+        
+    Returns:
+        OCR job with result when completed
+    """
+    job = await ocr_expense_service.get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    return job
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.get(
+    "/jobs/{job_id}/events",
+    summary="Stream OCR job progress (SSE)"
+)
+async def stream_ocr_job_events(
+    job_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-Sent Events stream of job progress.
+    
+    Emits `progress` events ({"status", "stage"}) on change, a `heartbeat`
+    comment every 15s, and a final `result` event with the job response.
+    """
+    job = await ocr_expense_service.get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="OCR job not found")
+    user_id = current_user.id
+
+    async def event_stream():
+        last = None
+        last_sent = time.monotonic()
+        status = job.status
+        while status not in ("completed", "failed"):
+            if await request.is_disconnected():
+                return
+            progress = await ocr_job_queue.get_progress(job_id)
+            if progress is None:
+                # Progress key expired/missing: fall back to the DB row
+                async with AsyncSessionLocal() as session:
+                    current = await ocr_expense_service.get_job(session, job_id, user_id)
+                progress = {"status": current.status} if current else {"status": "failed"}
+            status = progress.get("status", status)
+            if progress != last:
+                last = progress
+                last_sent = time.monotonic()
+                yield _sse("progress", progress)
+            elif time.monotonic() - last_sent > 15:
+                last_sent = time.monotonic()
+                yield ": heartbeat\n\n"
+            if status not in ("completed", "failed"):
+                await asyncio.sleep(0.5)
+
+        # The request-scoped session is closed once streaming starts; use a fresh one
+        async with AsyncSessionLocal() as session:
+            final = await ocr_expense_service.get_job(session, job_id, user_id)
+        if final is not None:
+            yield _sse("result", final.model_dump(mode="json"))
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post(
     "/mark-saved/{job_id}",
     summary="Mark OCR as saved to transactions"
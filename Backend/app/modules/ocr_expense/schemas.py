@@ -4,7 +4,7 @@ Only essential schemas for synchronous OCR processing.
 """
 
 from __future__ import annotations
-from typing import Literal, Optional, List
+from typing import Dict, Literal, Optional, List
 from datetime import datetime
 
 from pydantic import BaseModel, Field
@@ -32,6 +32,8 @@ class OcrExpenseItem(BaseModel):
 class OcrExpenseMeta(BaseModel):
     needs_review: bool = False
     warnings: List[str] = Field(default_factory=list)
+    # Quality gate scores (sharpness, brightness, dark_clip, bright_clip, coverage)
+    quality: Optional[Dict[str, float]] = None
 
 
 class OcrExpenseResult(BaseModel):
@@ -47,6 +49,15 @@ class OcrExpenseHints(BaseModel):
     timezone: Optional[str] = None
     items_expected: Optional[bool] = None
     debug: Optional[bool] = None
+    # PDF page range (1-based, inclusive); defaults to all pages up to OCR_PDF_MAX_PAGES
+    first_page: Optional[int] = Field(None, ge=1)
+    last_page: Optional[int] = Field(None, ge=1)
+
+
+class OcrCacheInfo(BaseModel):
+    hit: bool = False
+    # Original processing time minus this request's time (0 on miss)
+    latency_saved_ms: float = 0.0
 
 
 class OcrExpenseJobResponse(BaseModel):
@@ -58,6 +69,10 @@ class OcrExpenseJobResponse(BaseModel):
     created_at: datetime
     # Optional structured result (present when debug=true)
     result: OcrExpenseResult | None = None
+    # Set when status == "failed" (async jobs)
+    error_message: Optional[str] = None
+    # Result cache outcome (sync extraction only)
+    cache: OcrCacheInfo | None = None
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -68,6 +83,8 @@ class OcrExpenseExtractRequest(BaseModel):
     user_id: str
     hints: Optional[str] = None  # JSON string
     debug: bool = False
+    # "sync" waits for the result; "async" enqueues and returns job_id (202)
+    mode: Literal["sync", "async"] = "sync"
 
     @classmethod
     def as_form(
@@ -76,5 +93,6 @@ class OcrExpenseExtractRequest(BaseModel):
         user_id: str = Form(...),
         hints: Optional[str] = Form(None),
         debug: bool = Form(False),
+        mode: Literal["sync", "async"] = Form("sync"),
     ) -> "OcrExpenseExtractRequest":
-        return cls(session_id=session_id, user_id=user_id, hints=hints, debug=debug)
\ No newline at end of file
+        return cls(session_id=session_id, user_id=user_id, hints=hints, debug=debug, mode=mode)
\ No newline at end of file
@@ -5,45 +5,90 @@ Synchronous OCR processing with session integration.
 
 import logging
 import asyncio
+import copy
 import uuid
 import base64
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Tuple, Dict, Any, List
+from dataclasses import dataclass
+from typing import Optional, Tuple, Dict, Any, List, Callable, Awaitable, AsyncIterator
 import json
 import time
 import mimetypes
 
 from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, insert
 
 from app.core.config import settings
+from app.core.metrics import metrics
 from app.modules.chat.models import Session, Message
 from app.modules.chat.service import save_message
 from app.modules.ocr_expense.models import OcrExpenseJob, OcrExpenseResult
-from app.modules.ocr_expense.preprocessing import preprocessor
+from app.modules.ocr_expense.preprocessing import preprocessor, ImageTooLargeError, ImageQualityError
 from app.modules.ocr_expense.gemini_client import gemini_ocr_client
+from app.modules.ocr_expense.ratelimit import GeminiBusyError
 from app.modules.ocr_expense.postprocessing import post_processor
 from app.modules.ocr_expense.validation import schema_validator
+from app.modules.ocr_expense.queue import ocr_job_queue
+from app.modules.ocr_expense.cache import ocr_result_cache
+from app.modules.ocr_expense.context_cache import session_context_cache
+from app.modules.ocr_expense.archive import encode_raw_response
+from app.modules.ocr_expense.dedup import duplicate_index, flag_duplicate, DuplicateMatch
+from app.modules.ocr_expense.phash import BKTree
+from app.modules.ocr_expense.quality import QUALITY_MESSAGES, attach_quality
+from app.modules.ocr_expense.tiling import merge_tile_results
 from app.modules.ocr_expense.exceptions import (
-    FileValidationError, UnsupportedMediaTypeError, SchemaViolationError,
-    InternalError
+    OcrExpenseException, FileValidationError, UnsupportedMediaTypeError, SchemaViolationError,
+    LowImageQualityError, ServiceBusyError, InternalError
 )
 from app.modules.ocr_expense.schemas import (
-    OcrExpenseHints, OcrExpenseJobResponse
+    OcrExpenseHints, OcrExpenseJobResponse, OcrCacheInfo
 )
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class BatchUpload:
+    """One file of a batch request, read into memory (or rejected) before streaming starts."""
+    index: int
+    job_id: str
+    filename: str
+    content_type: str
+    data: bytes = b""
+    stored_path: str = ""
+    error: Optional[OcrExpenseException] = None
+
+
+@dataclass
+class PipelineOutput:
+    """Result of one preprocess -> Gemini -> post-process -> validate run."""
+    result: Dict[str, Any]
+    phash: Optional[str] = None
+    duplicate_of: Optional[DuplicateMatch] = None
+    # Gemini JSON before post-processing (merged across tiles) and its prompt version; None when reused
+    raw: Any = None
+    prompt_version: Optional[str] = None
+
+
 class OcrExpenseService:
     def __init__(self):
         self.upload_dir = Path(settings.OCR_UPLOAD_DIR)
-        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.retain_uploads = settings.OCR_RETAIN_UPLOADS
+        if self.retain_uploads:
+            self.upload_dir.mkdir(parents=True, exist_ok=True)
         self.max_file_size = settings.OCR_MAX_FILE_SIZE
+        self.chunk_size = settings.OCR_UPLOAD_CHUNK_SIZE
         self.allowed_types = settings.OCR_ALLOWED_TYPES
         self.default_timezone = settings.OCR_DEFAULT_TIMEZONE
+        self.job_max_retries = settings.OCR_JOB_MAX_RETRIES
+        self.job_retry_base_delay = settings.OCR_JOB_RETRY_BASE_DELAY
+        self.job_retry_max_delay = settings.OCR_JOB_RETRY_MAX_DELAY
+        self.batch_size = settings.OCR_BATCH_SIZE
+        self.batch_concurrency = max(1, settings.OCR_BATCH_CONCURRENCY)
+        self.tiered = settings.OCR_TIERED_ENABLED
+        self.tier1_model = settings.OCR_TIER1_MODEL_NAME or None
 
     async def extract_expense_sync(
         self,
@@ -63,163 +108,825 @@ class OcrExpenseService:
             # 1. Validate file
             self._validate_file(file)
             
-            # 2. Generate unique filename and path
+            # 2-3. Read upload into memory (chunked, aborts as soon as the size limit is hit)
             file_id = str(uuid.uuid4())
-            file_extension = self._get_file_extension(file.filename)
-            filename_on_disk = f"{file_id}{file_extension}"
-            file_path = self.upload_dir / filename_on_disk
-            
-            # 3. Save file to disk
-            t0 = time.perf_counter()
-            await self._save_file(file, file_path)
-            logger.info("[OCR] Saved upload to disk in %.3fs → %s", time.perf_counter() - t0, file_path)
+            data, stored_path = await self._ingest_upload(file, file_id)
             
-            # 4. Process OCR synchronously
-            try:
-                # Preprocessing -> outputs JPEG bytes
-                t1 = time.perf_counter()
-                processed_image_bytes = await preprocessor.preprocess_file(str(file_path), file.content_type)
-                mime_type = "image/jpeg"
-                logger.info("[OCR] Preprocessing done in %.3fs (bytes=%d, mime=%s)", time.perf_counter() - t1, len(processed_image_bytes or b""), mime_type)
-                
-                # LLM Call
-                t2 = time.perf_counter()
-                llm_response_json = await gemini_ocr_client.extract_expense_data(
-                    image_bytes=processed_image_bytes,
-                    hints=(hints.model_dump() if hints else None)
-                )
-                logger.info("[OCR] Gemini OCR call done in %.3fs", time.perf_counter() - t2)
-                
-                # Post-processing
-                t3 = time.perf_counter()
-                # Prefer apply_rules for backward-compatible tests; then post_process
-                if hasattr(post_processor, "apply_rules") and callable(getattr(post_processor, "apply_rules", None)):
-                    final_result_data = post_processor.apply_rules(
-                        llm_response_json,
-                        {"timezone": self.default_timezone}
-                    )
-                elif hasattr(post_processor, "post_process") and callable(getattr(post_processor, "post_process", None)):
-                    final_result_data = post_processor.post_process(
-                        llm_response_json,
-                        hints={"timezone": self.default_timezone}
-                    )
-                else:
-                    final_result_data = llm_response_json
-
-                # Ensure dict output; if mocks return non-dict, fallback to raw llm json
-                if not isinstance(final_result_data, dict):
-                    final_result_data = llm_response_json if isinstance(llm_response_json, dict) else {}
-                logger.info("[OCR] Post-processing done in %.3fs", time.perf_counter() - t3)
-                
-                # Validate result
-                t4 = time.perf_counter()
-                schema_validator.validate(final_result_data)
-                logger.info("[OCR] Schema validation done in %.3fs", time.perf_counter() - t4)
-                
-                # 5. Save OCR result to session context
-                t5 = time.perf_counter()
-                await self._save_ocr_context_to_session(
-                    db, session_id, user_id, final_result_data
-                )
-                logger.info("[OCR] Saved OCR context to session in %.3fs", time.perf_counter() - t5)
-                
-                # 6. Save OCR job record (for audit)
-                job = OcrExpenseJob(
-                    id=file_id,
-                    session_id=session_id,
-                    user_id=user_id,
-                    original_filename=file.filename,
-                    file_path=str(file_path),
-                    file_size=file.size,
-                    content_type=file.content_type,
-                    profile=profile,
-                    status="completed",
-                    completed_at=datetime.now()
+            # 4. Re-upload of identical bytes? Reuse the stored result and skip Gemini
+            content_hash = None
+            cached = None
+            if ocr_result_cache.enabled:
+                content_hash = ocr_result_cache.content_hash(
+                    data, gemini_ocr_client.prompt_version, hints.model_dump() if hints else None
                 )
-                db.add(job)
-                
-                # 7. Save OCR result record
-                # Compute auxiliary metrics
-                processing_seconds = time.perf_counter() - start_time
-                word_count = self._estimate_word_count(final_result_data)
-
-                ocr_result = OcrExpenseResult(
-                    job_id=job.id,
-                    transaction_date=final_result_data.get("transaction_date"),
-                    amount_value=final_result_data.get("amount", {}).get("value"),
-                    amount_currency=final_result_data.get("amount", {}).get("currency"),
-                    category_code=final_result_data.get("category", {}).get("code"),
-                    category_name=final_result_data.get("category", {}).get("name"),
-                    items_json=final_result_data.get("items"),
-                    meta_json=final_result_data.get("meta"),
-                    processing_time=processing_seconds,
-                    word_count=word_count
-                )
-                db.add(ocr_result)
+                cached = await self._lookup_cached_result(db, content_hash)
+            output = PipelineOutput({})
+            if cached is not None:
+                final_result_data, original_seconds, output.phash = cached
+                logger.info("[OCR] Result cache hit (hash=%s)", content_hash[:12])
+                # Same bytes as an earlier upload: the near-duplicate check still applies (this user's jobs)
+                output.duplicate_of = await duplicate_index.find(db, user_id, output.phash)
+                if output.duplicate_of is not None:
+                    flag_duplicate(final_result_data)
+            else:
+                # Process OCR synchronously (with near-duplicate check against this user's receipts)
+                output = await self._run_pipeline(data, file.content_type, hints, db=db, user_id=user_id)
+                final_result_data = output.result
+            phash = output.phash
+            
+            # 5. Save OCR result to session context
+            t5 = time.perf_counter()
+            await self._save_ocr_context_to_session(
+                db, session_id, user_id, final_result_data
+            )
+            logger.info("[OCR] Saved OCR context to session in %.3fs", time.perf_counter() - t5)
+            
+            # 6. Save OCR job record (for audit)
+            job = OcrExpenseJob(
+                id=file_id,
+                session_id=session_id,
+                user_id=user_id,
+                original_filename=file.filename,
+                file_path=stored_path,
+                file_size=len(data),
+                content_type=file.content_type,
+                profile=profile,
+                content_hash=content_hash,
+                phash=phash,
+                status="completed",
+                completed_at=datetime.now()
+            )
+            db.add(job)
+            
+            # 7. Save OCR result record
+            processing_seconds = time.perf_counter() - start_time
+            self._add_result_record(db, job.id, final_result_data, processing_seconds, output)
 
-                t6 = time.perf_counter()
-                await db.commit()
-                await db.refresh(job)
-                logger.info("[OCR] DB commit+refresh done in %.3fs", time.perf_counter() - t6)
-                
-                logger.info("[OCR] Completed for session=%s in %.3fs", session_id, time.perf_counter() - start_time)
-                
-                # In unit tests with mocked DB, created_at might be None. Ensure a value.
-                if not getattr(job, "created_at", None):
-                    job.created_at = datetime.now()
-
-                # Base response
-                base_response = OcrExpenseJobResponse(
-                    job_id=job.id,
-                    session_id=job.session_id,
-                    user_id=job.user_id,
-                    filename=job.original_filename,
-                    status=job.status,
-                    created_at=job.created_at
-                )
-                # Always attach structured result in response
-                from app.modules.ocr_expense.schemas import (
-                    OcrExpenseResult as OcrExpenseResultSchema,
-                    OcrExpenseAmount as OcrExpenseAmountSchema,
-                    OcrExpenseCategory as OcrExpenseCategorySchema,
-                    OcrExpenseItem as OcrExpenseItemSchema,
-                    OcrExpenseMeta as OcrExpenseMetaSchema,
-                )
-                amount_data = final_result_data.get("amount") or {}
-                category_data = final_result_data.get("category") or {}
-                items_data = final_result_data.get("items") or []
-                meta_data = final_result_data.get("meta") or {}
-
-                result_payload = OcrExpenseResultSchema(
-                    transaction_date=final_result_data.get("transaction_date"),
-                    amount=OcrExpenseAmountSchema(**amount_data),
-                    category=OcrExpenseCategorySchema(**category_data),
-                    items=[OcrExpenseItemSchema(**it) for it in items_data] or None,
-                    meta=OcrExpenseMetaSchema(**meta_data),
+            t6 = time.perf_counter()
+            await db.commit()
+            await db.refresh(job)
+            logger.info("[OCR] DB commit+refresh done in %.3fs", time.perf_counter() - t6)
+            duplicate_index.add(user_id, phash, job.id)
+            await self._publish_session_context(session_id, final_result_data)
+
+            elapsed = time.perf_counter() - start_time
+            if cached is None:
+                if content_hash:
+                    await ocr_result_cache.set(content_hash, final_result_data, processing_seconds, phash)
+                cache_info = OcrCacheInfo(hit=False)
+            else:
+                cache_info = OcrCacheInfo(
+                    hit=True, latency_saved_ms=round(max(0.0, original_seconds - elapsed) * 1000, 1)
                 )
-                base_response.result = result_payload
-
-                return base_response
-                
-            finally:
-                # Clean up file
-                if file_path.exists():
-                    file_path.unlink(missing_ok=True)
-                    
+            
+            logger.info("[OCR] Completed for session=%s in %.3fs (cache_hit=%s)", session_id, elapsed, cache_info.hit)
+            
+            response = self._build_job_response(job, final_result_data)
+            response.cache = cache_info
+            return response
+
         except (FileValidationError, UnsupportedMediaTypeError, SchemaViolationError):
             raise
+        except ImageTooLargeError as e:
+            raise FileValidationError(str(e))
+        except ImageQualityError as e:
+            raise self._quality_rejection(e)
+        except GeminiBusyError as e:
+            raise self._busy_rejection(e)
         except Exception as e:
             logger.error(f"OCR extraction failed: {e}")
             raise InternalError(f"OCR extraction failed: {str(e)}")
 
+    async def submit_expense_job(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        user_id: str,
+        file: UploadFile,
+        hints: Optional[OcrExpenseHints] = None,
+        profile: str = "generic"
+    ) -> OcrExpenseJobResponse:
+        """
+        Create a pending OCR job and enqueue it for the worker pool (async mode).
+        """
+        try:
+            self._validate_file(file)
+
+            file_id = str(uuid.uuid4())
+            data, stored_path = await self._ingest_upload(file, file_id)
+
+            job = OcrExpenseJob(
+                id=file_id,
+                session_id=session_id,
+                user_id=user_id,
+                original_filename=file.filename,
+                file_path=stored_path,
+                file_size=len(data),
+                content_type=file.content_type,
+                profile=profile,
+                hints=(hints.model_dump(exclude_none=True) if hints else None),
+                status="pending",
+                retry_count=0,
+            )
+            db.add(job)
+            await db.commit()
+            await db.refresh(job)
+
+            await ocr_job_queue.enqueue(job.id, data)
+            logger.info("[OCR] Enqueued job=%s for session=%s (bytes=%d)", job.id, session_id, len(data))
+
+            if not getattr(job, "created_at", None):
+                job.created_at = datetime.now()
+            return self._build_job_response(job)
+
+        except (FileValidationError, UnsupportedMediaTypeError):
+            raise
+        except Exception as e:
+            logger.error(f"Failed to enqueue OCR job: {e}")
+            raise InternalError(f"Failed to enqueue OCR job: {str(e)}")
+
+    async def process_job(self, db: AsyncSession, job_id: str) -> bool:
+        """
+        Run a queued OCR job (worker side) and record its outcome on the job row.
+        Returns True when the job was handed back to the queue for a retry; the
+        claim is already released then, so the worker must not ack it.
+        """
+        job = await db.get(OcrExpenseJob, job_id)
+        if job is None:
+            logger.warning("[OCR] Worker got unknown job=%s", job_id)
+            await ocr_job_queue.delete_payload(job_id)
+            return False
+        if job.status in ("completed", "failed"):
+            return False
+
+        start_time = time.perf_counter()
+        job.status = "processing"
+        job.started_at = datetime.now()
+        await db.commit()
+        await ocr_job_queue.set_progress(job_id, "processing", stage="queued")
+
+        try:
+            data = await ocr_job_queue.load_payload(job_id)
+            if data is None:
+                raise FileValidationError("Upload payload expired before processing")
+
+            async def report(stage: str) -> None:
+                await ocr_job_queue.set_progress(job_id, "processing", stage=stage)
+
+            hints = OcrExpenseHints(**job.hints) if job.hints else None
+            output = await self._run_pipeline(
+                data, job.content_type, hints, progress=report, db=db, user_id=job.user_id
+            )
+            final_result_data = output.result
+
+            await self._save_ocr_context_to_session(db, job.session_id, job.user_id, final_result_data)
+            self._add_result_record(db, job.id, final_result_data, time.perf_counter() - start_time, output)
+            job.phash = output.phash
+            job.status = "completed"
+            job.completed_at = datetime.now()
+            job.error_message = None
+            await db.commit()
+            duplicate_index.add(job.user_id, output.phash, job.id)
+            await self._publish_session_context(job.session_id, final_result_data)
+
+            await ocr_job_queue.set_progress(job_id, "completed")
+            await ocr_job_queue.delete_payload(job_id)
+            logger.info("[OCR] Worker completed job=%s in %.3fs", job_id, time.perf_counter() - start_time)
+            return False
+
+        except Exception as e:
+            await db.rollback()
+            job = await db.get(OcrExpenseJob, job_id)
+            job.retry_count = (job.retry_count or 0) + 1
+            job.error_message = str(e)
+            permanent = isinstance(
+                e, (FileValidationError, UnsupportedMediaTypeError, ImageTooLargeError, ImageQualityError)
+            )
+            if not permanent and job.retry_count < self.job_max_retries:
+                job.status = "pending"
+                await db.commit()
+                # Exponential backoff, or longer when the rate limiter says when quota frees up
+                delay = self.job_retry_base_delay * 2 ** (job.retry_count - 1)
+                delay = min(self.job_retry_max_delay, max(delay, getattr(e, "retry_after", None) or 0))
+                await ocr_job_queue.set_progress(job_id, "pending", retry_count=job.retry_count)
+                await ocr_job_queue.requeue(job_id, delay=delay)
+                logger.warning(
+                    "[OCR] Job=%s failed (attempt %d), retrying in %.0fs: %s", job_id, job.retry_count, delay, e
+                )
+                return True
+            else:
+                job.status = "failed"
+                job.completed_at = datetime.now()
+                await db.commit()
+                await ocr_job_queue.set_progress(job_id, "failed", error=str(e))
+                await ocr_job_queue.delete_payload(job_id)
+                logger.error("[OCR] Job=%s failed permanently: %s", job_id, e)
+                return False
+
+    async def get_job(self, db: AsyncSession, job_id: str, user_id: str) -> Optional[OcrExpenseJobResponse]:
+        """
+        Get an OCR job (with its result when completed) owned by user_id.
+        """
+        result = await db.execute(
+            select(OcrExpenseJob, OcrExpenseResult)
+            .outerjoin(OcrExpenseResult, OcrExpenseJob.id == OcrExpenseResult.job_id)
+            .where(OcrExpenseJob.id == job_id, OcrExpenseJob.user_id == user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        job, ocr_result = row
+        return self._build_job_response(job, self._result_row_to_dict(ocr_result) if ocr_result else None)
+
+    async def read_batch_uploads(self, files: List[UploadFile]) -> List[BatchUpload]:
+        """
+        Validate and read every file of a batch into memory.
+        Per-file validation errors are recorded on the item instead of failing the batch.
+        """
+        if not files:
+            raise FileValidationError("No files provided")
+        if len(files) > self.batch_size:
+            raise FileValidationError(f"Too many files: {len(files)} (max {self.batch_size} per batch)")
+
+        uploads: List[BatchUpload] = []
+        for index, file in enumerate(files):
+            item = BatchUpload(
+                index=index,
+                job_id=str(uuid.uuid4()),
+                filename=file.filename or "",
+                content_type=file.content_type or "",
+            )
+            try:
+                self._validate_file(file)
+                item.data, item.stored_path = await self._ingest_upload(file, item.job_id)
+            except OcrExpenseException as e:
+                item.error = e
+            uploads.append(item)
+        return uploads
+
+    async def extract_expense_batch(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        user_id: str,
+        uploads: List[BatchUpload],
+        hints: Optional[OcrExpenseHints] = None,
+        profile: str = "generic"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run the OCR pipeline over a batch with bounded parallelism.
+
+        Yields one record per file as soon as it finishes (completion order), then
+        bulk-inserts all job/result rows, saves one combined session context message
+        and yields a final summary record.
+        """
+        start_time = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run_one(item: BatchUpload):
+            if item.error is not None:
+                return item, None, item.error, 0.0
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    # No DB access from concurrent tasks; duplicates are checked in the consumer loop
+                    # (user_id without db only identifies the caller for Gemini fair queueing)
+                    output = await self._run_pipeline(item.data, item.content_type, hints, user_id=user_id)
+                    return item, output, None, time.perf_counter() - t0
+                except OcrExpenseException as e:
+                    return item, None, e, time.perf_counter() - t0
+                except ImageTooLargeError as e:
+                    return item, None, FileValidationError(str(e)), time.perf_counter() - t0
+                except ImageQualityError as e:
+                    return item, None, self._quality_rejection(e), time.perf_counter() - t0
+                except GeminiBusyError as e:
+                    return item, None, self._busy_rejection(e), time.perf_counter() - t0
+                except Exception as e:
+                    logger.error("[OCR] Batch item %d (%s) failed: %s", item.index, item.filename, e)
+                    return item, None, InternalError(f"OCR extraction failed: {str(e)}"), time.perf_counter() - t0
+
+        now = datetime.now()
+        job_rows: List[Dict[str, Any]] = []
+        result_rows: List[Dict[str, Any]] = []
+        completed: List[Tuple[int, Dict[str, Any]]] = []
+        hashes: List[Tuple[str, str]] = []
+        # Catches the same receipt photographed twice within this batch
+        batch_tree = BKTree()
+
+        tasks = [asyncio.create_task(run_one(item)) for item in uploads]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item, output, error, elapsed = await next_done
+                result = output.result if output is not None else None
+                phash = output.phash if output is not None else None
+                if result is not None and phash and duplicate_index.enabled:
+                    earlier = await duplicate_index.find(db, user_id, phash)
+                    in_batch = batch_tree.search(int(phash, 16), duplicate_index.threshold)
+                    if earlier is not None or in_batch:
+                        flag_duplicate(result)
+                    batch_tree.add(int(phash, 16), item.job_id)
+                job_rows.append({
+                    "id": item.job_id,
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "original_filename": item.filename or "unknown",
+                    "file_path": item.stored_path or f"memory://{item.job_id}",
+                    "file_size": len(item.data),
+                    "content_type": item.content_type,
+                    "profile": profile,
+                    "hints": (hints.model_dump(exclude_none=True) if hints else None),
+                    "status": "completed" if error is None else "failed",
+                    "saved_to_transactions": False,
+                    "created_at": now,
+                    "started_at": now,
+                    "completed_at": datetime.now(),
+                    "error_message": error.message if error is not None else None,
+                    "retry_count": 0,
+                    "phash": phash,
+                })
+                if phash and error is None:
+                    hashes.append((item.job_id, phash))
+                record = {
+                    "type": "result",
+                    "index": item.index,
+                    "job_id": item.job_id,
+                    "filename": item.filename,
+                    "processing_time_ms": round(elapsed * 1000, 1),
+                }
+                if error is None:
+                    result_rows.append(self._result_row(item.job_id, result, elapsed, output))
+                    completed.append((item.index, result))
+                    record["status"] = "completed"
+                    record["result"] = self._build_result_payload(result).model_dump(mode="json")
+                else:
+                    record["status"] = "failed"
+                    record["error"] = {"code": error.code, "message": error.message}
+                yield record
+        finally:
+            # Client went away (or we failed): don't leave pipeline tasks running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        # One round of bulk inserts for the whole batch
+        persisted = False
+        t_persist = time.perf_counter()
+        try:
+            await db.execute(insert(OcrExpenseJob), job_rows)
+            if result_rows:
+                await db.execute(insert(OcrExpenseResult), result_rows)
+            await db.commit()
+            persisted = True
+            for job_id, phash in hashes:
+                duplicate_index.add(user_id, phash, job_id)
+            logger.info(
+                "[OCR] Batch persisted %d jobs / %d results in %.3fs",
+                len(job_rows), len(result_rows), time.perf_counter() - t_persist,
+            )
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Failed to persist OCR batch: {e}")
+
+        if persisted and completed:
+            completed.sort(key=lambda entry: entry[0])
+            await self._save_batch_context_to_session(
+                db, session_id, user_id, [result for _, result in completed]
+            )
+            await self._publish_session_context(session_id, completed[-1][1])
+
+        yield {
+            "type": "summary",
+            "total": len(uploads),
+            "completed": len(completed),
+            "failed": len(uploads) - len(completed),
+            "persisted": persisted,
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 1),
+        }
+
+    async def _lookup_cached_result(
+        self,
+        db: AsyncSession,
+        content_hash: str,
+    ) -> Optional[Tuple[Dict[str, Any], float, Optional[str]]]:
+        """
+        Find a previous result for content_hash: Redis first, then the indexed
+        ocr_expense_jobs.content_hash column (repopulating Redis on a DB hit).
+        Returns (result, original processing seconds, phash of the upload) or None.
+        """
+        cached = await ocr_result_cache.get(content_hash)
+        if cached is not None:
+            return cached["result"], float(cached.get("processing_time") or 0.0), cached.get("phash")
+        try:
+            result = await db.execute(
+                select(OcrExpenseResult, OcrExpenseJob.phash)
+                .join(OcrExpenseJob, OcrExpenseJob.id == OcrExpenseResult.job_id)
+                .where(OcrExpenseJob.content_hash == content_hash, OcrExpenseJob.status == "completed")
+                .order_by(OcrExpenseJob.created_at.desc())
+                .limit(1)
+            )
+            row = result.first()
+        except Exception as e:
+            logger.warning("[OCR] Result cache DB lookup failed: %s", e)
+            return None
+        if row is None:
+            return None
+        ocr_result, phash = row
+        final_result_data = self._result_row_to_dict(ocr_result)
+        await ocr_result_cache.set(content_hash, final_result_data, ocr_result.processing_time, phash)
+        return final_result_data, float(ocr_result.processing_time or 0.0), phash
+
+    async def _ingest_upload(self, file: UploadFile, file_id: str) -> Tuple[bytes, str]:
+        """Read the upload into memory; spool to disk only when audit retention is on."""
+        t0 = time.perf_counter()
+        data = await self._read_upload(file)
+        filename_on_disk = f"{file_id}{self._get_file_extension(file.filename)}"
+        stored_path = f"memory://{filename_on_disk}"
+        if self.retain_uploads:
+            # Opt-in audit retention: keep a copy on disk
+            file_path = self.upload_dir / filename_on_disk
+            await self._spool_to_disk(data, file_path)
+            stored_path = str(file_path)
+        logger.info("[OCR] Read upload in %.3fs (bytes=%d, retained=%s)", time.perf_counter() - t0, len(data), self.retain_uploads)
+        return data, stored_path
+
+    async def run_pipeline(
+        self,
+        data: bytes,
+        content_type: str,
+        hints: Optional[OcrExpenseHints] = None,
+        user_id: Optional[str] = None,
+        client: Any = None,
+    ) -> PipelineOutput:
+        """Run one document through the pipeline without a job or DB access (offline tools, e.g. backfill)."""
+        return await self._run_pipeline(data, content_type, hints, user_id=user_id, client=client)
+
+    def result_row(
+        self,
+        job_id: str,
+        final_result_data: Dict[str, Any],
+        processing_seconds: float,
+        output: Optional[PipelineOutput] = None,
+    ) -> Dict[str, Any]:
+        """OcrExpenseResult column values for a bulk insert (see _result_row)."""
+        return self._result_row(job_id, final_result_data, processing_seconds, output)
+
+    async def _run_pipeline(
+        self,
+        data: bytes,
+        content_type: str,
+        hints: Optional[OcrExpenseHints] = None,
+        progress: Optional[Callable[[str], Awaitable[None]]] = None,
+        db: Optional[AsyncSession] = None,
+        user_id: Optional[str] = None,
+        client: Any = None,
+    ) -> PipelineOutput:
+        """
+        Preprocess -> Gemini -> post-process -> validate.
+
+        When db and user_id are given, the receipt's perceptual hash is checked
+        against the user's earlier receipts: a near match is flagged with
+        possible_duplicate, and with OCR_DUPLICATE_POLICY=reuse the earlier
+        extraction is returned without calling Gemini.
+
+        client replaces gemini_ocr_client (same extract_expense_data /
+        prompt_version interface), e.g. the backfill CLI's local stub.
+        """
+        client = client or gemini_ocr_client
+        # Preprocessing -> outputs JPEG bytes
+        if progress:
+            await progress("preprocessing")
+        t1 = time.perf_counter()
+        preprocessed = await preprocessor.preprocess_bytes(
+            data,
+            content_type,
+            first_page=hints.first_page if hints else None,
+            last_page=hints.last_page if hints else None,
+        )
+        processed_image_bytes = preprocessed.image_bytes
+        extra_pages = preprocessed.pages[1:]
+        mime_type = "image/jpeg"
+        logger.info("[OCR] Preprocessing done in %.3fs (bytes=%d, mime=%s, pages=%d, tiles=%d)", time.perf_counter() - t1, len(processed_image_bytes or b""), mime_type, 1 + len(extra_pages), len(preprocessed.tiles))
+
+        duplicate = None
+        if db is not None and user_id:
+            duplicate = await duplicate_index.find(db, user_id, preprocessed.phash)
+        if duplicate is not None and duplicate_index.policy == "reuse":
+            prior = await self._load_job_result(db, duplicate.job_id)
+            if prior is not None:
+                logger.info("[OCR] Reusing extraction of job=%s (distance=%d)", duplicate.job_id, duplicate.distance)
+                return PipelineOutput(flag_duplicate(prior), preprocessed.phash, duplicate)
+        
+        # LLM Call
+        if progress:
+            await progress("extracting")
+        final_result_data = raw = None
+        if self.tiered and preprocessed.draft_bytes:
+            final_result_data, raw = await self._extract_draft_tier(preprocessed.draft_bytes, hints, user_id, client)
+
+        if final_result_data is None:
+            t2 = time.perf_counter()
+            if preprocessed.tiles:
+                # Tall receipt: extract every tile concurrently, then stitch the partial results
+                tile_count = len(preprocessed.tiles)
+                tile_results = await asyncio.gather(*(
+                    client.extract_expense_data(
+                        image_bytes=tile_bytes,
+                        hints=(hints.model_dump() if hints else None),
+                        tile=(index, tile_count, preprocessed.tile_axis),
+                        user_id=user_id,
+                    )
+                    for index, tile_bytes in enumerate(preprocessed.tiles)
+                ), return_exceptions=True)
+                llm_response_json = self._merge_tiles(tile_results)
+            else:
+                llm_response_json = await client.extract_expense_data(
+                    image_bytes=processed_image_bytes,
+                    hints=(hints.model_dump() if hints else None),
+                    extra_pages=extra_pages or None,
+                    user_id=user_id,
+                )
+            elapsed = time.perf_counter() - t2
+            if self.tiered:
+                metrics.observe("ocr.tier.full", elapsed)
+            logger.info("[OCR] Gemini OCR call done in %.3fs (tiles=%d)", elapsed, len(preprocessed.tiles))
+
+            # Post-processing (normalizes and validates against the schema in one pass)
+            if progress:
+                await progress("postprocessing")
+            t3 = time.perf_counter()
+            final_result_data = self._post_process(llm_response_json)
+            raw = llm_response_json
+            logger.info("[OCR] Post-processing done in %.3fs", time.perf_counter() - t3)
+
+        if preprocessed.quality is not None:
+            attach_quality(final_result_data, preprocessed.quality, preprocessed.quality_issue)
+        if duplicate is not None:
+            flag_duplicate(final_result_data)
+        return PipelineOutput(
+            final_result_data, preprocessed.phash, duplicate, raw=raw, prompt_version=client.prompt_version
+        )
+
+    def _merge_tiles(self, tile_results: List[Any]) -> Dict[str, Any]:
+        """Merge the tiles that were extracted; a partial receipt is flagged for review (all failed: raise)."""
+        failed = [r for r in tile_results if isinstance(r, BaseException)]
+        if len(failed) == len(tile_results):
+            raise failed[0]
+        merged = merge_tile_results([r for r in tile_results if isinstance(r, dict)])
+        if failed:
+            metrics.incr("ocr.tile.failed", len(failed))
+            logger.warning("[OCR] %d/%d tiles failed, merging the rest: %s", len(failed), len(tile_results), failed[0])
+            meta = merged.setdefault("meta", {})
+            meta["needs_review"] = True
+            meta["warnings"] = ["partial_tile_extraction", *(meta.get("warnings") or [])]
+        return merged
+
+    def _post_process(self, llm_response_json: Any) -> Dict[str, Any]:
+        """Apply post-processing rules to a Gemini response."""
+        # Prefer apply_rules for backward-compatible tests; then post_process
+        if hasattr(post_processor, "apply_rules") and callable(getattr(post_processor, "apply_rules", None)):
+            final_result_data = post_processor.apply_rules(
+                llm_response_json,
+                {"timezone": self.default_timezone}
+            )
+        elif hasattr(post_processor, "post_process") and callable(getattr(post_processor, "post_process", None)):
+            final_result_data = post_processor.post_process(
+                llm_response_json,
+                hints={"timezone": self.default_timezone}
+            )
+        else:
+            final_result_data = llm_response_json
+
+        # Ensure dict output; if mocks return non-dict, fallback to raw llm json
+        if not isinstance(final_result_data, dict):
+            final_result_data = llm_response_json if isinstance(llm_response_json, dict) else {}
+        return final_result_data
+
+    async def _extract_draft_tier(
+        self,
+        draft_bytes: bytes,
+        hints: Optional[OcrExpenseHints] = None,
+        user_id: Optional[str] = None,
+        client: Any = None,
+    ) -> Tuple[Optional[Dict[str, Any]], Any]:
+        """
+        First OCR tier: low-resolution image (and the lighter model, if configured).
+
+        Returns (post-processed result, raw Gemini JSON) when the result can be
+        trusted, or (None, None) to escalate to the full-resolution pass. Per-tier counts and latency are
+        recorded under ocr.tier.* for tuning.
+        """
+        t0 = time.perf_counter()
+        try:
+            llm_response_json = await (client or gemini_ocr_client).extract_expense_data(
+                image_bytes=draft_bytes,
+                hints=(hints.model_dump() if hints else None),
+                model=self.tier1_model,
+                user_id=user_id,
+            )
+            result = self._post_process(llm_response_json)
+            reason = self._escalation_reason(result, hints)
+        except GeminiBusyError:
+            raise  # escalating would only queue a second, larger call behind the same quota
+        except Exception as e:
+            logger.warning("[OCR] Tier-1 extraction failed, escalating: %s", e)
+            result, reason = None, "error"
+        metrics.observe("ocr.tier.draft", time.perf_counter() - t0)
+
+        if reason is None:
+            metrics.incr("ocr.tier.draft.accepted")
+        else:
+            metrics.incr("ocr.tier.escalated")
+            metrics.incr(f"ocr.tier.escalated.{reason}")
+        accepted = metrics.get_counter("ocr.tier.draft.accepted")
+        metrics.set_gauge("ocr.tier.draft.hit_rate", accepted / (accepted + metrics.get_counter("ocr.tier.escalated")))
+        logger.info(
+            "[OCR] Tier-1 pass done in %.3fs (%s)",
+            time.perf_counter() - t0, "accepted" if reason is None else f"escalated: {reason}",
+        )
+        return (result, llm_response_json) if reason is None else (None, None)
+
+    def _escalation_reason(self, result: Dict[str, Any], hints: Optional[OcrExpenseHints] = None) -> Optional[str]:
+        """Why a tier-1 result should be redone at full resolution (None = keep it)."""
+        if not schema_validator.is_valid(result):
+            return "schema"
+        meta = result.get("meta") or {}
+        if ((result.get("amount") or {}).get("value") or 0) <= 0 or "amount_seems_high" in (meta.get("warnings") or []):
+            return "implausible_total"
+        if hints is not None and hints.items_expected and not result.get("items"):
+            return "missing_items"
+        if meta.get("needs_review"):
+            return "needs_review"
+        return None
+
+    def _quality_rejection(self, error: ImageQualityError) -> LowImageQualityError:
+        """Map a quality-gate rejection from the preprocessor to the API error."""
+        logger.info("[OCR] Rejected by quality gate: %s %s", error.reason, error.scores)
+        return LowImageQualityError(
+            QUALITY_MESSAGES[error.reason],
+            detail={"reason": error.reason, "scores": error.scores},
+        )
+
+    def _busy_rejection(self, error: GeminiBusyError) -> ServiceBusyError:
+        """Map an exhausted Gemini quota (or persistent 429/503) to a retryable 503."""
+        logger.warning("[OCR] Gemini busy: %s", error)
+        metrics.incr("ocr.gemini.busy")
+        return ServiceBusyError(
+            "Hệ thống OCR đang quá tải, vui lòng thử lại sau ít phút.",
+            retry_after=max(1, round(error.retry_after)),
+        )
+
+    async def _load_job_result(self, db: AsyncSession, job_id: str) -> Optional[Dict[str, Any]]:
+        """Result dict of an earlier job (deep-copied so callers may annotate it)."""
+        result = await db.execute(select(OcrExpenseResult).where(OcrExpenseResult.job_id == job_id).limit(1))
+        ocr_result = result.scalar_one_or_none()
+        if ocr_result is None:
+            return None
+        return copy.deepcopy(self._result_row_to_dict(ocr_result))
+
+    def _add_result_record(
+        self,
+        db: AsyncSession,
+        job_id: str,
+        final_result_data: Dict[str, Any],
+        processing_seconds: float,
+        output: Optional[PipelineOutput] = None,
+    ) -> OcrExpenseResult:
+        """Add the OcrExpenseResult row for a job (caller commits)."""
+        ocr_result = OcrExpenseResult(**self._result_row(job_id, final_result_data, processing_seconds, output))
+        db.add(ocr_result)
+        return ocr_result
+
+    def _result_row(
+        self,
+        job_id: str,
+        final_result_data: Dict[str, Any],
+        processing_seconds: float,
+        output: Optional[PipelineOutput] = None,
+    ) -> Dict[str, Any]:
+        """
+        Column values of an OcrExpenseResult row (shared by ORM add and bulk insert).
+
+        The raw Gemini JSON of the run (output) is archived with the row for
+        offline reprocessing; reused results (cache, duplicate reuse) have none.
+        """
+        raw = output.raw if output is not None else None
+        return {
+            "id": str(uuid.uuid4()),
+            "job_id": job_id,
+            "transaction_date": final_result_data.get("transaction_date"),
+            "amount_value": final_result_data.get("amount", {}).get("value"),
+            "amount_currency": final_result_data.get("amount", {}).get("currency"),
+            "category_code": final_result_data.get("category", {}).get("code"),
+            "category_name": final_result_data.get("category", {}).get("name"),
+            "items_json": final_result_data.get("items"),
+            "meta_json": final_result_data.get("meta"),
+            "processing_time": processing_seconds,
+            "word_count": self._estimate_word_count(final_result_data),
+            "raw_response": encode_raw_response(raw),
+            "prompt_version": output.prompt_version if raw is not None else None,
+        }
+
+    def _build_job_response(
+        self,
+        job: OcrExpenseJob,
+        final_result_data: Optional[Dict[str, Any]] = None,
+    ) -> OcrExpenseJobResponse:
+        """Build the API response for a job, attaching the structured result if present."""
+        # In unit tests with mocked DB, created_at might be None. Ensure a value.
+        if not getattr(job, "created_at", None):
+            job.created_at = datetime.now()
+
+        # Base response
+        base_response = OcrExpenseJobResponse(
+            job_id=job.id,
+            session_id=job.session_id,
+            user_id=job.user_id,
+            filename=job.original_filename,
+            status=job.status,
+            created_at=job.created_at,
+            error_message=job.error_message if job.status == "failed" else None,
+        )
+        if final_result_data is None:
+            return base_response
+
+        # Always attach structured result in response
+        base_response.result = self._build_result_payload(final_result_data)
+
+        return base_response
+
+    def _build_result_payload(self, final_result_data: Dict[str, Any]):
+        """Convert a validated result dict to the OcrExpenseResult response schema."""
+        # One model_validate over the whole result; per-section construction below only on failure (reports the error)
+        payload = schema_validator.build_model(final_result_data)
+        if payload is not None:
+            return payload
+        from app.modules.ocr_expense.schemas import (
+            OcrExpenseResult as OcrExpenseResultSchema,
+            OcrExpenseAmount as OcrExpenseAmountSchema,
+            OcrExpenseCategory as OcrExpenseCategorySchema,
+            OcrExpenseItem as OcrExpenseItemSchema,
+            OcrExpenseMeta as OcrExpenseMetaSchema,
+        )
+        amount_data = final_result_data.get("amount") or {}
+        category_data = final_result_data.get("category") or {}
+        items_data = final_result_data.get("items") or []
+        meta_data = final_result_data.get("meta") or {}
+
+        return OcrExpenseResultSchema(
+            transaction_date=final_result_data.get("transaction_date"),
+            amount=OcrExpenseAmountSchema(**amount_data),
+            category=OcrExpenseCategorySchema(**category_data),
+            items=[OcrExpenseItemSchema(**it) for it in items_data] or None,
+            meta=OcrExpenseMetaSchema(**meta_data),
+        )
+
+    def _result_row_to_dict(self, ocr_result: OcrExpenseResult) -> Dict[str, Any]:
+        """Convert an OcrExpenseResult row back to the result dict shape."""
+        return {
+            "transaction_date": ocr_result.transaction_date,
+            "amount": {
+                "value": ocr_result.amount_value,
+                "currency": ocr_result.amount_currency
+            },
+            "category": {
+                "code": ocr_result.category_code,
+                "name": ocr_result.category_name
+            },
+            "items": ocr_result.items_json,
+            "meta": ocr_result.meta_json
+        }
+
     async def get_ocr_context_by_session(
         self,
         db: AsyncSession,
         session_id: str
     ) -> Optional[Dict[str, Any]]:
         """
-        Get OCR context for a session.
+        Get OCR context for a session (latest result, cached per session).
         """
+        entry = await self._load_session_context(db, session_id)
+        return entry["result"] if entry else None
+
+    async def get_ocr_prompt_context(
+        self,
+        db: AsyncSession,
+        session_id: str
+    ) -> Optional[str]:
+        """
+        Get the session's OCR context as a ready-to-append system prompt snippet.
+        """
+        entry = await self._load_session_context(db, session_id)
+        return entry["prompt"] if entry else None
+
+    async def _load_session_context(
+        self,
+        db: AsyncSession,
+        session_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Cached {"result", "prompt"} for the session, filled from the DB on a miss (None on DB errors)."""
+        entry = await session_context_cache.get(session_id)
+        if entry is not None:
+            return entry
         try:
             # Get latest OCR result for this session
             # Use ORM model (DB) not Pydantic schema
@@ -237,28 +944,20 @@ class OcrExpenseService:
                 if asyncio.iscoroutine(ocr_result_or_coro)
                 else ocr_result_or_coro
             )
-            
-            if not ocr_result:
-                return None
-                
-            return {
-                "transaction_date": ocr_result.transaction_date,
-                "amount": {
-                    "value": ocr_result.amount_value,
-                    "currency": ocr_result.amount_currency
-                },
-                "category": {
-                    "code": ocr_result.category_code,
-                    "name": ocr_result.category_name
-                },
-                "items": ocr_result.items_json,
-                "meta": ocr_result.meta_json
-            }
-            
         except Exception as e:
             logger.error(f"Failed to get OCR context: {e}")
             return None
 
+        ocr_data = self._result_row_to_dict(ocr_result) if ocr_result else None
+        entry = {"result": ocr_data, "prompt": self._render_prompt_context(ocr_data) if ocr_data else None}
+        # Sessions without OCR are cached too (negative entry); never overwrite a newer write-through
+        await session_context_cache.set(session_id, entry["result"], entry["prompt"], only_if_missing=True)
+        return entry
+
+    async def _publish_session_context(self, session_id: str, ocr_data: Dict[str, Any]) -> None:
+        """Write-through of a committed extraction: it is now the session's latest OCR context."""
+        await session_context_cache.set(session_id, ocr_data, self._render_prompt_context(ocr_data))
+
     async def _save_ocr_context_to_session(
         self,
         db: AsyncSession,
@@ -271,33 +970,7 @@ class OcrExpenseService:
         """
         try:
             # Build OCR context message
-            # Normalize simple string fields to avoid accidental duplicated leading chars/whitespaces
-            transaction_date = (ocr_data.get('transaction_date') or '').strip()
-            amount_value = ocr_data.get('amount', {}).get('value', 0)
-            amount_currency = (ocr_data.get('amount', {}).get('currency', 'VND') or '').strip()
-            category_name = (ocr_data.get('category', {}).get('name') or '').strip()
-            category_code = (ocr_data.get('category', {}).get('code') or '').strip()
-
-            context_parts = [
-                f"📄 OCR Result:",
-                f"📅 Date: {transaction_date}",
-                f"💰 Amount: {amount_value:,} {amount_currency}",
-                f"🏷️ Category: {category_name} ({category_code})"
-            ]
-            
-            if ocr_data.get('items'):
-                context_parts.append("🛒 Items:")
-                for item in ocr_data.get('items', []):
-                    item_name = (item.get('name') or '').strip()
-                    qty_value = item.get('qty', 1)
-                    context_parts.append(f"  - {item_name} (qty: {qty_value})")
-            
-            if ocr_data.get('meta', {}).get('warnings'):
-                context_parts.append("⚠️ Warnings:")
-                for warning in ocr_data.get('meta', {}).get('warnings', []):
-                    context_parts.append(f"  - {warning}")
-            
-            context_message = "\n".join(context_parts)
+            context_message = self._render_ocr_context(ocr_data)
             
             # Save as system message to session
             metadata_payload = {"ocr_context": True, "ocr_data": ocr_data}
@@ -326,9 +999,86 @@ class OcrExpenseService:
         except Exception as e:
             logger.error(f"Failed to save OCR context: {e}")
 
+    async def _save_batch_context_to_session(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        user_id: str,
+        results: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Save a batch of OCR results to the session as a single system message.
+        """
+        if len(results) == 1:
+            await self._save_ocr_context_to_session(db, session_id, user_id, results[0])
+            return
+        try:
+            total = sum((r.get("amount") or {}).get("value") or 0 for r in results)
+            header = f"📚 OCR Batch: {len(results)} receipts, total {total:,} VND"
+            context_message = "\n\n".join([header] + [self._render_ocr_context(r) for r in results])
+            metadata_payload = {
+                "ocr_context": True,
+                "ocr_batch": True,
+                # Latest receipt keeps the single-result shape readers expect
+                "ocr_data": results[-1],
+                "ocr_data_list": results,
+            }
+            await save_message(db, session_id, user_id, "system", context_message, metadata_payload)
+            logger.info(f"Saved OCR batch context ({len(results)} results) to session {session_id}")
+        except Exception as e:
+            logger.error(f"Failed to save OCR batch context: {e}")
+
+    def _render_prompt_context(self, ocr_data: Dict[str, Any]) -> str:
+        """Render an OCR result as the snippet appended to the chat system prompt."""
+        amount = ocr_data.get('amount') or {}
+        category = ocr_data.get('category') or {}
+        items = ocr_data.get('items') or []
+        ocr_info = f"""
+OCR Context Available:
+- Transaction Date: {ocr_data.get('transaction_date')}
+- Amount: {amount.get('value') or 0:,} {amount.get('currency', 'VND')}
+- Category: {category.get('name')} ({category.get('code')})
+- Items: {len(items)} items
+"""
+        if items:
+            ocr_info += "\nItems:\n"
+            for item in items:
+                ocr_info += f"- {item.get('name')} (qty: {item.get('qty', 1)})\n"
+        return f"\n\n{ocr_info}\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."
+
+    def _render_ocr_context(self, ocr_data: Dict[str, Any]) -> str:
+        """Render an OCR result as the human-readable context text stored in the session."""
+        # Normalize simple string fields to avoid accidental duplicated leading chars/whitespaces
+        transaction_date = (ocr_data.get('transaction_date') or '').strip()
+        amount_value = ocr_data.get('amount', {}).get('value', 0)
+        amount_currency = (ocr_data.get('amount', {}).get('currency', 'VND') or '').strip()
+        category_name = (ocr_data.get('category', {}).get('name') or '').strip()
+        category_code = (ocr_data.get('category', {}).get('code') or '').strip()
+
+        context_parts = [
+            f"📄 OCR Result:",
+            f"📅 Date: {transaction_date}",
+            f"💰 Amount: {amount_value:,} {amount_currency}",
+            f"🏷️ Category: {category_name} ({category_code})"
+        ]
+        
+        if ocr_data.get('items'):
+            context_parts.append("🛒 Items:")
+            for item in ocr_data.get('items', []):
+                item_name = (item.get('name') or '').strip()
+                qty_value = item.get('qty', 1)
+                context_parts.append(f"  - {item_name} (qty: {qty_value})")
+        
+        if ocr_data.get('meta', {}).get('warnings'):
+            context_parts.append("⚠️ Warnings:")
+            for warning in ocr_data.get('meta', {}).get('warnings', []):
+                context_parts.append(f"  - {warning}")
+        
+        return "\n".join(context_parts)
+
     def _validate_file(self, file: UploadFile) -> None:
         """Validate uploaded file."""
-        logger.info(f"Validating file: filename={file.filename}, content_type={file.content_type}, size={file.size}")
+        logger.info(f"Validating file: filename={file.filename}, content_type={file.content_type}, size={getattr(file, 'size', None)}")
         
         if not file.filename:
             raise FileValidationError("No filename provided")
@@ -337,18 +1087,36 @@ class OcrExpenseService:
             logger.error(f"File content_type '{file.content_type}' not in allowed_types: {self.allowed_types}")
             raise UnsupportedMediaTypeError(f"Unsupported media type: {file.content_type}")
 
-    async def _save_file(self, file: UploadFile, file_path: Path) -> None:
-        """Save uploaded file to disk."""
+    async def _read_upload(self, file: UploadFile) -> bytes:
+        """Read the upload in chunks, aborting as soon as max_file_size is exceeded."""
+        declared_size = getattr(file, "size", None)
+        if isinstance(declared_size, int) and declared_size > self.max_file_size:
+            raise FileValidationError(f"File size exceeds limit: {self.max_file_size} bytes")
         try:
-            with open(file_path, 'wb') as f:
-                content = await file.read()
-                f.write(content)
-            if len(content) > self.max_file_size:
-                file_path.unlink(missing_ok=True)
-                raise FileValidationError(f"File size exceeds limit: {self.max_file_size} bytes")
+            chunks: List[bytes] = []
+            total = 0
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > self.max_file_size:
+                    raise FileValidationError(f"File size exceeds limit: {self.max_file_size} bytes")
+                chunks.append(chunk)
+                if len(chunk) < self.chunk_size:
+                    # Short read: the spooled upload is exhausted
+                    break
+            return chunks[0] if len(chunks) == 1 else b"".join(chunks)
         except FileValidationError:
-            # Re-raise validation error without wrapping
             raise
+        except Exception as e:
+            raise InternalError(f"Failed to read upload: {str(e)}")
+
+    async def _spool_to_disk(self, data: bytes, file_path: Path) -> None:
+        """Write upload bytes to disk (audit retention only)."""
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            await asyncio.to_thread(file_path.write_bytes, data)
         except Exception as e:
             raise InternalError(f"Failed to save file: {str(e)}")
 
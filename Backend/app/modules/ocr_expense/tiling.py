@@ -0,0 +1,142 @@
+"""
+Tiling for tall receipts.
+
+Images whose long/short side ratio exceeds OCR_TILE_ASPECT_THRESHOLD are not
+squeezed into a single OCR_MAX_DIMENSION frame (which leaves text columns a
+few pixels wide). Instead the short side is kept up to OCR_MAX_DIMENSION and
+the long side is cut into overlapping tiles of at most OCR_MAX_DIMENSION.
+Each tile is extracted separately and the partial results are merged:
+items are concatenated with the overlap de-duplicated, and the grand total is
+taken from the last tile that reports one.
+"""
+
+from __future__ import annotations
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Items compared at a tile seam: the overlap never holds more lines than this
+_MAX_SEAM_ITEMS = 8
+
+
+def needs_tiling(size: Tuple[int, int], aspect_threshold: float) -> bool:
+    width, height = size
+    if aspect_threshold <= 0 or min(width, height) == 0:
+        return False
+    return max(width, height) / min(width, height) > aspect_threshold
+
+
+def working_size(
+    size: Tuple[int, int],
+    max_dim: int,
+    overlap: float,
+    max_tiles: int,
+) -> Tuple[int, int]:
+    """Size a tall image is scaled to before tiling: short side <= max_dim, long side fits max_tiles tiles."""
+    width, height = size
+    long_side, short_side = max(width, height), min(width, height)
+    step = max_dim * (1 - overlap)
+    max_long = max_dim + step * (max(1, max_tiles) - 1)
+    scale = min(1.0, max_dim / short_side, max_long / long_side)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def tile_spans(length: int, tile_len: int, overlap: float) -> List[Tuple[int, int]]:
+    """[start, end) spans of tile_len along an axis, consecutive tiles sharing `overlap` of a tile."""
+    if length <= tile_len:
+        return [(0, length)]
+    step = max(1, int(tile_len * (1 - overlap)))
+    spans = []
+    start = 0
+    while start + tile_len < length:
+        spans.append((start, start + tile_len))
+        start += step
+    # Last tile is aligned to the end so it is full-size
+    spans.append((length - tile_len, length))
+    return spans
+
+
+def tile_axis(size: Tuple[int, int]) -> str:
+    """Direction split_into_tiles cuts an image of this size: vertical (top-to-bottom) or horizontal (left-to-right)."""
+    width, height = size
+    return "vertical" if height >= width else "horizontal"
+
+
+def split_into_tiles(image: Image.Image, tile_len: int, overlap: float) -> List[Image.Image]:
+    """Cut an image into overlapping tiles along its long axis (top-to-bottom / left-to-right)."""
+    width, height = image.size
+    if tile_axis(image.size) == "vertical":
+        return [image.crop((0, start, width, end)) for start, end in tile_spans(height, tile_len, overlap)]
+    return [image.crop((start, 0, end, height)) for start, end in tile_spans(width, tile_len, overlap)]
+
+
+def _item_key(item: Dict[str, Any]) -> Tuple[str, Any]:
+    name = unicodedata.normalize("NFC", str(item.get("name") or "")).casefold()
+    name = re.sub(r"[^\w]+", " ", name).strip()
+    return name, item.get("qty") or 1
+
+
+def _seam_overlap(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> int:
+    """Longest run of items ending `previous` that also starts `current` (the tiles' shared band)."""
+    limit = min(len(previous), len(current), _MAX_SEAM_ITEMS)
+    for size in range(limit, 0, -1):
+        if [_item_key(it) for it in previous[-size:]] == [_item_key(it) for it in current[:size]]:
+            return size
+    return 0
+
+
+def merge_tile_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge per-tile extractions (in tile order) into one result."""
+    if not results:
+        return {}
+    if len(results) == 1:
+        return results[0]
+
+    # Items: concatenate, dropping the lines repeated across each seam
+    items: List[Dict[str, Any]] = []
+    for result in results:
+        tile_items = [it for it in (result.get("items") or []) if isinstance(it, dict)]
+        items.extend(tile_items[_seam_overlap(items, tile_items):])
+
+    # Total: the tile that contains the grand-total line (bottom-most tile reporting a non-zero amount)
+    amount: Optional[Dict[str, Any]] = None
+    for result in reversed(results):
+        candidate = result.get("amount") or {}
+        if (candidate.get("value") or 0) > 0:
+            amount = candidate
+            break
+
+    # Date is printed in the header: first tile that has one
+    transaction_date = next((r.get("transaction_date") for r in results if r.get("transaction_date")), None)
+
+    # Category: majority vote across tiles, ties to the tile with the total
+    codes = Counter((r.get("category") or {}).get("code") for r in results if (r.get("category") or {}).get("code"))
+    category = None
+    if codes:
+        top = max(codes.values())
+        winners = {code for code, count in codes.items() if count == top}
+        ordered = list(reversed(results))
+        category = next((r["category"] for r in ordered if (r.get("category") or {}).get("code") in winners), None)
+
+    warnings: List[str] = []
+    for result in results:
+        for warning in (result.get("meta") or {}).get("warnings") or []:
+            if warning not in warnings:
+                warnings.append(warning)
+
+    merged = dict(results[-1])
+    merged.update({
+        "transaction_date": transaction_date,
+        "amount": amount or {"value": 0, "currency": "VND"},
+        "category": category or results[-1].get("category"),
+        "items": items,
+        "meta": {
+            "needs_review": any((r.get("meta") or {}).get("needs_review") for r in results) or amount is None,
+            "warnings": warnings,
+        },
+    })
+    return merged
@@ -1,20 +1,175 @@
 """
 JSON schema validation for OCR expense extraction results.
 Implements validation according to the spec schema.
+
+The schema is compiled once into a generated Python function
+(CompiledSchema): straight-line type/constraint checks per property, with
+the post-processing rules registered per path called inline, so
+normalizing and validating a result is one traversal with no per-call
+regex compilation, imports or strptime.
 """
 
-import json
 import logging
-from typing import Dict, Any, List, Optional
+import re
+from datetime import date
+from typing import Dict, Any, Callable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Returned by a rule (or stands for an absent key): the property/array element is dropped
+MISSING = object()
+
+# (value, context) -> normalized value; keyed by path, e.g. "amount.value" or "items[]"
+Rule = Callable[[Any, Any], Any]
+
+# schema type -> (check expression over {v}, error text)
+_TYPE_CHECKS = {
+    "string": ("isinstance({v}, str)", "must be a string"),
+    "integer": ("isinstance({v}, int) and not isinstance({v}, bool)", "must be an integer"),
+    "number": ("isinstance({v}, (int, float)) and not isinstance({v}, bool)", "must be a number"),
+    "boolean": ("({v} is True or {v} is False)", "must be a boolean"),
+    "object": ("isinstance({v}, dict)", "must be an object"),
+    "array": ("isinstance({v}, list)", "must be an array"),
+}
+
+_DATE_PATTERN = "^\\d{4}-\\d{2}-\\d{2}$"
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+
+def is_valid_date(value: Any) -> bool:
+    """YYYY-MM-DD and an existing calendar date."""
+    if not isinstance(value, str) or len(value) != 10 or not _DATE_RE.match(value):
+        return False
+    try:
+        date(int(value[:4]), int(value[5:7]), int(value[8:]))
+        return True
+    except ValueError:
+        return False
+
+
+class CompiledSchema:
+    """A JSON schema compiled to a single generated function, with per-path normalization rules."""
+
+    def __init__(self, schema: Dict[str, Any], rules: Optional[Dict[str, Rule]] = None):
+        self.rules = rules or {}
+        self._globals: Dict[str, Any] = {"MISSING": MISSING, "is_valid_date": is_valid_date}
+        self._lines: List[str] = []
+        self._counter = 0
+
+        self._emit(0, "def run(data, ctx):")
+        self._emit(1, "errors = []")
+        self._emit(1, "v0 = data")
+        self._node(schema, "", "v0", "data", 1)
+        self._emit(1, "return v0, errors")
+        self.source = "\n".join(self._lines)
+        exec(compile(self.source, "<compiled result schema>", "exec"), self._globals)
+        self._run = self._globals["run"]
+
+    def run(self, data: Any, context: Any = None) -> Tuple[Any, List[str]]:
+        """Normalize (rules) and validate data in one pass; returns (value, errors)."""
+        return self._run(data, context)
+
+    # --- code generation ---
+
+    def _emit(self, indent: int, line: str) -> None:
+        self._lines.append("    " * indent + line)
+
+    def _var(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _const(self, value: Any) -> str:
+        name = self._var("c")
+        self._globals[name] = value
+        return name
+
+    def _node(self, schema: Dict[str, Any], path: str, v: str, where: str, indent: int) -> None:
+        """Emit code that normalizes and checks variable v in place (MISSING = absent/dropped)."""
+        rule = self.rules.get(path)
+        if rule is not None:
+            self._emit(indent, f"{v} = {self._const(rule)}({v}, ctx)")
+        self._emit(indent, f"if {v} is not MISSING:")
+        indent += 1
+        schema_type = schema.get("type")
+        if schema_type not in _TYPE_CHECKS:
+            self._emit(indent, "pass")
+            return
+        check, message = _TYPE_CHECKS[schema_type]
+        self._emit(indent, f"if not ({check.format(v=v)}):")
+        self._emit(indent + 1, f'errors.append(f"{where} {message}")')
+        self._emit(indent, "else:")
+        indent += 1
+        self._emit(indent, "pass")
+        self._checks(schema, v, where, indent)
+        if schema_type == "object":
+            self._object(schema, path, v, where, indent)
+        elif schema_type == "array":
+            self._array(schema, path, v, where, indent)
+
+    def _checks(self, schema: Dict[str, Any], v: str, where: str, indent: int) -> None:
+        def fail(condition: str, message: str) -> None:
+            self._emit(indent, f"if {condition}:")
+            self._emit(indent + 1, f'errors.append(f"{where} {message}")')
+
+        if schema.get("pattern") == _DATE_PATTERN:
+            # The one pattern in the spec: also require a real calendar date
+            fail(f"not is_valid_date({v})", "must be a valid date (YYYY-MM-DD)")
+        elif "pattern" in schema:
+            fail(f"{self._const(re.compile(schema['pattern']))}.search({v}) is None", "must match the pattern")
+        if "enum" in schema:
+            fail(f"{v} not in {self._const(frozenset(schema['enum']))}", f"must be one of: {', '.join(schema['enum'])}")
+        if "minLength" in schema:
+            fail(f"len({v}) < {int(schema['minLength'])}", f"must have at least {schema['minLength']} character(s)")
+        if "minimum" in schema:
+            fail(f"{v} < {schema['minimum']!r}", f"must be >= {schema['minimum']}")
+
+    def _object(self, schema: Dict[str, Any], path: str, v: str, where: str, indent: int) -> None:
+        properties = schema.get("properties", {})
+        prefix = f"{path}." if path else ""
+        base = "" if where == "data" else f"{where}."
+        out = self._var("o")
+        self._emit(indent, f"{out} = {{}}")
+        for name, sub in properties.items():
+            child = self._var("p")
+            self._emit(indent, f"{child} = {v}.get({name!r}, MISSING)")
+            self._node(sub, prefix + name, child, base + name, indent)
+            self._emit(indent, f"if {child} is not MISSING:")
+            self._emit(indent + 1, f"{out}[{name!r}] = {child}")
+        for name in schema.get("required", []):
+            self._emit(indent, f"if {name!r} not in {out}:")
+            self._emit(indent + 1, f'errors.append(f"{base}{name} is required")')
+
+        additional = schema.get("additionalProperties", True)
+        known = self._const(frozenset(properties))
+        key, extra = self._var("k"), self._var("x")
+        self._emit(indent, f"if not {known}.issuperset({v}):")
+        self._emit(indent + 1, f"for {key}, {extra} in {v}.items():")
+        self._emit(indent + 2, f"if {key} in {known}:")
+        self._emit(indent + 3, "continue")
+        if isinstance(additional, dict):
+            self._node(additional, f"{prefix}*", extra, f"{base}{{{key}}}", indent + 2)
+        elif additional is False:
+            # Kept in the output (as before), but reported
+            self._emit(indent + 2, f'errors.append(f"{base}{{{key}}} is not allowed")')
+        self._emit(indent + 2, f"{out}[{key}] = {extra}")
+        self._emit(indent, f"{v} = {out}")
+
+    def _array(self, schema: Dict[str, Any], path: str, v: str, where: str, indent: int) -> None:
+        out, index, item = self._var("a"), self._var("i"), self._var("x")
+        self._emit(indent, f"{out} = []")
+        self._emit(indent, f"for {index}, {item} in enumerate({v}):")
+        self._node(schema.get("items", {}), f"{path}[]", item, f"{where}[{{{index}}}]", indent + 1)
+        self._emit(indent + 1, f"if {item} is not MISSING:")
+        self._emit(indent + 2, f"{out}.append({item})")
+        self._emit(indent, f"{v} = {out}")
+
 
 class OcrSchemaValidator:
     """Validates OCR results against the spec schema."""
     
     def __init__(self):
         self.schema = self._load_schema()
+        self.compiled = CompiledSchema(self.schema)
     
     def _load_schema(self) -> Dict[str, Any]:
         """Load the JSON schema from spec."""
@@ -87,6 +242,12 @@ class OcrSchemaValidator:
                             "items": {
                                 "type": "string"
                             }
+                        },
+                        "quality": {
+                            "type": "object",
+                            "additionalProperties": {
+                                "type": "number"
+                            }
                         }
                     }
                 }
@@ -104,41 +265,7 @@ class OcrSchemaValidator:
             Validation result with success status and errors
         """
         try:
-            errors = []
-            
-            # Basic structure validation
-            if not isinstance(data, dict):
-                errors.append("Data must be an object")
-                return {"valid": False, "errors": errors}
-            
-            # Check required fields
-            required_fields = self.schema["required"]
-            for field in required_fields:
-                if field not in data:
-                    errors.append(f"Missing required field: {field}")
-            
-            # Validate each field
-            if "transaction_date" in data:
-                errors.extend(self._validate_transaction_date(data["transaction_date"]))
-            
-            if "amount" in data:
-                errors.extend(self._validate_amount(data["amount"]))
-            
-            if "category" in data:
-                errors.extend(self._validate_category(data["category"]))
-            
-            if "items" in data:
-                errors.extend(self._validate_items(data["items"]))
-            
-            if "meta" in data:
-                errors.extend(self._validate_meta(data["meta"]))
-            
-            # Check for additional properties
-            allowed_properties = set(self.schema["properties"].keys())
-            for key in data.keys():
-                if key not in allowed_properties:
-                    errors.append(f"Additional property not allowed: {key}")
-            
+            _, errors = self.compiled.run(data)
             return {
                 "valid": len(errors) == 0,
                 "errors": errors
@@ -151,147 +278,36 @@ class OcrSchemaValidator:
                 "errors": [f"Validation error: {str(e)}"]
             }
     
-    def _validate_transaction_date(self, value: Any) -> List[str]:
-        """Validate transaction_date field."""
-        errors = []
-        
-        if not isinstance(value, str):
-            errors.append("transaction_date must be a string")
-            return errors
-        
-        import re
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', value):
-            errors.append("transaction_date must match pattern YYYY-MM-DD")
-        
-        # Check if it's a valid date
-        try:
-            from datetime import datetime
-            datetime.strptime(value, "%Y-%m-%d")
-        except ValueError:
-            errors.append("transaction_date must be a valid date")
-        
-        return errors
-    
-    def _validate_amount(self, value: Any) -> List[str]:
-        """Validate amount field."""
-        errors = []
-        
-        if not isinstance(value, dict):
-            errors.append("amount must be an object")
-            return errors
-        
-        # Check required fields
-        if "value" not in value:
-            errors.append("amount.value is required")
-        elif not isinstance(value["value"], int) or value["value"] < 0:
-            errors.append("amount.value must be a non-negative integer")
-        
-        if "currency" not in value:
-            errors.append("amount.currency is required")
-        elif value["currency"] != "VND":
-            errors.append("amount.currency must be 'VND'")
-        
-        # Check for additional properties
-        allowed_props = {"value", "currency"}
-        for key in value.keys():
-            if key not in allowed_props:
-                errors.append(f"amount.{key} is not allowed")
-        
-        return errors
-    
-    def _validate_category(self, value: Any) -> List[str]:
-        """Validate category field."""
-        errors = []
-        
-        if not isinstance(value, dict):
-            errors.append("category must be an object")
-            return errors
-        
-        # Check required fields
-        if "code" not in value:
-            errors.append("category.code is required")
-        elif value["code"] not in ["FNB", "GRO", "TRA", "UTI", "ENT", "OTH"]:
-            errors.append("category.code must be one of: FNB, GRO, TRA, UTI, ENT, OTH")
-        
-        if "name" not in value:
-            errors.append("category.name is required")
-        elif not isinstance(value["name"], str) or len(value["name"]) < 1:
-            errors.append("category.name must be a non-empty string")
-        
-        # Check for additional properties
-        allowed_props = {"code", "name"}
-        for key in value.keys():
-            if key not in allowed_props:
-                errors.append(f"category.{key} is not allowed")
-        
-        return errors
-    
-    def _validate_items(self, value: Any) -> List[str]:
-        """Validate items field."""
-        errors = []
-        
-        if not isinstance(value, list):
-            errors.append("items must be an array")
-            return errors
-        
-        for i, item in enumerate(value):
-            if not isinstance(item, dict):
-                errors.append(f"items[{i}] must be an object")
-                continue
-            
-            # Check required fields
-            if "name" not in item:
-                errors.append(f"items[{i}].name is required")
-            elif not isinstance(item["name"], str) or len(item["name"]) < 1:
-                errors.append(f"items[{i}].name must be a non-empty string")
-            
-            # Check optional fields
-            if "qty" in item:
-                if not isinstance(item["qty"], int) or item["qty"] < 1:
-                    errors.append(f"items[{i}].qty must be a positive integer")
-            
-            # Check for additional properties
-            allowed_props = {"name", "qty"}
-            for key in item.keys():
-                if key not in allowed_props:
-                    errors.append(f"items[{i}].{key} is not allowed")
-        
-        return errors
-    
-    def _validate_meta(self, value: Any) -> List[str]:
-        """Validate meta field."""
-        errors = []
-        
-        if not isinstance(value, dict):
-            errors.append("meta must be an object")
-            return errors
-        
-        # Check optional fields
-        if "needs_review" in value:
-            if not isinstance(value["needs_review"], bool):
-                errors.append("meta.needs_review must be a boolean")
-        
-        if "warnings" in value:
-            if not isinstance(value["warnings"], list):
-                errors.append("meta.warnings must be an array")
-            else:
-                for i, warning in enumerate(value["warnings"]):
-                    if not isinstance(warning, str):
-                        errors.append(f"meta.warnings[{i}] must be a string")
-        
-        # Check for additional properties
-        allowed_props = {"needs_review", "warnings"}
-        for key in value.keys():
-            if key not in allowed_props:
-                errors.append(f"meta.{key} is not allowed")
-        
-        return errors
-    
     def is_valid(self, data: Dict[str, Any]) -> bool:
         """Check if data is valid according to schema."""
         result = self.validate(data)
         return result["valid"]
 
+    def build_model(self, data: Dict[str, Any]):
+        """
+        Build the OcrExpenseResult response model from a post-processed result.
+
+        One pydantic-core validation of the whole dict instead of a model per
+        section. Returns None when data does not fit the model (callers fall
+        back to the per-section construction, which reports the error).
+        """
+        from pydantic import ValidationError
+        from app.modules.ocr_expense.schemas import OcrExpenseResult
+
+        if not isinstance(data, dict):
+            return None
+        payload = {
+            "transaction_date": data.get("transaction_date"),
+            "amount": data.get("amount") or {},
+            "category": data.get("category") or {},
+            "items": data.get("items") or None,
+            "meta": data.get("meta") or {},
+        }
+        try:
+            return OcrExpenseResult.model_validate(payload)
+        except ValidationError:
+            return None
+
 
 # Global schema validator instance
 schema_validator = OcrSchemaValidator()
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+OCR worker pool: consumes job ids from the Redis queue and runs the OCR pipeline.
+
+Run as a separate process (scale horizontally, independent of API workers):
+    python -m app.modules.ocr_expense.worker --concurrency 4
+    python -m app.modules.ocr_expense.worker --recover   # requeue jobs left by a crashed worker
+                                                         # (only when no other worker is running)
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.core.logging import configure_logging
+from app.db.session import AsyncSessionLocal, engine
+from app.modules.ocr_expense.preprocessing import preprocessor
+from app.modules.ocr_expense.queue import ocr_job_queue
+from app.modules.ocr_expense.service import ocr_expense_service
+from app.redis.client import close as redis_close
+
+logger = logging.getLogger(__name__)
+
+
+async def _consume(worker_id: int, stop: asyncio.Event) -> None:
+    """Single consumer loop: dequeue -> process_job (own DB session) -> ack unless requeued."""
+    while not stop.is_set():
+        try:
+            job_id = await ocr_job_queue.dequeue(timeout=2)
+        except Exception as e:
+            logger.error("[OCR] Worker %d failed to dequeue: %s", worker_id, e)
+            await asyncio.sleep(1)
+            continue
+        if job_id is None:
+            continue
+
+        logger.info("[OCR] Worker %d picked job=%s", worker_id, job_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                requeued = await ocr_expense_service.process_job(db, job_id)
+            # requeue() already released the claim; acking now could drop another worker's claim on the id
+            if not requeued:
+                await ocr_job_queue.ack(job_id)
+        except Exception as e:
+            # Infrastructure failure (DB/Redis): leave the id in the processing list for --recover
+            logger.exception("[OCR] Worker %d crashed on job=%s: %s", worker_id, job_id, e)
+
+
+async def run_worker(concurrency: int, recover: bool = False) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    if recover:
+        recovered = await ocr_job_queue.recover_processing()
+        logger.info("[OCR] Requeued %d unfinished job(s)", len(recovered))
+
+    logger.info("[OCR] Worker pool started (concurrency=%d)", concurrency)
+    consumers = [asyncio.create_task(_consume(i, stop)) for i in range(concurrency)]
+    try:
+        await stop.wait()
+        logger.info("[OCR] Shutting down, waiting for in-flight jobs")
+        await asyncio.gather(*consumers, return_exceptions=True)
+    finally:
+        preprocessor.shutdown()
+        try:
+            await redis_close()
+        except Exception:
+            pass
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR expense worker pool")
+    parser.add_argument("--concurrency", type=int, default=settings.OCR_WORKER_CONCURRENCY,
+                        help="Concurrent jobs per worker process")
+    parser.add_argument("--recover", action="store_true",
+                        help="Requeue job ids left in the processing list before starting")
+    args = parser.parse_args()
+
+    configure_logging(level=settings.LOG_LEVEL)
+    asyncio.run(run_worker(max(1, args.concurrency), recover=args.recover))
+
+
+if __name__ == "__main__":
+    main()
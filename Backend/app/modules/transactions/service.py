@@ -9,7 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.modules.transactions.models import Transaction
 
 
-def _normalize_to_naive_utc(dt: datetime) -> datetime:
+def normalize_to_naive_utc(dt: datetime) -> datetime:
     """Chuẩn hóa datetime về UTC-naive để ghi vào TIMESTAMP WITHOUT TIME ZONE.
     - Nếu dt có tz (aware) → chuyển sang UTC rồi bỏ tzinfo.
     - Nếu dt không có tz (naive) → giả định là giờ Việt Nam (Asia/Ho_Chi_Minh),
@@ -30,7 +30,7 @@ async def create_transaction(session: AsyncSession,
                              category: str | None,
                              note: str | None,
                              occurred_at: datetime) -> Transaction:
-    occurred_at = _normalize_to_naive_utc(occurred_at)
+    occurred_at = normalize_to_naive_utc(occurred_at)
     tx = Transaction(
         user_id=user_id,
         amount=Decimal(str(amount)),
@@ -49,8 +49,8 @@ async def get_summary(session: AsyncSession,
                       user_id: str,
                       start: datetime,
                       end: datetime) -> tuple[float, float, float]:
-    start = _normalize_to_naive_utc(start)
-    end = _normalize_to_naive_utc(end)
+    start = normalize_to_naive_utc(start)
+    end = normalize_to_naive_utc(end)
     cond = and_(
         Transaction.user_id == user_id,
         Transaction.occurred_at >= start,
@@ -0,0 +1,26 @@
+"""add_content_hash_to_ocr_jobs
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ocr_expense_jobs', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_ocr_expense_jobs_content_hash', 'ocr_expense_jobs', ['content_hash'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_ocr_expense_jobs_content_hash', table_name='ocr_expense_jobs')
+    op.drop_column('ocr_expense_jobs', 'content_hash')
@@ -0,0 +1,25 @@
+"""add_phash_to_ocr_jobs
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 64-bit perceptual hash (hex) for near-duplicate detection; loaded per user (ix_ocr_expense_jobs_user_id)
+    op.add_column('ocr_expense_jobs', sa.Column('phash', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('ocr_expense_jobs', 'phash')
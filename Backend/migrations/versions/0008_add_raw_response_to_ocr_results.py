@@ -0,0 +1,27 @@
+"""add_raw_response_to_ocr_results
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # zlib-compressed raw Gemini JSON + prompt version; re-post-processed by app.modules.ocr_expense.reprocess
+    op.add_column('ocr_expense_results', sa.Column('raw_response', sa.LargeBinary(), nullable=True))
+    op.add_column('ocr_expense_results', sa.Column('prompt_version', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('ocr_expense_results', 'prompt_version')
+    op.drop_column('ocr_expense_results', 'raw_response')
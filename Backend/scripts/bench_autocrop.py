@@ -0,0 +1,119 @@
+"""
+Benchmark receipt auto-crop/deskew: upload bytes, pixels and latency with
+OCR_AUTOCROP_ENABLED off vs on.
+
+The default fixture set is synthetic 12MP photos of a receipt on a textured
+table at different sizes, positions and tilts. "tokens" is an estimate of
+Gemini image tokens (258 per 768x768 tile; 258 total for images <= 384px).
+
+Usage (from Backend/):
+    python scripts/bench_autocrop.py
+    python scripts/bench_autocrop.py --images a.jpg b.jpg --repeat 5
+"""
+
+import argparse
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+# (name, paper size as a fraction of the frame, centre offset, tilt degrees)
+FIXTURES = [
+    ("centered_small", (0.3, 0.7), (0.0, 0.0), 0),
+    ("centered_large", (0.5, 0.85), (0.0, 0.0), 0),
+    ("offset_left", (0.3, 0.7), (-0.2, 0.05), 0),
+    ("tilted_3deg", (0.35, 0.75), (0.0, 0.0), 3),
+    ("tilted_-6deg", (0.35, 0.75), (0.05, 0.0), -6),
+]
+
+
+def make_photo(paper_frac, offset, angle, width=3000, height=4000, seed=3) -> bytes:
+    """Receipt with text-like strokes on a noisy table."""
+    rng = random.Random(seed)
+    table = Image.blend(
+        Image.new("RGB", (width, height), (115, 95, 75)),
+        Image.effect_noise((width, height), 40).convert("RGB"),
+        0.3,
+    )
+    paper_w, paper_h = int(width * paper_frac[0]), int(height * paper_frac[1])
+    paper = Image.new("RGB", (paper_w, paper_h), (238, 235, 228))
+    draw = ImageDraw.Draw(paper)
+    for y in range(100, paper_h - 100, 55):
+        x = 60
+        while x < paper_w - 160:
+            w = rng.randint(20, 90)
+            draw.rectangle([x, y, x + w, y + 26], fill=(30, 30, 30))
+            x += w + rng.randint(15, 40)
+    mask = Image.new("L", paper.size, 255)
+    if angle:
+        paper = paper.rotate(angle, expand=True, resample=Image.Resampling.BICUBIC)
+        mask = mask.rotate(angle, expand=True)
+    cx = int(width * (0.5 + offset[0])) - paper.width // 2
+    cy = int(height * (0.5 + offset[1])) - paper.height // 2
+    table.paste(paper, (cx, cy), mask)
+    out = io.BytesIO()
+    table.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def gemini_image_tokens(width: int, height: int) -> int:
+    if width <= 384 and height <= 384:
+        return 258
+    return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+
+
+def run(data: bytes, autocrop: bool, repeat: int):
+    from app.modules.ocr_expense.preprocessing import PreprocessOptions, _preprocess_image_bytes
+    options = replace(PreprocessOptions.from_settings(), autocrop=autocrop, quality_gate="off")
+    latencies, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = _preprocess_image_bytes(data, options)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark receipt auto-crop/deskew")
+    parser.add_argument("--images", nargs="*", help="Image files (default: synthetic fixture set)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.images:
+        cases = [(Path(p).name, Path(p).read_bytes()) for p in args.images]
+    else:
+        cases = [(name, make_photo(frac, offset, angle)) for name, frac, offset, angle in FIXTURES]
+
+    print(f"{'image':<18} {'variant':<8} {'p50 ms':>8} {'localize':>9} {'out KB':>8} {'out px':>11} {'tokens':>7}")
+    totals = {False: [0, 0], True: [0, 0]}
+    for name, data in cases:
+        for autocrop in (False, True):
+            latencies, result = run(data, autocrop, args.repeat)
+            width, height = Image.open(io.BytesIO(result.image_bytes)).size
+            tokens = gemini_image_tokens(width, height)
+            totals[autocrop][0] += len(result.image_bytes)
+            totals[autocrop][1] += tokens
+            print(
+                f"{name[:18]:<18} {'crop' if autocrop else 'full':<8} "
+                f"{statistics.median(latencies) * 1000:>8.1f} {result.timings.get('localize', 0.0) * 1000:>9.1f} "
+                f"{len(result.image_bytes) / 1024:>8.1f} {f'{width}x{height}':>11} {tokens:>7}"
+            )
+    full, crop = totals[False], totals[True]
+    print(
+        f"\ntotal: {full[0] / 1024:.0f} KB -> {crop[0] / 1024:.0f} KB ({1 - crop[0] / full[0]:.0%} fewer bytes), "
+        f"{full[1]} -> {crop[1]} tokens ({1 - crop[1] / full[1]:.0%} fewer)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Benchmark ChatCache against a local Redis: round trips and latency per call,
+and memory per cached session, for the v1 layout (list of ids + one key per
+message, command per step) vs the current single-key v2 layout.
+
+Operations: get_chat_history over a full window (20 messages), add_message,
+clear_session_cache of a full session and get_cache_stats. Round trips are
+counted at the connection (one per packed send), so a pipeline or script
+call counts once. Memory is MEMORY USAGE (SAMPLES 0) summed over every key of
+a full session, plus the used_memory delta over --sessions sessions.
+
+Usage (from Backend/, needs a Redis you can write to; keys use a bench: session prefix):
+    python scripts/bench_chat_cache.py
+    python scripts/bench_chat_cache.py --url redis://localhost:6379/15 --repeat 500 --sessions 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+import redis.asyncio as redis  # noqa: E402
+from redis.asyncio.connection import Connection  # noqa: E402
+
+ROUND_TRIPS = 0
+
+
+class CountingConnection(Connection):
+    async def send_packed_command(self, command, check_health=True):
+        global ROUND_TRIPS
+        ROUND_TRIPS += 1
+        return await super().send_packed_command(command, check_health)
+
+
+class LegacyChatCache:
+    """The v1 ChatCache: one command per step, one key per message."""
+
+    def __init__(self, client, ttl=3600, max_messages=20):
+        self.redis = client
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+    async def get_chat_history(self, session_id, limit=None):
+        ids = await self.redis.lrange(f"chat:session:{session_id}", 0, self.max_messages - 1)
+        messages = []
+        for msg_id in ids:
+            data = await self.redis.get(f"chat:message:{session_id}:{msg_id}")
+            if data:
+                messages.append(json.loads(data))
+        messages.reverse()
+        return messages or None
+
+    async def add_message(self, session_id, message_id, role, content):
+        session_key = f"chat:session:{session_id}"
+        data = {"id": message_id, "role": role, "content": content, "created_at": datetime.now().isoformat()}
+        await self.redis.setex(f"chat:message:{session_id}:{message_id}", self.ttl, json.dumps(data, ensure_ascii=False))
+        await self.redis.lpush(session_key, message_id)
+        await self.redis.ltrim(session_key, 0, self.max_messages - 1)
+        await self.redis.expire(session_key, self.ttl)
+
+    async def clear_session_cache(self, session_id):
+        session_key = f"chat:session:{session_id}"
+        for msg_id in await self.redis.lrange(session_key, 0, -1):
+            await self.redis.delete(f"chat:message:{session_id}:{msg_id}")
+        await self.redis.delete(session_key)
+
+    async def get_cache_stats(self, session_id):
+        session_key = f"chat:session:{session_id}"
+        return {"message_count": await self.redis.llen(session_key), "ttl": await self.redis.ttl(session_key)}
+
+
+async def fill(cache, session_id, count):
+    messages = [
+        (str(uuid.uuid4()), "user" if i % 2 == 0 else "assistant", f"Tin nhắn số {i} " * 8) for i in range(count)
+    ]
+    if hasattr(cache, "fill_history"):
+        # v2 appends only to a cached history (RPUSHX); a miss is filled in one go
+        await cache.fill_history(session_id, messages)
+        return
+    for message in messages:
+        await cache.add_message(session_id, *message)
+
+
+async def session_memory(client, session_id):
+    keys = [key async for key in client.scan_iter(f"chat:*{session_id}*", count=1000)]
+    sizes = [await client.memory_usage(key, samples=0) for key in keys]
+    return len(keys), sum(size or 0 for size in sizes)
+
+
+async def used_memory(client):
+    return (await client.info("memory"))["used_memory"]
+
+
+async def measure(call, repeat, setup=None):
+    global ROUND_TRIPS
+    latencies, trips = [], 0
+    for _ in range(repeat):
+        if setup is not None:
+            await setup()
+        before = ROUND_TRIPS
+        t0 = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - t0)
+        trips += ROUND_TRIPS - before
+    latencies.sort()
+    return trips / repeat, statistics.median(latencies) * 1000, latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+
+
+async def bench(url: str, repeat: int, sessions: int):
+    import app.redis.client as redis_client
+    from app.modules.chat.cache import ChatCache
+
+    client = redis.from_url(url, decode_responses=True, connection_class=CountingConnection)
+    await client.ping()
+    redis_client._client = client  # ChatCache registers its scripts on the shared client
+    current = ChatCache()
+    current.legacy_read = False  # measure the v2 layout on its own
+    implementations = {"v1": LegacyChatCache(client), "v2": current}
+
+    print(f"{'operation':<22} {'impl':<10} {'trips':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    try:
+        for impl_name, cache in implementations.items():
+            session_id = f"bench:{impl_name}:{uuid.uuid4()}"
+            # Load the scripts (first EVALSHA falls back to EVAL) before measuring
+            await fill(cache, f"{session_id}:warmup", 1)
+            await cache.get_chat_history(f"{session_id}:warmup")
+            await cache.clear_session_cache(f"{session_id}:warmup")
+            await fill(cache, session_id, cache.max_messages)
+
+            async def refill(cache=cache, session_id=session_id):
+                await fill(cache, session_id, cache.max_messages)
+
+            results = [
+                ("get_chat_history(20)", await measure(lambda: cache.get_chat_history(session_id), repeat)),
+                ("add_message", await measure(
+                    lambda: cache.add_message(session_id, str(uuid.uuid4()), "user", "Tháng này tôi chi bao nhiêu?"),
+                    repeat,
+                )),
+                ("get_cache_stats", await measure(lambda: cache.get_cache_stats(session_id), repeat)),
+                ("clear_session_cache", await measure(
+                    lambda: cache.clear_session_cache(session_id), max(1, repeat // 10), setup=refill,
+                )),
+            ]
+            for op, (trips, p50, p99) in results:
+                print(f"{op:<22} {impl_name:<10} {trips:>6.1f} {p50:>8.3f} {p99:>8.3f}")
+
+        print(f"\n{'layout':<10} {'keys/session':>13} {'MEMORY USAGE B':>15} {'used_memory B/session':>22}")
+        for impl_name, cache in implementations.items():
+            prefix = f"bench:mem:{impl_name}:{uuid.uuid4()}"
+            before = await used_memory(client)
+            for i in range(sessions):
+                await fill(cache, f"{prefix}:{i}", cache.max_messages)
+            delta = (await used_memory(client) - before) / sessions
+            key_count, usage = await session_memory(client, f"{prefix}:0")
+            print(f"{impl_name:<10} {key_count:>13} {usage:>15} {delta:>22.0f}")
+    finally:
+        keys = [key async for key in client.scan_iter("chat:*bench:*")]
+        if keys:
+            await client.delete(*keys)
+        await client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ChatCache round trips and latency")
+    parser.add_argument("--url", default="redis://localhost:6379/15", help="Redis to benchmark against")
+    parser.add_argument("--repeat", type=int, default=200, help="Calls per operation")
+    parser.add_argument("--sessions", type=int, default=500, help="Full sessions cached for the memory report")
+    args = parser.parse_args()
+    asyncio.run(bench(args.url, args.repeat, args.sessions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Benchmark per-turn chat provider latency: a new httpx.AsyncClient per call
+(the previous ChatProviderClient) vs the shared pooled client.
+
+A chat turn is the completion call plus the parallel suggestion call. The
+stand-in provider is a local uvicorn server over TLS (self-signed certificate
+for 127.0.0.1) that answers /v1/chat/completions after --delay-ms, so the gap
+between the two modes is connection + TLS setup; over a real network each
+setup also costs 2-3 round trips. The TLS run trusts only the bench
+certificate (SSL_CERT_FILE), which understates per-call cost: a fresh client
+normally loads the whole certifi bundle into a new SSL context, which is what
+dominates the --no-tls numbers.
+
+Usage (from Backend/):
+    python scripts/bench_chat_provider.py
+    python scripts/bench_chat_provider.py --turns 200 --sessions 8 --delay-ms 50
+    python scripts/bench_chat_provider.py --no-tls
+"""
+
+import argparse
+import asyncio
+import datetime
+import ipaddress
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+COMPLETION = {"choices": [{"message": {"role": "assistant", "content": "Xin chào! Tôi có thể giúp gì?"}}]}
+MESSAGES = [{"role": "user", "content": "Tháng này tôi chi bao nhiêu cho ăn uống?"}]
+
+
+def write_self_signed_cert(directory: str):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    Path(cert_path).write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    Path(key_path).write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ))
+    return cert_path, key_path
+
+
+def start_provider(delay: float, cert_path=None, key_path=None) -> str:
+    """Run the stand-in provider in a background thread; returns its base URL."""
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def completions(request):
+        await request.body()
+        await asyncio.sleep(delay)
+        return JSONResponse(COMPLETION)
+
+    app = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    config = uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="error", timeout_keep_alive=60,
+        ssl_certfile=cert_path, ssl_keyfile=key_path,
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"{'https' if cert_path else 'http'}://127.0.0.1:{port}"
+
+
+async def per_call_completion(provider) -> dict:
+    """The previous ChatProviderClient.completions: a fresh client (DNS + TCP + TLS) per call."""
+    import httpx
+
+    body = provider._build_body(model="bench", messages=MESSAGES, max_tokens=64, temperature=0.2)
+    async with httpx.AsyncClient(timeout=provider.timeout_seconds) as client:
+        resp = await client.post(provider._endpoint(), headers=provider._headers(), json=body)
+        resp.raise_for_status()
+        return resp.json()
+
+
+async def run_turns(pooled: bool, turns: int, sessions: int):
+    from app.modules.chat.provider import ChatProviderClient, close_http_client
+
+    async def turn() -> float:
+        chat, suggestion = ChatProviderClient(timeout_seconds=60), ChatProviderClient(timeout_seconds=30)
+        t0 = time.perf_counter()
+        if pooled:
+            await asyncio.gather(chat.completions(messages=MESSAGES), suggestion.completions(messages=MESSAGES))
+        else:
+            await asyncio.gather(per_call_completion(chat), per_call_completion(suggestion))
+        return time.perf_counter() - t0
+
+    async def session(n: int):
+        return [await turn() for _ in range(n)]
+
+    per_session = max(1, turns // sessions)
+    try:
+        await turn()  # warm-up (pool: opens the connections reused afterwards)
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(session(per_session) for _ in range(sessions)))
+        elapsed = time.perf_counter() - t0
+    finally:
+        await close_http_client()
+    latencies = sorted(lat for lats in results for lat in lats)
+    return latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call vs pooled chat provider clients")
+    parser.add_argument("--turns", type=int, default=100, help="Chat turns per mode (chat + suggestion call each)")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent sessions sending turns")
+    parser.add_argument("--delay-ms", type=float, default=20, help="Stand-in provider response time")
+    parser.add_argument("--no-tls", action="store_true", help="Plain HTTP stand-in (connection setup only)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path = key_path = None
+        if not args.no_tls:
+            cert_path, key_path = write_self_signed_cert(tmp)
+            os.environ["SSL_CERT_FILE"] = cert_path  # trusted by both modes' default SSL context
+        os.environ["CHAT_API_BASE"] = start_provider(args.delay_ms / 1000, cert_path, key_path)
+        os.environ.setdefault("CHAT_API_KEY", "bench")
+
+        from app.modules.chat.provider import pool_stats
+
+        print(f"stand-in provider: {os.environ['CHAT_API_BASE']} (+{args.delay_ms:.0f} ms per response)")
+        print(f"{'client':<10} {'turns':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'turns/s':>8}")
+        medians = {}
+        for name, pooled in (("per-call", False), ("pooled", True)):
+            latencies, elapsed = asyncio.run(run_turns(pooled, args.turns, args.sessions))
+            ms = [lat * 1000 for lat in latencies]
+            medians[name] = statistics.median(ms)
+            print(
+                f"{name:<10} {len(ms):>6} {medians[name]:>8.1f} {ms[int(len(ms) * 0.95) - 1]:>8.1f} "
+                f"{statistics.mean(ms):>8.1f} {len(ms) / elapsed:>8.1f}"
+            )
+            if pooled:
+                stats = pool_stats()
+        print(
+            f"\npooled client saves {medians['per-call'] - medians['pooled']:.1f} ms per turn (median); "
+            f"peak in-flight {stats['peak_in_flight']}/{stats['max_connections']}, http2={stats['http2']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark the preprocessing passthrough fast path: latency and output bytes
+with OCR_PASSTHROUGH_ENABLED off vs on.
+
+The default fixture set mimics what the mobile client uploads (EXIF-normalized
+JPEGs around 1200px at quality 80-90) plus a raw camera photo, which must keep
+taking the full pipeline.
+
+Usage (from Backend/):
+    python scripts/bench_passthrough.py
+    python scripts/bench_passthrough.py --images a.jpg b.jpg --repeat 20
+"""
+
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+# (name, size, JPEG quality)
+FIXTURES = [
+    ("mobile_960x1280_q85", (960, 1280), 85),
+    ("mobile_900x1200_q90", (900, 1200), 90),
+    ("mobile_1280x960_q80", (1280, 960), 80),
+    ("camera_3000x4000_q92", (3000, 4000), 92),
+]
+
+
+def make_receipt(size, quality: int, seed: int = 7) -> bytes:
+    """Receipt-like page: text strokes on paper with mild sensor noise."""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.blend(
+        Image.new("RGB", size, (238, 235, 228)),
+        Image.effect_noise(size, 20).convert("RGB"),
+        0.08,
+    )
+    draw = ImageDraw.Draw(image)
+    line = max(12, height // 60)
+    for y in range(line * 2, height - line * 2, line * 2):
+        x = width // 20
+        while x < width - width // 10:
+            w = rng.randint(line, line * 4)
+            draw.rectangle([x, y, x + w, y + line], fill=(35, 35, 35))
+            x += w + rng.randint(line // 2, line * 2)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality)
+    return out.getvalue()
+
+
+def run(data: bytes, passthrough: bool, repeat: int):
+    from app.modules.ocr_expense.preprocessing import PreprocessOptions, _preprocess_image_bytes
+    options = replace(PreprocessOptions.from_settings(), passthrough=passthrough)
+    latencies, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = _preprocess_image_bytes(data, options)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing passthrough fast path")
+    parser.add_argument("--images", nargs="*", help="JPEG files (default: synthetic fixture set)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.images:
+        cases = [(Path(p).name, Path(p).read_bytes()) for p in args.images]
+    else:
+        cases = [(name, make_receipt(size, quality)) for name, size, quality in FIXTURES]
+
+    print(f"{'image':<22} {'in KB':>7} {'full ms':>8} {'full KB':>8} {'fast ms':>8} {'fast KB':>8} {'path':>12}")
+    triggered, saved = 0, 0.0
+    for name, data in cases:
+        full_lat, full = run(data, False, args.repeat)
+        fast_lat, fast = run(data, True, args.repeat)
+        full_ms, fast_ms = statistics.median(full_lat) * 1000, statistics.median(fast_lat) * 1000
+        if fast.passthrough:
+            triggered += 1
+            saved += full_ms - fast_ms
+        print(
+            f"{name[:22]:<22} {len(data) / 1024:>7.1f} {full_ms:>8.1f} {len(full.image_bytes) / 1024:>8.1f} "
+            f"{fast_ms:>8.1f} {len(fast.image_bytes) / 1024:>8.1f} {'passthrough' if fast.passthrough else 'full':>12}"
+        )
+    print(
+        f"\nfast path taken for {triggered}/{len(cases)} uploads, "
+        f"{saved / max(1, triggered):.1f} ms saved per passthrough upload (median latency)"
+    )
+
+
+if __name__ == "__main__":
+    main()
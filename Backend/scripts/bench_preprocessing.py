@@ -0,0 +1,138 @@
+"""
+Benchmark OCR image preprocessing: legacy full-resolution path vs the
+decode-at-target-size pipeline.
+
+Each (variant, image) run happens in a fresh process so peak RSS is comparable.
+
+Usage (from Backend/):
+    python scripts/bench_preprocessing.py                    # synthetic 12MP photo
+    python scripts/bench_preprocessing.py --images a.jpg b.jpg --repeat 5
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from PIL import Image, ImageDraw, ImageEnhance, ImageOps  # noqa: E402
+
+
+def legacy_preprocess(data: bytes, max_dim: int) -> bytes:
+    """Pipeline as it was before decode-at-target-size (kept here for comparison)."""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image = ImageEnhance.Contrast(image).enhance(1.2)
+        image = ImageEnhance.Sharpness(image).enhance(1.1)
+        image = ImageEnhance.Brightness(image).enhance(1.05)
+        width, height = image.size
+        if width > max_dim or height > max_dim:
+            scale = min(max_dim / width, max_dim / height)
+            image = image.resize((int(width * scale), int(height * scale)), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=95, optimize=True)
+        return out.getvalue()
+
+
+def current_preprocess(data: bytes) -> bytes:
+    from app.modules.ocr_expense.preprocessing import PreprocessOptions, _preprocess_image_bytes
+    return _preprocess_image_bytes(data, PreprocessOptions.from_settings()).image_bytes
+
+
+def make_synthetic_photo(width: int = 4000, height: int = 3000) -> bytes:
+    """Noisy 12MP 'photo' of a receipt with text-like strokes."""
+    rng = random.Random(42)
+    noise = Image.effect_noise((width, height), 25).convert("RGB")
+    background = Image.new("RGB", (width, height), (120, 100, 80))
+    image = Image.blend(background, noise, 0.3)
+    draw = ImageDraw.Draw(image)
+    left, right = width // 4, width * 3 // 4
+    draw.rectangle([left, 100, right, height - 100], fill=(235, 232, 225))
+    for y in range(200, height - 200, 60):
+        x = left + 60
+        while x < right - 120:
+            w = rng.randint(20, 90)
+            draw.rectangle([x, y, x + w, y + 28], fill=(30, 30, 30))
+            x += w + rng.randint(15, 40)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def _run_once(variant: str, path: str, repeat: int, queue) -> None:
+    data = Path(path).read_bytes()
+    from app.core.config import settings
+    import app.modules.ocr_expense.preprocessing  # noqa: F401  (import before taking the baseline)
+    if variant == "legacy":
+        fn = lambda: legacy_preprocess(data, settings.OCR_MAX_DIMENSION)  # noqa: E731
+    else:
+        fn = lambda: current_preprocess(data)  # noqa: E731
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies = []
+    output = b""
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        output = fn()
+        latencies.append(time.perf_counter() - t0)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "latencies": latencies,
+        "peak_delta_mb": (peak_kb - baseline_kb) / 1024,
+        "peak_mb": peak_kb / 1024,
+        "output_bytes": len(output),
+    })
+
+
+def measure(variant: str, path: str, repeat: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_run_once, args=(variant, path, repeat, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR preprocessing pipelines")
+    parser.add_argument("--images", nargs="*", help="Image files (default: synthetic 12MP JPEG)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = args.images
+    tmp_dir = None
+    if not paths:
+        tmp_dir = tempfile.TemporaryDirectory()
+        synthetic = Path(tmp_dir.name) / "synthetic_12mp.jpg"
+        synthetic.write_bytes(make_synthetic_photo())
+        paths = [str(synthetic)]
+
+    print(f"{'image':<28} {'variant':<8} {'p50 ms':>9} {'min ms':>9} {'peak RSS MB':>12} {'(+MB)':>7} {'out KB':>8}")
+    for path in paths:
+        input_kb = Path(path).stat().st_size / 1024
+        for variant in ("legacy", "current"):
+            r = measure(variant, path, args.repeat)
+            print(
+                f"{Path(path).name[:28]:<28} {variant:<8} "
+                f"{statistics.median(r['latencies']) * 1000:>9.1f} {min(r['latencies']) * 1000:>9.1f} "
+                f"{r['peak_mb']:>12.1f} {r['peak_delta_mb']:>7.1f} {r['output_bytes'] / 1024:>8.1f}"
+            )
+        print(f"{'':<28} (input {input_kb:.0f} KB)")
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
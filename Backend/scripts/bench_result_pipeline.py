@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of per-result post-processing: normalize + validate + build
+the response model, as done for every Gemini result.
+
+Each fixture is a raw Gemini-style result; every run starts from a fresh copy.
+
+Usage (from Backend/):
+    python scripts/bench_result_pipeline.py
+    python scripts/bench_result_pipeline.py --number 20000
+"""
+
+import argparse
+import copy
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+os.environ.setdefault("SKIP_STARTUP_CHECKS", "true")
+
+FIXTURES = {
+    "clean": {
+        "transaction_date": "2025-01-09",
+        "amount": {"value": 49200, "currency": "VND"},
+        "category": {"code": "GRO", "name": "Tạp hoá"},
+        "items": [{"name": "Snack vị tôm", "qty": 1}, {"name": "Nước suối", "qty": 2}],
+        "meta": {"needs_review": False, "warnings": []},
+    },
+    "messy": {
+        "transaction_date": "09/01/2025",
+        "amount": {"value": "1.250.000đ", "currency": "vnd"},
+        "category": {"code": "FNB", "name": "Ăn uống"},
+        "items": [{"name": " Phở bò ", "qty": 0}, {"name": "", "qty": 1}, "x", {"name": "Trà đá"}],
+        "meta": {"needs_review": False, "warnings": ["low_contrast", "low_contrast"]},
+    },
+    "long_receipt": {
+        "transaction_date": "2025-01-09",
+        "amount": {"value": 15_400_000, "currency": "VND"},
+        "category": {"code": "GRO", "name": "Tạp hoá"},
+        "items": [{"name": f"Mặt hàng {i}", "qty": 1 + i % 3} for i in range(40)],
+        "meta": {"needs_review": False, "warnings": []},
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-result post-processing and validation")
+    parser.add_argument("--number", type=int, default=5000, help="Runs per fixture")
+    args = parser.parse_args()
+
+    from app.modules.ocr_expense.service import ocr_expense_service
+
+    def run(raw):
+        result = ocr_expense_service._post_process(copy.deepcopy(raw))
+        ocr_expense_service._build_result_payload(result)
+
+    print(f"{'fixture':<14} {'us/result':>10}")
+    for name, raw in FIXTURES.items():
+        baseline = min(timeit.repeat(lambda: copy.deepcopy(raw), number=args.number, repeat=7))
+        best = min(timeit.repeat(lambda: run(raw), number=args.number, repeat=7))
+        print(f"{name:<14} {(best - baseline) / args.number * 1e6:>10.1f}")
+    print("\n(input deepcopy subtracted; excludes Gemini and I/O)")
+
+
+if __name__ == "__main__":
+    main()
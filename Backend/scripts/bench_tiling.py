@@ -0,0 +1,143 @@
+"""
+Benchmark tall-receipt tiling against the single-image path.
+
+Draws a synthetic long receipt with known line items and runs it through
+preprocessing with tiling off and on. Reports preprocessing latency, payload
+size and the rendered text height Gemini gets to read. With --live (needs a
+real GEMINI_API_KEY) each variant is also extracted end-to-end and item recall
+against the ground truth is reported.
+
+Usage (from Backend/):
+    python scripts/bench_tiling.py                       # 60-line synthetic receipt
+    python scripts/bench_tiling.py --items 120 --live
+    python scripts/bench_tiling.py --images long.jpg     # latency/payload only
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("GEMINI_API_KEY", "bench")
+
+from PIL import Image, ImageDraw, ImageFont  # noqa: E402
+
+FONT_SIZE = 28
+LINE_HEIGHT = 44
+DISHES = [
+    "Cà phê sữa", "Trà đào", "Bánh mì thịt", "Phở bò", "Bún chả", "Cơm tấm", "Nước suối",
+    "Sinh tố bơ", "Gỏi cuốn", "Chả giò", "Bánh flan", "Trà chanh", "Mì xào", "Hủ tiếu",
+]
+
+
+def make_tall_receipt(item_count: int, width: int = 900) -> tuple:
+    """Long receipt photo with item_count lines; returns (jpeg bytes, item names, total)."""
+    rng = random.Random(7)
+    items = [f"{DISHES[i % len(DISHES)]} {i + 1}" for i in range(item_count)]
+    prices = [rng.randrange(10, 200) * 1000 for _ in items]
+    height = 400 + LINE_HEIGHT * (item_count + 4)
+    image = Image.new("RGB", (width, height), (245, 243, 238))
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=FONT_SIZE)
+    draw.text((60, 60), "QUÁN ĂN BENCH", fill=(20, 20, 20), font=font)
+    draw.text((60, 120), "Ngày: 15/01/2024", fill=(20, 20, 20), font=font)
+    y = 220
+    for name, price in zip(items, prices):
+        draw.text((60, y), f"1 x {name}", fill=(20, 20, 20), font=font)
+        draw.text((width - 260, y), f"{price:,}".replace(",", "."), fill=(20, 20, 20), font=font)
+        y += LINE_HEIGHT
+    total = sum(prices)
+    draw.text((60, y + LINE_HEIGHT), "TỔNG CỘNG", fill=(0, 0, 0), font=font)
+    draw.text((width - 260, y + LINE_HEIGHT), f"{total:,}".replace(",", "."), fill=(0, 0, 0), font=font)
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue(), items, total
+
+
+def preprocess(data: bytes, tiled: bool):
+    from dataclasses import replace
+    from app.modules.ocr_expense.preprocessing import PreprocessOptions, _preprocess_image_bytes
+    options = PreprocessOptions.from_settings()
+    if not tiled:
+        options = replace(options, tile_aspect_threshold=0)
+    return _preprocess_image_bytes(data, options)
+
+
+def text_height_px(source_size: tuple, result) -> float:
+    """Glyph height after preprocessing (the frame Gemini actually reads)."""
+    frame = Image.open(io.BytesIO(result.tiles[0] if result.tiles else result.image_bytes))
+    return FONT_SIZE * frame.width / source_size[0]
+
+
+def item_recall(expected: list, extracted: list) -> float:
+    names = {str(it.get("name", "")).casefold() for it in extracted if isinstance(it, dict)}
+    found = sum(1 for name in expected if any(name.casefold() in n or n in name.casefold() for n in names if n))
+    return found / len(expected) if expected else 1.0
+
+
+async def extract_live(result) -> tuple:
+    from app.modules.ocr_expense.gemini_client import gemini_ocr_client
+    from app.modules.ocr_expense.tiling import merge_tile_results
+    t0 = time.perf_counter()
+    if result.tiles:
+        parts = await asyncio.gather(*(
+            gemini_ocr_client.extract_expense_data(tile, tile=(i, len(result.tiles)))
+            for i, tile in enumerate(result.tiles)
+        ))
+        data = merge_tile_results(list(parts))
+    else:
+        data = await gemini_ocr_client.extract_expense_data(result.image_bytes)
+    return data, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tall-receipt tiling")
+    parser.add_argument("--images", nargs="*", help="Image files (default: synthetic tall receipt)")
+    parser.add_argument("--items", type=int, default=60, help="Line items on the synthetic receipt")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--live", action="store_true", help="Also call Gemini and report item recall")
+    args = parser.parse_args()
+
+    if args.live and os.environ.get("GEMINI_API_KEY") == "bench":
+        parser.error("--live needs a real GEMINI_API_KEY")
+
+    cases = []
+    if args.images:
+        cases = [(Path(p).name, Path(p).read_bytes(), None, None) for p in args.images]
+    else:
+        data, items, total = make_tall_receipt(args.items)
+        cases = [(f"synthetic_{args.items}_items", data, items, total)]
+
+    print(f"{'image':<24} {'variant':<8} {'p50 ms':>8} {'tiles':>6} {'out KB':>8} {'text px':>8}"
+          + (f" {'gemini s':>9} {'recall':>7} {'total ok':>9}" if args.live else ""))
+    for name, data, items, total in cases:
+        source_size = Image.open(io.BytesIO(data)).size
+        for variant, tiled in (("single", False), ("tiled", True)):
+            latencies = []
+            result = None
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                result = preprocess(data, tiled)
+                latencies.append(time.perf_counter() - t0)
+            payload = sum(map(len, result.tiles)) if result.tiles else len(result.image_bytes)
+            line = (
+                f"{name[:24]:<24} {variant:<8} {statistics.median(latencies) * 1000:>8.1f} "
+                f"{len(result.tiles) or 1:>6} {payload / 1024:>8.1f} {text_height_px(source_size, result):>8.1f}"
+            )
+            if args.live:
+                extracted, seconds = asyncio.run(extract_live(result))
+                recall = item_recall(items, extracted.get("items") or []) if items else float("nan")
+                total_ok = (extracted.get("amount") or {}).get("value") == total if total else "-"
+                line += f" {seconds:>9.2f} {recall:>7.0%} {str(total_ok):>9}"
+            print(line)
+        print(f"{'':<24} (input {source_size[0]}x{source_size[1]}, {len(data) / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
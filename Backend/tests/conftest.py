@@ -10,6 +10,13 @@ from pathlib import Path
 import tempfile
 import os
 
+# The app reads settings at import time; provide safe defaults for the test run.
+os.environ.setdefault("GEMINI_API_KEY", "test-gemini-key")
+os.environ.setdefault("SKIP_STARTUP_CHECKS", "true")
+os.environ.setdefault("OCR_RESULT_CACHE_ENABLED", "false")  # no Redis in unit tests; cache tests enable it explicitly
+os.environ.setdefault("OCR_CONTEXT_CACHE_ENABLED", "false")
+os.environ.setdefault("OCR_QUALITY_GATE", "off")  # blank synthetic images would be rejected; quality tests enable it explicitly
+
 from fastapi.testclient import TestClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
@@ -0,0 +1,113 @@
+"""
+Tests for the offline bulk ingestion CLI (backfill).
+"""
+
+import io
+import random
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageDraw
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.modules.ocr_expense.backfill import Checkpoint, StubExtractor, iter_sources, run_backfill
+from app.modules.ocr_expense.models import OcrExpenseJob, OcrExpenseResult
+from app.modules.ocr_expense.preprocessing import preprocessor
+from app.modules.transactions.models import Transaction
+
+
+RESPONSE = {
+    "transaction_date": "2024-01-15",
+    "amount": {"value": 150000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [{"name": "Coffee", "qty": 2}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def make_scan(seed: int) -> bytes:
+    """Receipt-like page; different seeds are far apart in perceptual hash."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (600, 900), (240, 238, 230))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(0, 450), rng.randrange(0, 750)
+        draw.rectangle([x, y, x + rng.randrange(60, 150), y + rng.randrange(60, 150)], fill=(25, 25, 25))
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+@asynccontextmanager
+async def backfill_db():
+    """Fresh in-memory database with the tables the backfill writes."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        for model in (OcrExpenseJob, OcrExpenseResult, Transaction):
+            await conn.run_sync(model.__table__.create)
+    async with sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def no_process_pool():
+    with patch.object(preprocessor, "workers", 0):
+        yield
+
+
+class TestBackfill:
+    """Archived scans are ingested with bulk inserts and can be resumed."""
+
+    def test_iter_sources_reads_zip_lazily(self, tmp_path):
+        archive = tmp_path / "scans.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("2023/b.jpg", make_scan(1))
+            zf.writestr("2023/a.PDF", b"%PDF-1.4")
+            zf.writestr("notes.txt", "not a receipt")
+
+        sources = list(iter_sources(archive))
+
+        assert [(s.name, s.content_type) for s in sources] == [
+            ("2023/a.PDF", "application/pdf"), ("2023/b.jpg", "image/jpeg"),
+        ]
+        assert sources[1].read() == make_scan(1)
+        assert sources[1].location.endswith("scans.zip!2023/b.jpg")
+
+    @pytest.mark.asyncio
+    async def test_ingests_and_resumes_from_checkpoint(self, tmp_path):
+        scans = tmp_path / "scans"
+        scans.mkdir()
+        for i in range(3):
+            (scans / f"r{i}.jpg").write_bytes(make_scan(i))
+        (scans / "broken.png").write_bytes(b"not an image")
+        checkpoint_path = tmp_path / "backfill.checkpoint"
+        user_id = str(uuid.uuid4())
+
+        async with backfill_db() as db:
+            stats = await run_backfill(
+                db, iter_sources(scans), user_id, "session-1",
+                checkpoint=Checkpoint(checkpoint_path), client=StubExtractor(RESPONSE),
+                chunk_size=2, create_transactions=True,
+            )
+            resumed = await run_backfill(
+                db, iter_sources(scans), user_id, "session-1",
+                checkpoint=Checkpoint(checkpoint_path), client=StubExtractor(RESPONSE),
+            )
+            jobs = (await db.execute(select(OcrExpenseJob))).scalars().all()
+            results = (await db.execute(select(OcrExpenseResult))).scalars().all()
+            transactions = (await db.execute(select(Transaction))).scalars().all()
+
+        assert (stats.total, stats.completed, stats.failed, stats.transactions) == (4, 3, 1, 3)
+        assert (resumed.skipped, resumed.completed, resumed.failed) == (4, 0, 0)
+        assert sorted(job.status for job in jobs) == ["completed"] * 3 + ["failed"]
+        assert all(job.saved_to_transactions for job in jobs if job.status == "completed")
+        assert {r.prompt_version for r in results} == {"stub"}
+        assert {(t.type, int(t.amount), t.note) for t in transactions} == {("expense", 150000, "Coffee")}
+        assert len(checkpoint_path.read_text().splitlines()) == 4
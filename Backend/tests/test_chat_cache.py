@@ -0,0 +1,141 @@
+"""
+Tests for the Redis chat history cache (v2 single-key layout, v1 dual-read).
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.modules.chat.cache import ChatCache
+
+
+class FakePipeline:
+    """Queues list/key commands and applies them on execute, like MULTI/EXEC."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.commands.append((name, args))
+            return self
+        return queue
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        return [getattr(self.redis, f"_{name}")(*args) for name, args in self.commands]
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for ChatCache: lists with TTLs."""
+
+    def __init__(self):
+        self.lists = {}
+        self.ttls = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        return AsyncMock(return_value=[])
+
+    async def delete(self, *keys):
+        self.round_trips += 1
+        return self._delete(*keys)
+
+    def _delete(self, *keys):
+        for key in keys:
+            self.lists.pop(key, None)
+            self.ttls.pop(key, None)
+
+    def _lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        end = len(items) if end == -1 else end + 1
+        return items[start:end] if start >= 0 else items[max(0, len(items) + start):end]
+
+    def _expire(self, key, ttl):
+        if key in self.lists:
+            self.ttls[key] = ttl
+
+    def _rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    def _rpushx(self, key, *values):
+        if key in self.lists:
+            self.lists[key].extend(values)
+
+    def _ltrim(self, key, start, end):
+        if key in self.lists:
+            self.lists[key] = self._lrange(key, start, end)
+
+    def _llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def _ttl(self, key):
+        return self.ttls.get(key, -2)
+
+
+def make_cache(legacy_values=None):
+    redis = FakeRedis()
+    cache = ChatCache()
+    cache.redis = redis
+    cache._legacy_history_script = AsyncMock(return_value=legacy_values or [])
+    return cache, redis
+
+
+class TestChatCache:
+    """Each session is one capped list of compact entries with a sliding TTL."""
+
+    @pytest.mark.asyncio
+    async def test_append_only_extends_cached_history(self):
+        cache, redis = make_cache()
+
+        # No cached history yet: appending must not create a truncated list
+        await cache.add_message("session-1", "m0", "user", "Xin chào")
+        assert redis.lists == {}
+
+        await cache.fill_history("session-1", [(f"m{i}", "user", f"q{i}") for i in range(25)])
+        await cache.add_message("session-1", "m25", "assistant", "Chào bạn")
+        redis.round_trips = 0
+        history = await cache.get_chat_history("session-1", limit=3)
+
+        assert [(m.role, m.content) for m in history] == [("user", "q23"), ("user", "q24"), ("assistant", "Chào bạn")]
+        assert redis.round_trips == 1
+        entries = redis.lists["chat:v2:session:session-1"]
+        assert len(entries) == 20 and json.loads(entries[-1]) == ["m25", "assistant", "Chào bạn"]
+        assert redis.ttls["chat:v2:session:session-1"] == 3600
+
+    @pytest.mark.asyncio
+    async def test_legacy_layout_is_read_and_migrated(self):
+        legacy = [  # v1: newest first, expired message keys come back as None
+            json.dumps({"id": "m2", "role": "assistant", "content": "Chào bạn", "created_at": "2025-01-09T10:00:01"}),
+            None,
+            json.dumps({"id": "m0", "role": "user", "content": "Xin chào", "created_at": "2025-01-09T10:00:00"}),
+        ]
+        cache, redis = make_cache(legacy)
+
+        history = await cache.get_chat_history("session-1")
+        again = await cache.get_chat_history("session-1")
+
+        assert [m.content for m in history] == [m.content for m in again] == ["Xin chào", "Chào bạn"]
+        cache._legacy_history_script.assert_awaited_once()
+        assert [json.loads(e)[0] for e in redis.lists["chat:v2:session:session-1"]] == ["m0", "m2"]
+
+    @pytest.mark.asyncio
+    async def test_redis_errors_fail_open(self):
+        cache = ChatCache()
+        cache.redis = MagicMock()
+        cache.redis.pipeline.side_effect = ConnectionError("redis down")
+
+        assert await cache.get_chat_history("session-1") is None
+        await cache.add_message("session-1", "m1", "user", "Xin chào")
+        assert cache.redis.pipeline.call_count == 2
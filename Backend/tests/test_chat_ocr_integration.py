@@ -3,190 +3,179 @@ Integration tests for Chat + OCR functionality.
 """
 
 import pytest
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, Mock, ANY
 from fastapi.testclient import TestClient
 
+from app.main import application
+from app.modules.auth.middleware import get_current_user
+from app.modules.ocr_expense.context_cache import session_context_cache
+from app.modules.ocr_expense.service import ocr_expense_service
+
+
+OCR_PROMPT = (
+    "\n\n\nOCR Context Available:\n- Transaction Date: 2025-01-09\n- Amount: 49,200 VND\n"
+    "- Category: Tạp hoá (GRO)\n- Items: 1 items\n\nItems:\n- Snack vị tôm (qty: 1)\n"
+    "\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."
+)
+
+
+@pytest.fixture
+def authed_client(client: TestClient, test_user_id: str) -> TestClient:
+    """Test client with the JWT dependency resolved to the seeded test user."""
+    application.dependency_overrides[get_current_user] = lambda: Mock(id=test_user_id)
+    return client
+
+
+def chat_provider_mock(mock_provider, answer: str) -> AsyncMock:
+    completions = AsyncMock(return_value={"choices": [{"message": {"content": answer}}]})
+    mock_provider.return_value.completions = completions
+    return completions
+
+
+def sent_system_prompt(completions: AsyncMock) -> str:
+    return completions.call_args.kwargs["messages"][0]["content"]
+
 
 class TestChatOcrIntegration:
     """Integration tests for Chat with OCR context."""
 
     def test_chat_without_ocr_context(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat without OCR context (normal chat flow)."""
         # Mock chat service to return normal response
         with patch('app.modules.chat.service.build_messages') as mock_build, \
              patch('app.modules.chat.service.ChatProviderClient') as mock_provider:
-            
+
             # Configure mocks
             mock_build.return_value = [
                 {"role": "system", "content": "You are a helpful assistant."},
                 {"role": "user", "content": "Hello, how are you?"}
             ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "I'm doing well, thank you!"}}]
-            })
-            
+            chat_provider_mock(mock_provider, "I'm doing well, thank you!")
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Hello, how are you?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions
             assert response.status_code == 200
             response_data = response.json()
             assert "answer" in response_data
 
     def test_chat_with_ocr_context(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat with OCR context available."""
-        # Mock OCR context
-        ocr_context = {
-            "transaction_date": "2025-01-09",
-            "amount": {"value": 49200, "currency": "VND"},
-            "category": {"code": "GRO", "name": "Tạp hoá"},
-            "items": [{"name": "Snack vị tôm", "qty": 1}],
-            "meta": {"warnings": []}
-        }
-        
-        # Mock chat service with OCR context
-        with patch('app.modules.chat.service.build_messages') as mock_build, \
-             patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
-             patch('app.modules.ocr_expense.service.ocr_expense_service') as mock_ocr:
-            
-            # Configure OCR service mock
-            mock_ocr.get_ocr_context_by_session = AsyncMock(return_value=ocr_context)
-            
-            # Configure chat mocks
-            mock_build.return_value = [
-                {"role": "system", "content": "You are a helpful assistant.\n\nOCR Context Available:\n- Transaction Date: 2025-01-09\n- Amount: 49,200 VND\n- Category: Tạp hoá (GRO)\n- Items: 1 items\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."},
-                {"role": "user", "content": "Tôi vừa mua gì?"}
-            ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "Dựa trên hóa đơn bạn vừa upload, bạn đã mua Snack vị tôm với tổng tiền 49,200 VND."}}]
-            })
-            
+        # The system prompt appends the session's pre-rendered OCR snippet
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(ocr_expense_service, 'get_ocr_prompt_context', AsyncMock(return_value=OCR_PROMPT)) as mock_prompt:
+
+            completions = chat_provider_mock(
+                mock_provider,
+                "Dựa trên hóa đơn bạn vừa upload, bạn đã mua Snack vị tôm với tổng tiền 49,200 VND."
+            )
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Tôi vừa mua gì?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions
             assert response.status_code == 200
             response_data = response.json()
             assert "answer" in response_data
-            
-            # Verify OCR context was retrieved
-            mock_ocr.get_ocr_context_by_session.assert_called_once_with(
-                mock_build.call_args[0][1], test_session_id
-            )
+
+            # Verify OCR context was retrieved once and sent to the provider
+            mock_prompt.assert_awaited_once_with(ANY, test_session_id)
+            assert sent_system_prompt(completions).endswith(OCR_PROMPT)
 
     def test_chat_ocr_context_not_available(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat when OCR context is not available."""
         # Mock OCR service to return None (no context)
-        with patch('app.modules.chat.service.build_messages') as mock_build, \
-             patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
-             patch('app.modules.ocr_expense.service.ocr_expense_service') as mock_ocr:
-            
-            # Configure OCR service mock to return None
-            mock_ocr.get_ocr_context_by_session = AsyncMock(return_value=None)
-            
-            # Configure chat mocks
-            mock_build.return_value = [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": "Hello, how are you?"}
-            ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "I'm doing well, thank you!"}}]
-            })
-            
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(ocr_expense_service, 'get_ocr_prompt_context', AsyncMock(return_value=None)) as mock_prompt:
+
+            completions = chat_provider_mock(mock_provider, "I'm doing well, thank you!")
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Hello, how are you?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions
             assert response.status_code == 200
             response_data = response.json()
             assert "answer" in response_data
-            
+
             # Verify OCR context was checked
-            mock_ocr.get_ocr_context_by_session.assert_called_once()
+            mock_prompt.assert_awaited_once()
+            assert "OCR Context Available" not in sent_system_prompt(completions)
 
     def test_chat_ocr_context_error(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat when OCR context retrieval fails."""
         # Mock OCR service to raise exception
-        with patch('app.modules.chat.service.build_messages') as mock_build, \
-             patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
-             patch('app.modules.ocr_expense.service.ocr_expense_service') as mock_ocr:
-            
-            # Configure OCR service mock to raise exception
-            mock_ocr.get_ocr_context_by_session = AsyncMock(side_effect=Exception("OCR service error"))
-            
-            # Configure chat mocks
-            mock_build.return_value = [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": "Hello, how are you?"}
-            ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "I'm doing well, thank you!"}}]
-            })
-            
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(ocr_expense_service, 'get_ocr_prompt_context', AsyncMock(side_effect=Exception("OCR service error"))):
+
+            completions = chat_provider_mock(mock_provider, "I'm doing well, thank you!")
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Hello, how are you?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions - should still work despite OCR error
             assert response.status_code == 200
             response_data = response.json()
             assert "answer" in response_data
+            assert "OCR Context Available" not in sent_system_prompt(completions)
 
     def test_chat_with_ocr_items_context(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat with OCR context containing items."""
-        # Mock OCR context with items
+        # Snippet rendered from an OCR result with items
         ocr_context = {
             "transaction_date": "2025-01-09",
             "amount": {"value": 150000, "currency": "VND"},
@@ -198,90 +187,128 @@ class TestChatOcrIntegration:
             ],
             "meta": {"warnings": []}
         }
-        
-        # Mock chat service with OCR context
-        with patch('app.modules.chat.service.build_messages') as mock_build, \
-             patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
-             patch('app.modules.ocr_expense.service.ocr_expense_service') as mock_ocr:
-            
-            # Configure OCR service mock
-            mock_ocr.get_ocr_context_by_session = AsyncMock(return_value=ocr_context)
-            
-            # Configure chat mocks
-            mock_build.return_value = [
-                {"role": "system", "content": "You are a helpful assistant.\n\nOCR Context Available:\n- Transaction Date: 2025-01-09\n- Amount: 150,000 VND\n- Category: Thực phẩm (FNB)\n- Items: 3 items\n\nItems:\n- Bánh mì (qty: 2)\n- Sữa tươi (qty: 1)\n- Trứng gà (qty: 10)\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."},
-                {"role": "user", "content": "Tôi mua những gì?"}
-            ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "Dựa trên hóa đơn, bạn đã mua: 2 bánh mì, 1 sữa tươi, và 10 trứng gà với tổng tiền 150,000 VND."}}]
-            })
-            
+        ocr_prompt = ocr_expense_service._render_prompt_context(ocr_context)
+
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(ocr_expense_service, 'get_ocr_prompt_context', AsyncMock(return_value=ocr_prompt)) as mock_prompt:
+
+            completions = chat_provider_mock(
+                mock_provider,
+                "Dựa trên hóa đơn, bạn đã mua: 2 bánh mì, 1 sữa tươi, và 10 trứng gà với tổng tiền 150,000 VND."
+            )
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Tôi mua những gì?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions
             assert response.status_code == 200
             response_data = response.json()
             assert "answer" in response_data
-            
+
             # Verify OCR context was retrieved
-            mock_ocr.get_ocr_context_by_session.assert_called_once()
+            mock_prompt.assert_awaited_once()
+            system_prompt = sent_system_prompt(completions)
+            assert "- Amount: 150,000 VND" in system_prompt
+            assert "- Trứng gà (qty: 10)" in system_prompt
+
+    def test_chat_with_cached_ocr_context(
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
+        test_session_id: str
+    ):
+        """Test chat when the session's OCR context is served from the context cache."""
+        entry = {"result": {"transaction_date": "2025-01-09"}, "prompt": OCR_PROMPT}
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(session_context_cache, 'get', AsyncMock(return_value=entry)) as cache_get, \
+             patch.object(session_context_cache, 'set', AsyncMock()) as cache_set:
+
+            completions = chat_provider_mock(mock_provider, "Bạn đã mua Snack vị tôm.")
+
+            # Prepare request
+            data = {
+                "user_id": test_user_id,
+                "session_id": test_session_id,
+                "query": "Tôi vừa mua gì?"
+            }
+
+            # Execute request
+            response = authed_client.post("/api/v1/chat/", json=data)
+
+            # Assertions - cache HIT: snippet used as-is, nothing re-filled
+            assert response.status_code == 200
+            cache_get.assert_awaited_once_with(test_session_id)
+            cache_set.assert_not_awaited()
+            assert sent_system_prompt(completions).endswith(OCR_PROMPT)
+
+    def test_chat_with_cached_no_ocr_entry(
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
+        test_session_id: str
+    ):
+        """Test chat when the context cache remembers that the session has no OCR."""
+        entry = {"result": None, "prompt": None}
+        with patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
+             patch.object(session_context_cache, 'get', AsyncMock(return_value=entry)) as cache_get, \
+             patch.object(session_context_cache, 'set', AsyncMock()) as cache_set:
+
+            completions = chat_provider_mock(mock_provider, "I'm doing well, thank you!")
+
+            # Prepare request
+            data = {
+                "user_id": test_user_id,
+                "session_id": test_session_id,
+                "query": "Hello, how are you?"
+            }
+
+            # Execute request
+            response = authed_client.post("/api/v1/chat/", json=data)
+
+            # Assertions - negative entry: no OCR in the prompt, no DB fill
+            assert response.status_code == 200
+            cache_get.assert_awaited_once_with(test_session_id)
+            cache_set.assert_not_awaited()
+            assert "OCR Context Available" not in sent_system_prompt(completions)
 
     def test_chat_with_ocr_warnings(
-        self, 
-        client: TestClient, 
-        test_user_id: str, 
+        self,
+        authed_client: TestClient,
+        test_user_id: str,
         test_session_id: str
     ):
         """Test chat with OCR context containing warnings."""
-        # Mock OCR context with warnings
-        ocr_context = {
-            "transaction_date": "2025-01-09",
-            "amount": {"value": 49200, "currency": "VND"},
-            "category": {"code": "GRO", "name": "Tạp hoá"},
-            "items": [{"name": "Snack vị tôm", "qty": 1}],
-            "meta": {
-                "warnings": [
-                    "Amount might be incorrect",
-                    "Date format unclear"
-                ]
-            }
-        }
-        
         # Mock chat service with OCR context
         with patch('app.modules.chat.service.build_messages') as mock_build, \
-             patch('app.modules.chat.service.ChatProviderClient') as mock_provider, \
-             patch('app.modules.ocr_expense.service.ocr_expense_service') as mock_ocr:
-            
-            # Configure OCR service mock
-            mock_ocr.get_ocr_context_by_session = AsyncMock(return_value=ocr_context)
-            
+             patch('app.modules.chat.service.ChatProviderClient') as mock_provider:
+
             # Configure chat mocks
             mock_build.return_value = [
                 {"role": "system", "content": "You are a helpful assistant.\n\nOCR Context Available:\n- Transaction Date: 2025-01-09\n- Amount: 49,200 VND\n- Category: Tạp hoá (GRO)\n- Items: 1 items\n\nItems:\n- Snack vị tôm (qty: 1)\n\n⚠️ Warnings:\n- Amount might be incorrect\n- Date format unclear\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."},
                 {"role": "user", "content": "Có vấn đề gì với hóa đơn không?"}
             ]
-            mock_provider.return_value.completions = AsyncMock(return_value={
-                "choices": [{"message": {"content": "Có một số cảnh báo với hóa đơn: số tiền có thể không chính xác và định dạng ngày không rõ ràng. Bạn nên kiểm tra lại."}}]
-            })
-            
+            chat_provider_mock(
+                mock_provider,
+                "Có một số cảnh báo với hóa đơn: số tiền có thể không chính xác và định dạng ngày không rõ ràng. Bạn nên kiểm tra lại."
+            )
+
             # Prepare request
             data = {
                 "user_id": test_user_id,
                 "session_id": test_session_id,
                 "query": "Có vấn đề gì với hóa đơn không?"
             }
-            
+
             # Execute request
-            response = client.post("/api/v1/chat/", json=data)
-            
+            response = authed_client.post("/api/v1/chat/", json=data)
+
             # Assertions
             assert response.status_code == 200
             response_data = response.json()
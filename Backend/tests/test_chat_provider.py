@@ -0,0 +1,48 @@
+"""
+Tests for the shared chat provider HTTP client.
+"""
+
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.core.metrics import metrics
+from app.modules.chat import provider
+from app.modules.chat.provider import ChatProviderClient, close_http_client, get_http_client, pool_stats
+
+
+class TestChatProviderClient:
+    """Provider calls share one pooled client per worker."""
+
+    @pytest.mark.asyncio
+    async def test_calls_share_pooled_client(self):
+        seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen.append((str(request.url), request.extensions["timeout"]["read"]))
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        shared = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(provider, "_client", shared), \
+                patch.object(provider.settings, "CHAT_API_BASE", "https://provider.test/"):
+            first = await ChatProviderClient(timeout_seconds=60).completions(messages=[{"role": "user", "content": "hi"}])
+            second = await ChatProviderClient(timeout_seconds=30).completions(messages=[{"role": "user", "content": "hi"}])
+            stats = pool_stats()
+            assert get_http_client() is shared
+            await close_http_client()
+            assert shared.is_closed and provider._client is None
+
+        assert first == second == {"choices": [{"message": {"content": "ok"}}]}
+        # Per-call read timeouts still apply on the shared client
+        assert seen == [("https://provider.test/v1/chat/completions", 60), ("https://provider.test/v1/chat/completions", 30)]
+        assert stats["in_flight"] == 0 and stats["peak_in_flight"] >= 1
+        assert metrics.snapshot()["gauges"]["chat.provider.in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_http2_falls_back_without_h2(self):
+        with patch.object(provider.settings, "CHAT_HTTP2", True), \
+                patch.dict("sys.modules", {"h2": None}):
+            assert provider._http2_enabled() is False
+        with patch.object(provider.settings, "CHAT_HTTP2", False):
+            assert provider._http2_enabled() is False
@@ -0,0 +1,94 @@
+"""
+Tests for the token-streaming chat reply (POST /chat/stream).
+"""
+
+import json
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import httpx
+import pytest
+
+from app.core.metrics import metrics
+from app.modules.chat import provider
+from app.modules.chat.provider import ChatProviderClient
+from app.modules.chat.schemas import ChatRequest
+from app.modules.chat.service import stream_chat_reply
+
+
+PAYLOAD = ChatRequest(user_id="user-1", session_id="session-1", query="Tháng này tôi chi bao nhiêu?")
+MESSAGES = [{"role": "user", "content": PAYLOAD.query}]
+
+
+def chunk(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+class FakeStream:
+    """Stand-in for ChatProviderClient.stream_completions that records being closed."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __call__(self, **kwargs):
+        try:
+            for item in self.chunks:
+                yield item
+        finally:
+            self.closed = True
+
+
+class TestChatStream:
+    """Provider deltas are relayed as they arrive and the answer is saved once."""
+
+    @pytest.mark.asyncio
+    async def test_provider_parses_sse_chunks(self):
+        body = "".join(f"data: {json.dumps(chunk(c))}\n\n" for c in ("Xin", " chào")) + "data: [DONE]\n\n"
+        sent = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            sent.append(json.loads(request.content))
+            return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with patch.object(provider, "_client", client):
+            chunks = [c async for c in ChatProviderClient().stream_completions(messages=MESSAGES)]
+        await client.aclose()
+
+        assert [c["choices"][0]["delta"]["content"] for c in chunks] == ["Xin", " chào"]
+        assert sent[0]["stream"] is True
+
+    @pytest.mark.asyncio
+    async def test_streams_deltas_then_saves_answer(self):
+        stream = FakeStream([{"choices": [{"delta": {"role": "assistant"}}]}, chunk("Bạn đã chi"), chunk(" 150,000 VND")])
+        save = AsyncMock(return_value=Mock(id="msg-1"))
+        ttft_count = metrics.get_timing("chat.stream.ttft").count
+
+        with patch.object(ChatProviderClient, "stream_completions", stream), \
+                patch("app.modules.chat.service.save_message", save), \
+                patch("app.modules.chat.service.AsyncSessionLocal", MagicMock()):
+            events = [event async for event in stream_chat_reply(PAYLOAD, "session-1", MESSAGES)]
+
+        assert [name for name, _ in events] == ["delta", "delta", "done"]
+        done = events[-1][1]
+        assert done["answer"] == "Bạn đã chi 150,000 VND"
+        assert done["message_id"] == "msg-1" and done["tokens"] == 2 and done["ttft_ms"] is not None
+        assert save.await_args.args[1:5] == ("session-1", "user-1", "assistant", "Bạn đã chi 150,000 VND")
+        assert metrics.get_timing("chat.stream.ttft").count == ttft_count + 1
+        assert stream.closed
+
+    @pytest.mark.asyncio
+    async def test_client_disconnect_closes_upstream_without_saving(self):
+        stream = FakeStream([chunk("Bạn"), chunk(" đã"), chunk(" chi")])
+        save = AsyncMock()
+        aborted = metrics.get_counter("chat.stream.aborted")
+
+        with patch.object(ChatProviderClient, "stream_completions", stream), \
+                patch("app.modules.chat.service.save_message", save):
+            replies = stream_chat_reply(PAYLOAD, "session-1", MESSAGES)
+            assert await replies.__anext__() == ("delta", {"content": "Bạn"})
+            await replies.aclose()
+
+        assert stream.closed
+        save.assert_not_awaited()
+        assert metrics.get_counter("chat.stream.aborted") == aborted + 1
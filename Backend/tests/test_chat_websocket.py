@@ -0,0 +1,81 @@
+"""
+Tests for the chat WebSocket channel (/chat/ws/{session_id}).
+"""
+
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.modules.chat.connection import ChatConnection
+from app.modules.chat.provider import ChatProviderClient
+from app.modules.chat.routes import router
+
+
+def chunk(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+class TestChatWebSocket:
+    """Auth and session state are resolved once per connection, not per turn."""
+
+    def test_rejects_invalid_token(self, client):
+        with patch("app.modules.chat.routes.get_user_from_token", AsyncMock(return_value=None)), \
+                patch("app.modules.chat.routes.AsyncSessionLocal", MagicMock()):
+            with pytest.raises(WebSocketDisconnect) as exc:
+                with client.websocket_connect("/chat/ws/session-1?token=bad"):
+                    pass
+
+        assert exc.value.code == 1008
+
+    def test_turns_reuse_connection_state(self, client):
+        connection = ChatConnection("session-1", "user-1", "SYSTEM", ["Câu hỏi cũ"])
+        sent = []
+
+        async def stream_completions(provider, **kwargs):
+            sent.append(kwargs["messages"])
+            for content in ("Bạn đã", " chi 150,000 VND"):
+                yield chunk(content)
+
+        user_token = AsyncMock(return_value=Mock(id="user-1"))
+        open_connection = AsyncMock(return_value=connection)
+        with patch("app.modules.chat.routes.get_user_from_token", user_token), \
+                patch("app.modules.chat.routes.AsyncSessionLocal", MagicMock()), \
+                patch.object(ChatConnection, "open", open_connection), \
+                patch.object(ChatProviderClient, "stream_completions", stream_completions), \
+                patch("app.modules.chat.connection.AsyncSessionLocal", MagicMock()), \
+                patch("app.modules.chat.connection.save_message", AsyncMock()) as save_user, \
+                patch("app.modules.chat.service.AsyncSessionLocal", MagicMock()), \
+                patch("app.modules.chat.service.save_message", AsyncMock(return_value=Mock(id="msg-1"))):
+            with client.websocket_connect("/chat/ws/session-1", headers={"Authorization": "Bearer jwt"}) as ws:
+                assert ws.receive_json() == {"type": "ready", "session_id": "session-1"}
+                frames = []
+                for query in ("Tháng này chi bao nhiêu?", "Còn tuần này?"):
+                    ws.send_json({"type": "message", "query": query})
+                    while not frames or frames[-1]["type"] != "done":
+                        frames.append(ws.receive_json())
+                    frames.append({"type": "turn"})
+                ws.send_text("not json")
+                assert ws.receive_json()["type"] == "error"
+
+        user_token.assert_awaited_once()
+        open_connection.assert_awaited_once()
+        assert [f["type"] for f in frames] == ["delta", "delta", "done", "turn"] * 2
+        assert frames[2]["answer"] == "Bạn đã chi 150,000 VND" and frames[2]["message_id"] == "msg-1"
+        assert save_user.await_count == 2
+        # Second turn: in-memory history includes the first query, system prompt rendered once
+        assert sent[1] == [
+            {"role": "system", "content": "SYSTEM"},
+            {"role": "user", "content": "Câu hỏi cũ"},
+            {"role": "user", "content": "Tháng này chi bao nhiêu?"},
+            {"role": "user", "content": "Còn tuần này?"},
+        ]
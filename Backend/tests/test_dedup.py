@@ -0,0 +1,143 @@
+"""
+Tests for perceptual-hash near-duplicate detection.
+"""
+
+import io
+import random
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from PIL import Image, ImageDraw, ImageEnhance
+
+from app.modules.ocr_expense.dedup import DuplicateIndex, DUPLICATE_WARNING
+from app.modules.ocr_expense.phash import BKTree, dhash, hamming
+from app.modules.ocr_expense.preprocessing import PreprocessResult, PreprocessOptions, _preprocess_image_bytes
+from app.modules.ocr_expense.service import OcrExpenseService
+
+
+def make_receipt(seed: int, size=(600, 1200)) -> Image.Image:
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (235, 232, 225))
+    draw = ImageDraw.Draw(image)
+    for y in range(40, size[1] - 40, 30):
+        x = 30
+        while x < size[0] - 80:
+            w = rng.randint(15, 70)
+            draw.rectangle([x, y, x + w, y + 14], fill=(30, 30, 30))
+            x += w + rng.randint(10, 30)
+    return image
+
+
+def to_jpeg(image: Image.Image, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+RESULT = {
+    "transaction_date": "2024-01-15",
+    "amount": {"value": 150000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [{"name": "Coffee", "qty": 2}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+class TestPerceptualHash:
+    """Test cases for dhash and the BK-tree index."""
+
+    def test_dhash_tolerates_reshoot(self):
+        """Rescaled, recompressed, brighter copy stays close; a different receipt does not."""
+        original = make_receipt(1)
+        reshoot = ImageEnhance.Brightness(original.resize((450, 900))).enhance(1.1)
+        reshoot = Image.open(io.BytesIO(to_jpeg(reshoot, quality=60)))
+
+        base = int(dhash(original), 16)
+        assert len(dhash(original)) == 16
+        assert hamming(base, int(dhash(reshoot), 16)) <= 6
+        assert hamming(base, int(dhash(make_receipt(2)), 16)) > 6
+
+    def test_bktree_matches_brute_force(self):
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(500)]
+        tree = BKTree()
+        for i, h in enumerate(hashes):
+            tree.add(h, i)
+        query = hashes[42] ^ 0b1011  # 3 bits away from entry 42
+
+        expected = sorted(i for i, h in enumerate(hashes) if hamming(query, h) <= 12)
+        assert sorted(i for _, i in tree.search(query, 12)) == expected
+        assert tree.search(query, 3)[0] == (3, 42)
+        assert len(tree) == 500
+
+    def test_preprocessing_emits_phash(self):
+        opts = PreprocessOptions.from_settings()
+        result = _preprocess_image_bytes(to_jpeg(make_receipt(3)), opts)
+        assert result.phash is not None and len(result.phash) == 16
+        assert "phash" in result.timings
+
+
+class TestDuplicateDetection:
+    """Test cases for duplicate lookups in the OCR pipeline."""
+
+    @pytest.fixture
+    def service(self):
+        return OcrExpenseService()
+
+    def make_index(self, policy, rows):
+        index = DuplicateIndex()
+        index.policy = policy
+        db = AsyncMock()
+        db.execute = AsyncMock(return_value=Mock(all=Mock(return_value=rows)))
+        return index, db
+
+    @pytest.mark.asyncio
+    async def test_index_loads_once_per_user(self):
+        phash = dhash(make_receipt(1))
+        index, db = self.make_index("warn", [("job-old", phash)])
+        near = f"{int(phash, 16) ^ 0b11:016x}"
+
+        match = await index.find(db, "user-1", near)
+        assert (match.job_id, match.distance) == ("job-old", 2)
+        index.add("user-1", dhash(make_receipt(2)), "job-new")
+        assert await index.find(db, "user-1", f"{int(phash, 16) ^ (0xFF << 8):016x}") is None
+        assert db.execute.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_warn_policy_flags_result(self, service):
+        """policy=warn still calls Gemini but prepends possible_duplicate and requests review."""
+        phash = dhash(make_receipt(1))
+        index, db = self.make_index("warn", [("job-old", phash)])
+        result = dict(RESULT, meta={"needs_review": False, "warnings": ["a", "b", "c"]})
+
+        with patch("app.modules.ocr_expense.service.duplicate_index", index), \
+             patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.post_processor") as mock_post:
+            mock_prep.preprocess_bytes = AsyncMock(return_value=PreprocessResult(image_bytes=b"x", phash=phash))
+            mock_gemini.extract_expense_data = AsyncMock(return_value=result)
+            mock_post.apply_rules = Mock(return_value=result)
+            output = await service._run_pipeline(b"data", "image/jpeg", db=db, user_id="user-1")
+
+        mock_gemini.extract_expense_data.assert_awaited_once()
+        assert output.duplicate_of.job_id == "job-old"
+        assert output.result["meta"] == {"needs_review": True, "warnings": [DUPLICATE_WARNING, "a", "b"]}
+
+    @pytest.mark.asyncio
+    async def test_reuse_policy_skips_gemini(self, service):
+        """policy=reuse returns the earlier extraction without a Gemini call."""
+        phash = dhash(make_receipt(1))
+        index, db = self.make_index("reuse", [("job-old", phash)])
+
+        with patch("app.modules.ocr_expense.service.duplicate_index", index), \
+             patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch.object(service, "_load_job_result", AsyncMock(return_value=dict(RESULT, meta={}))):
+            mock_prep.preprocess_bytes = AsyncMock(return_value=PreprocessResult(image_bytes=b"x", phash=phash))
+            mock_gemini.extract_expense_data = AsyncMock()
+            output = await service._run_pipeline(b"data", "image/jpeg", db=db, user_id="user-1")
+
+        mock_gemini.extract_expense_data.assert_not_awaited()
+        assert output.result["amount"]["value"] == 150000
+        assert output.result["meta"]["warnings"] == [DUPLICATE_WARNING]
+        assert output.phash == phash
@@ -0,0 +1,214 @@
+"""
+Tests for the Gemini OCR client: non-blocking calls, concurrency cap, timeout and request template.
+"""
+
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.main import application
+from app.modules.ocr_expense.gemini_client import GeminiOcrClient
+
+
+GEMINI_JSON = {
+    "transaction_date": "2025-01-09",
+    "amount": {"value": 49200, "currency": "VND"},
+    "category": {"code": "GRO", "name": "Tạp hoá"},
+    "items": [{"name": "Snack vị tôm", "qty": 1}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+class StubAsyncModels:
+    """Stand-in for ``genai.Client().aio.models`` with a slow generate_content."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.last_kwargs = None
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        self.last_kwargs = kwargs
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(text=json.dumps(GEMINI_JSON), candidates=[], usage_metadata=None)
+
+
+def make_client(delay: float, max_concurrency: int = 8, timeout: float = 5.0) -> tuple[GeminiOcrClient, StubAsyncModels]:
+    client = GeminiOcrClient()
+    stub = StubAsyncModels(delay)
+    client.client = SimpleNamespace(aio=SimpleNamespace(models=stub))
+    client.max_concurrency = max_concurrency
+    client.timeout_seconds = timeout
+    return client, stub
+
+
+class TestGeminiOcrClientConcurrency:
+    """Gemini calls must not block the event loop."""
+
+    @pytest.mark.asyncio
+    async def test_health_responsive_while_ocr_in_flight(self):
+        """/health answers promptly while several OCR calls are outstanding."""
+        client, stub = make_client(delay=0.5)
+
+        ocr_tasks = [
+            asyncio.create_task(client.extract_expense_data(image_bytes=b"img")) for _ in range(6)
+        ]
+        await asyncio.sleep(0.05)
+        assert stub.in_flight == 6
+
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            t0 = time.perf_counter()
+            response = await http.get("/health")
+            elapsed = time.perf_counter() - t0
+
+        assert response.status_code == 200
+        assert elapsed < 0.25
+        assert stub.in_flight == 6
+
+        results = await asyncio.gather(*ocr_tasks)
+        assert all(r["amount"]["value"] == 49200 for r in results)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        """No more than GEMINI_MAX_CONCURRENCY calls reach Gemini at once."""
+        client, stub = make_client(delay=0.05, max_concurrency=2)
+
+        await asyncio.gather(*(client.extract_expense_data(image_bytes=b"img") for _ in range(6)))
+
+        assert stub.calls == 6
+        assert stub.max_in_flight == 2
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        """A call exceeding GEMINI_TIMEOUT_SECONDS fails fast."""
+        client, _ = make_client(delay=1.0, timeout=0.05)
+
+        with pytest.raises(RuntimeError, match="timed out"):
+            await client.extract_expense_data(image_bytes=b"img")
+
+
+class TestGeminiOcrClientPages:
+    """Multi-page documents go out as one request with one image part per page."""
+
+    @pytest.mark.asyncio
+    async def test_extra_pages_sent_as_parts(self):
+        client, stub = make_client(delay=0)
+
+        await client.extract_expense_data(image_bytes=b"page1", extra_pages=[b"page2", b"page3"])
+
+        prompt, *parts = stub.last_kwargs["contents"]
+        assert [part.inline_data.data for part in parts] == [b"page1", b"page2", b"page3"]
+        assert "3 trang" in prompt
+
+
+class StubAsyncCaches:
+    """Stand-in for ``genai.Client().aio.caches``."""
+
+    def __init__(self, fail: bool = False, delay: float = 0.0):
+        self.fail = fail
+        self.delay = delay
+        self.created = []
+
+    async def create(self, *, model, config):
+        self.created.append((model, config))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("Cached content is too small")
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+
+class TestGeminiRequestTemplate:
+    """Static request parts are built once per process and reused."""
+
+    @pytest.fixture
+    def prompt_file(self, tmp_path, monkeypatch):
+        path = tmp_path / "system.txt"
+        path.write_text("Trích xuất hoá đơn.", encoding="utf-8")
+        monkeypatch.setattr("app.modules.ocr_expense.gemini_client.PROMPT_FILE", path)
+        return path
+
+    @pytest.mark.asyncio
+    async def test_template_reused_until_prompt_changes(self, prompt_file):
+        """Config and prompt are shared across calls; editing the prompt file rebuilds them."""
+        client, stub = make_client(delay=0)
+
+        await client.extract_expense_data(image_bytes=b"a", hints={"language": "vi"})
+        first = client.get_template()
+        first_config = stub.last_kwargs["config"]
+        await client.extract_expense_data(image_bytes=b"b", hints={"language": "vi"})
+
+        assert client.get_template() is first
+        assert stub.last_kwargs["config"] is first_config
+        assert stub.last_kwargs["contents"][0].startswith("Trích xuất hoá đơn.")
+        assert list(first.variants) == [("vi", None, False, 1, None)]
+
+        version = client.prompt_version
+        prompt_file.write_text("Prompt mới.", encoding="utf-8")
+        os.utime(prompt_file, (time.time() + 5, time.time() + 5))
+        await client.extract_expense_data(image_bytes=b"c")
+
+        assert client.get_template() is not first
+        assert client.prompt_version != version
+        assert stub.last_kwargs["contents"][0] == "Prompt mới."
+
+    @pytest.mark.asyncio
+    async def test_context_cache_handle_reused(self, prompt_file):
+        """With context caching the system prompt is cached once and requests reference the handle."""
+        client, stub = make_client(delay=0)
+        caches = StubAsyncCaches()
+        client.client.aio.caches = caches
+        client.context_cache_enabled = True
+
+        await asyncio.gather(*(
+            client.extract_expense_data(image_bytes=b"img", hints={"language": "vi"}) for _ in range(3)
+        ))
+
+        assert len(caches.created) == 1
+        assert caches.created[0][1].system_instruction == "Trích xuất hoá đơn."
+        assert stub.last_kwargs["config"].cached_content == "cachedContents/1"
+        prompt, image = stub.last_kwargs["contents"]
+        assert prompt.startswith("Gợi ý:") and "Trích xuất hoá đơn." not in prompt
+        assert image.inline_data.data == b"img"
+
+    @pytest.mark.asyncio
+    async def test_context_cache_failure_falls_back_inline(self, prompt_file):
+        """If the cache cannot be created the prompt is sent inline and creation is not retried per call."""
+        client, stub = make_client(delay=0)
+        caches = StubAsyncCaches(fail=True)
+        client.client.aio.caches = caches
+        client.context_cache_enabled = True
+
+        await client.extract_expense_data(image_bytes=b"img")
+        await client.extract_expense_data(image_bytes=b"img")
+
+        assert len(caches.created) == 1
+        assert stub.last_kwargs["config"].cached_content is None
+        assert stub.last_kwargs["contents"][0] == "Trích xuất hoá đơn."
+
+    @pytest.mark.asyncio
+    async def test_context_cache_failure_not_retried_by_queued_callers(self, prompt_file):
+        """Callers waiting on the cache lock see the failure and go inline instead of retrying creation."""
+        client, stub = make_client(delay=0)
+        caches = StubAsyncCaches(fail=True, delay=0.02)
+        client.client.aio.caches = caches
+        client.context_cache_enabled = True
+
+        await asyncio.gather(*(client.extract_expense_data(image_bytes=b"img") for _ in range(5)))
+
+        assert len(caches.created) == 1
+        assert stub.calls == 5
+        assert stub.last_kwargs["config"].cached_content is None
@@ -0,0 +1,80 @@
+"""
+Tests for receipt localization (auto-crop and deskew).
+"""
+
+import io
+
+from PIL import Image, ImageDraw
+
+from app.modules.ocr_expense.localization import estimate_skew, find_receipt_box, localize_receipt
+from app.modules.ocr_expense.preprocessing import PreprocessOptions, _preprocess_image_bytes
+
+import numpy as np
+
+
+def make_scene(angle: float = 0.0, size=(1500, 2000), paper=(600, 1500)) -> Image.Image:
+    """Text-striped paper (optionally tilted) centred on a darker table."""
+    scene = Image.new("RGB", size, (105, 90, 75))
+    sheet = Image.new("RGB", paper, (238, 235, 228))
+    draw = ImageDraw.Draw(sheet)
+    for y in range(60, paper[1] - 60, 50):
+        for x in range(40, paper[0] - 120, 90):
+            draw.rectangle([x, y, x + 60, y + 20], fill=(30, 30, 30))
+    mask = Image.new("L", paper, 255)
+    if angle:
+        sheet = sheet.rotate(angle, expand=True)
+        mask = mask.rotate(angle, expand=True)
+    scene.paste(sheet, ((size[0] - sheet.width) // 2, (size[1] - sheet.height) // 2), mask)
+    return scene
+
+
+def make_options(**overrides) -> PreprocessOptions:
+    values = PreprocessOptions.from_settings().__dict__ | overrides
+    return PreprocessOptions(**values)
+
+
+class TestLocalization:
+    """Test cases for receipt localization."""
+
+    def test_find_receipt_box(self):
+        """The box hugs the paper on a 400px thumbnail."""
+        gray = np.asarray(make_scene().convert("L").resize((300, 400)), dtype=np.float32)
+        left, top, right, bottom = find_receipt_box(gray)
+        assert abs(left - 90) <= 3 and abs(right - 210) <= 3
+        assert abs(top - 50) <= 3 and abs(bottom - 350) <= 3
+
+    def test_no_paper_is_left_alone(self):
+        """A frame without a paper/background split is not cropped."""
+        blank = Image.new("RGB", (1200, 1600), (240, 240, 230))
+        assert find_receipt_box(np.asarray(blank.convert("L"), dtype=np.float32)) is None
+        image, box, angle = localize_receipt(blank, 0.03, 8)
+        assert image is blank and box is None and angle == 0.0
+
+    def test_estimate_skew(self):
+        """Text lines tilted by a few degrees are detected (as the correcting rotation)."""
+        sheet = make_scene(angle=4, size=(800, 1600), paper=(600, 1200)).convert("L").resize((200, 400))
+        gray = np.asarray(sheet, dtype=np.float32)
+        assert abs(estimate_skew(gray, 8) + 4) <= 1
+        assert estimate_skew(gray, 0) == 0.0
+
+    def test_crop_and_deskew(self):
+        """A tilted receipt is cropped to about the upright paper size plus margin."""
+        image, box, angle = localize_receipt(make_scene(angle=5), 0.03, 8)
+        assert box is not None
+        assert abs(angle + 5) <= 1
+        assert abs(image.width - 600 * 1.06) < 40
+        assert abs(image.height - 1500 * 1.06) < 60
+
+    def test_preprocess_autocrop_reduces_output(self):
+        """With autocrop the encoded upload is smaller and covers only the receipt."""
+        buf = io.BytesIO()
+        make_scene(angle=3).save(buf, format="JPEG", quality=90)
+        data = buf.getvalue()
+
+        cropped = _preprocess_image_bytes(data, make_options(autocrop=True, deskew_max_angle=8))
+        full = _preprocess_image_bytes(data, make_options(autocrop=False))
+
+        assert "localize" in cropped.timings
+        assert len(cropped.image_bytes) < len(full.image_bytes)
+        width, height = Image.open(io.BytesIO(cropped.image_bytes)).size
+        assert width / height < 0.5
@@ -0,0 +1,106 @@
+"""
+Tests for multi-receipt batch extraction.
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from fastapi import UploadFile
+
+from app.modules.ocr_expense.service import OcrExpenseService, BatchUpload, PipelineOutput
+from app.modules.ocr_expense.exceptions import FileValidationError, UnsupportedMediaTypeError
+
+
+def make_result(value):
+    return {
+        "transaction_date": "2024-01-15",
+        "amount": {"value": value, "currency": "VND"},
+        "category": {"code": "FNB", "name": "Ăn uống"},
+        "items": [{"name": "Coffee", "qty": 1}],
+        "meta": {"needs_review": False, "warnings": []},
+    }
+
+
+def make_upload(index, error=None):
+    return BatchUpload(
+        index=index,
+        job_id=f"job-{index}",
+        filename=f"r{index}.jpg",
+        content_type="image/jpeg",
+        data=b"x" * (index + 1),
+        stored_path=f"memory://job-{index}.jpg",
+        error=error,
+    )
+
+
+def make_file(name, content_type="image/jpeg", data=b"image"):
+    file = Mock(spec=UploadFile)
+    file.filename = name
+    file.content_type = content_type
+    file.size = len(data)
+    file.read = AsyncMock(side_effect=[data, b""])
+    return file
+
+
+class TestOcrBatch:
+    """Test cases for batch extraction."""
+
+    @pytest.fixture
+    def service(self):
+        return OcrExpenseService()
+
+    @pytest.mark.asyncio
+    async def test_read_batch_uploads_limits(self, service):
+        """More than OCR_BATCH_SIZE files is rejected; bad files are marked, not fatal."""
+        service.batch_size = 2
+        with pytest.raises(FileValidationError, match="Too many files"):
+            await service.read_batch_uploads([make_file("a.jpg")] * 3)
+
+        uploads = await service.read_batch_uploads([make_file("a.jpg"), make_file("b.gif", "image/gif")])
+        assert uploads[0].data == b"image" and uploads[0].error is None
+        assert isinstance(uploads[1].error, UnsupportedMediaTypeError)
+
+    @pytest.mark.asyncio
+    async def test_batch_streams_and_bulk_inserts(self, service):
+        """Results stream per file with bounded parallelism, then rows are bulk inserted once."""
+        service.batch_concurrency = 2
+        in_flight = 0
+        peak = 0
+
+        async def fake_pipeline(data, content_type, hints=None, user_id=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01 * len(data))
+            in_flight -= 1
+            if len(data) == 3:
+                raise RuntimeError("Gemini down")
+            return PipelineOutput(make_result(len(data) * 1000))
+
+        uploads = [make_upload(i) for i in range(5)]
+        uploads.append(make_upload(5, error=UnsupportedMediaTypeError("Unsupported media type: image/gif")))
+        db = AsyncMock()
+
+        with patch.object(service, "_run_pipeline", side_effect=fake_pipeline), \
+             patch("app.modules.ocr_expense.service.save_message", AsyncMock()) as save_message:
+            records = [r async for r in service.extract_expense_batch(db, "session-1", "user-1", uploads)]
+
+        assert peak <= 2
+        results = [r for r in records if r["type"] == "result"]
+        assert sorted(r["index"] for r in results) == list(range(6))
+        failed = {r["index"]: r["error"]["code"] for r in results if r["status"] == "failed"}
+        assert failed == {2: "INTERNAL_ERROR", 5: "UNSUPPORTED_MEDIA_TYPE"}
+        assert records[-1] == {**records[-1], "type": "summary", "total": 6, "completed": 4, "failed": 2, "persisted": True}
+
+        # One executemany insert for jobs, one for results
+        assert db.execute.await_count == 2
+        job_rows = db.execute.await_args_list[0].args[1]
+        result_rows = db.execute.await_args_list[1].args[1]
+        assert len(job_rows) == 6 and len(result_rows) == 4
+        assert {row["status"] for row in job_rows} == {"completed", "failed"}
+
+        # One combined context message, in upload order
+        save_message.assert_awaited_once()
+        metadata = save_message.await_args.args[5]
+        assert [r["amount"]["value"] for r in metadata["ocr_data_list"]] == [1000, 2000, 4000, 5000]
@@ -0,0 +1,162 @@
+"""
+Tests for the content-hash OCR result cache.
+"""
+
+import copy
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from fastapi import UploadFile
+
+from app.modules.ocr_expense.cache import OcrResultCache
+from app.modules.ocr_expense.dedup import DuplicateMatch
+from app.modules.ocr_expense.models import OcrExpenseResult
+from app.modules.ocr_expense.preprocessing import PreprocessResult
+from app.modules.ocr_expense.service import OcrExpenseService
+
+
+RESULT = {
+    "transaction_date": "2025-01-09",
+    "amount": {"value": 49200, "currency": "VND"},
+    "category": {"code": "GRO", "name": "Tạp hoá"},
+    "items": [{"name": "Snack vị tôm", "qty": 1}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def make_file(data=b"receipt-bytes"):
+    file = Mock(spec=UploadFile)
+    file.filename = "receipt.jpg"
+    file.content_type = "image/jpeg"
+    file.size = len(data)
+    file.read = AsyncMock(side_effect=[data, b""])
+    return file
+
+
+def make_db(row=None):
+    db = AsyncMock()
+    db.add = Mock()
+    execute_result = Mock()
+    execute_result.scalar_one_or_none.return_value = row
+    execute_result.first.return_value = row
+    db.execute = AsyncMock(return_value=execute_result)
+    return db
+
+
+def make_cache(cached=None):
+    cache = OcrResultCache()
+    cache.enabled = True
+    cache.get = AsyncMock(return_value=cached)
+    cache.set = AsyncMock()
+    return cache
+
+
+class TestOcrResultCache:
+    """Test cases for OcrResultCache and its use in extract_expense_sync."""
+
+    @pytest.fixture
+    def service(self):
+        return OcrExpenseService()
+
+    def test_content_hash_inputs(self):
+        """Key depends on bytes, prompt version and extraction hints, not on debug."""
+        cache = OcrResultCache()
+        base = cache.content_hash(b"abc", "v1", {"language": "vi"})
+        assert base == cache.content_hash(b"abc", "v1", {"language": "vi", "debug": True, "timezone": None})
+        assert base != cache.content_hash(b"abc", "v2", {"language": "vi"})
+        assert base != cache.content_hash(b"abc", "v1", {"language": "en"})
+        assert base != cache.content_hash(b"abd", "v1", {"language": "vi"})
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_pipeline_and_attaches_context(self, service):
+        """A Redis hit returns the stored result, skips Gemini and still saves session context."""
+        cache = make_cache({"result": RESULT, "processing_time": 4.2})
+        db = make_db()
+
+        with patch("app.modules.ocr_expense.service.ocr_result_cache", cache), \
+             patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.save_message", new_callable=AsyncMock) as mock_save:
+            mock_gemini.prompt_version = "v1"
+            mock_gemini.extract_expense_data = AsyncMock()
+            response = await service.extract_expense_sync(db, "session-2", "user-1", make_file())
+
+        mock_prep.preprocess_bytes.assert_not_called()
+        mock_gemini.extract_expense_data.assert_not_awaited()
+        mock_save.assert_awaited_once()
+        assert mock_save.await_args.args[1] == "session-2"
+        assert response.cache.hit is True
+        assert 0 < response.cache.latency_saved_ms <= 4200
+        assert response.result.amount.value == 49200
+        job = db.add.call_args_list[0].args[0]
+        assert job.content_hash == cache.content_hash(b"receipt-bytes", "v1", None)
+        cache.set.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_db_fallback_repopulates_redis(self, service):
+        """On a Redis miss the content_hash column is consulted and Redis is refilled."""
+        row = OcrExpenseResult(
+            job_id="old-job",
+            transaction_date=RESULT["transaction_date"],
+            amount_value=49200,
+            amount_currency="VND",
+            category_code="GRO",
+            category_name="Tạp hoá",
+            items_json=RESULT["items"],
+            meta_json=RESULT["meta"],
+            processing_time=3.0,
+            word_count=4,
+        )
+        cache = make_cache()
+
+        with patch("app.modules.ocr_expense.service.ocr_result_cache", cache):
+            found = await service._lookup_cached_result(make_db((row, "ff00ff00ff00ff00")), "hash-1")
+
+        assert found == (RESULT, 3.0, "ff00ff00ff00ff00")
+        cache.set.assert_awaited_once_with("hash-1", RESULT, 3.0, "ff00ff00ff00ff00")
+
+    @pytest.mark.asyncio
+    async def test_hit_still_flags_duplicates(self, service):
+        """A cache hit runs the near-duplicate check with the stored phash and keeps it on the job."""
+        cached = {"result": copy.deepcopy(RESULT), "processing_time": 4.2, "phash": "ff00ff00ff00ff00"}
+        cache = make_cache(cached)
+        db = make_db()
+
+        with patch("app.modules.ocr_expense.service.ocr_result_cache", cache), \
+             patch("app.modules.ocr_expense.service.duplicate_index") as mock_index, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.save_message", new_callable=AsyncMock):
+            mock_index.find = AsyncMock(return_value=DuplicateMatch(job_id="old-job", distance=0))
+            mock_gemini.prompt_version = "v1"
+            response = await service.extract_expense_sync(db, "session-3", "user-1", make_file())
+
+        mock_index.find.assert_awaited_once_with(db, "user-1", "ff00ff00ff00ff00")
+        assert response.cache.hit is True
+        assert response.result.meta.warnings[0] == "possible_duplicate"
+        assert response.result.meta.needs_review is True
+        job = db.add.call_args_list[0].args[0]
+        assert job.phash == "ff00ff00ff00ff00"
+        mock_index.add.assert_called_once_with("user-1", "ff00ff00ff00ff00", job.id)
+
+    @pytest.mark.asyncio
+    async def test_miss_runs_pipeline_and_stores(self, service):
+        """A miss runs the pipeline and writes the validated result to the cache."""
+        cache = make_cache()
+        db = make_db(row=None)
+
+        with patch("app.modules.ocr_expense.service.ocr_result_cache", cache), \
+             patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.post_processor") as mock_post, \
+             patch("app.modules.ocr_expense.service.schema_validator"), \
+             patch("app.modules.ocr_expense.service.save_message", new_callable=AsyncMock):
+            mock_prep.preprocess_bytes = AsyncMock(return_value=PreprocessResult(image_bytes=b"processed"))
+            mock_gemini.prompt_version = "v1"
+            mock_gemini.extract_expense_data = AsyncMock(return_value=RESULT)
+            mock_post.apply_rules = Mock(return_value=RESULT)
+            response = await service.extract_expense_sync(db, "session-1", "user-1", make_file())
+
+        mock_gemini.extract_expense_data.assert_awaited_once()
+        assert response.cache.hit is False
+        cache.set.assert_awaited_once()
+        assert cache.set.await_args.args[1] == RESULT
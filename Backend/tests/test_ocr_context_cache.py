@@ -0,0 +1,120 @@
+"""
+Tests for the per-session OCR context cache.
+"""
+
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from app.core.metrics import metrics
+from app.modules.ocr_expense.context_cache import SessionOcrContextCache
+from app.modules.ocr_expense.service import OcrExpenseService
+
+
+RESULT = {
+    "transaction_date": "2025-01-09",
+    "amount": {"value": 150000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Thực phẩm"},
+    "items": [{"name": "Bánh mì", "qty": 2}, {"name": "Sữa tươi", "qty": 1}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+class FakeRedis:
+    """Just enough of redis.asyncio for the cache (get / set ex+nx / delete)."""
+
+    def __init__(self, error=None):
+        self.store = {}
+        self.error = error
+
+    async def get(self, key):
+        if self.error:
+            raise self.error
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if self.error:
+            raise self.error
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+def make_cache(redis):
+    cache = SessionOcrContextCache()
+    cache.redis = redis
+    cache.enabled = True
+    return cache
+
+
+def make_db(row=None):
+    db = AsyncMock()
+    execute_result = Mock()
+    execute_result.scalar_one_or_none.return_value = row
+    db.execute = AsyncMock(return_value=execute_result)
+    return db
+
+
+class TestSessionOcrContextCache:
+    """Chat turns read the session's OCR context from Redis instead of the DB."""
+
+    @pytest.mark.asyncio
+    async def test_session_without_ocr_is_cached(self):
+        service = OcrExpenseService()
+        db = make_db(None)
+        hits = metrics.get_counter("ocr.context_cache.hit.empty")
+
+        with patch("app.modules.ocr_expense.service.session_context_cache", make_cache(FakeRedis())):
+            first = await service.get_ocr_prompt_context(db, "session-1")
+            second = await service.get_ocr_context_by_session(db, "session-1")
+
+        assert first is None and second is None
+        assert db.execute.await_count == 1
+        assert metrics.get_counter("ocr.context_cache.hit.empty") == hits + 1
+        assert 0 < metrics.snapshot()["gauges"]["ocr.context_cache.hit_rate"] <= 1
+
+    @pytest.mark.asyncio
+    async def test_write_through_replaces_entry_and_wins_over_db_fill(self):
+        service = OcrExpenseService()
+        redis = FakeRedis()
+        cache = make_cache(redis)
+
+        with patch("app.modules.ocr_expense.service.session_context_cache", cache):
+            assert await service.get_ocr_context_by_session(make_db(None), "session-1") is None
+            await service._publish_session_context("session-1", RESULT)
+            # A miss that read the DB before the commit must not clobber the newer entry
+            await cache.set("session-1", None, None, only_if_missing=True)
+            db = make_db(None)
+            prompt = await service.get_ocr_prompt_context(db, "session-1")
+            context = await service.get_ocr_context_by_session(db, "session-1")
+
+        db.execute.assert_not_awaited()
+        assert context == RESULT
+        assert prompt == (
+            "\n\n\nOCR Context Available:\n- Transaction Date: 2025-01-09\n- Amount: 150,000 VND\n"
+            "- Category: Thực phẩm (FNB)\n- Items: 2 items\n\nItems:\n- Bánh mì (qty: 2)\n- Sữa tươi (qty: 1)\n"
+            "\n\nBạn có thể trả lời câu hỏi về thông tin OCR này."
+        )
+
+    @pytest.mark.asyncio
+    async def test_redis_error_falls_back_to_db(self):
+        service = OcrExpenseService()
+        row = Mock(
+            transaction_date="2025-01-09", amount_value=150000, amount_currency="VND",
+            category_code="FNB", category_name="Thực phẩm", items_json=RESULT["items"], meta_json=RESULT["meta"],
+        )
+        db = make_db(row)
+
+        with patch(
+            "app.modules.ocr_expense.service.session_context_cache",
+            make_cache(FakeRedis(error=ConnectionError("redis down"))),
+        ):
+            context = await service.get_ocr_context_by_session(db, "session-1")
+
+        assert context == RESULT
+        assert db.execute.await_count == 1
@@ -0,0 +1,189 @@
+"""
+Tests for asynchronous OCR jobs (submit -> worker -> status).
+"""
+
+import asyncio
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from fastapi import UploadFile
+
+from app.modules.ocr_expense import worker
+from app.modules.ocr_expense.ratelimit import GeminiBusyError
+from app.modules.ocr_expense.service import OcrExpenseService, PipelineOutput
+from app.modules.ocr_expense.models import OcrExpenseJob
+from app.modules.ocr_expense.schemas import OcrExpenseHints
+
+
+VALID_RESULT = {
+    "transaction_date": "2024-01-15",
+    "amount": {"value": 150000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [{"name": "Coffee", "qty": 2}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def make_job(**overrides):
+    fields = dict(
+        id="job-1",
+        session_id="session-1",
+        user_id="user-1",
+        original_filename="receipt.jpg",
+        file_path="memory://job-1.jpg",
+        file_size=10,
+        content_type="image/jpeg",
+        profile="generic",
+        hints={"language": "vi"},
+        status="pending",
+        retry_count=0,
+    )
+    fields.update(overrides)
+    return OcrExpenseJob(**fields)
+
+
+def make_db(job=None):
+    db = AsyncMock()
+    db.add = Mock()
+    db.get = AsyncMock(return_value=job)
+    return db
+
+
+def make_queue(payload=b"image-bytes"):
+    queue = Mock()
+    for name in ("enqueue", "set_progress", "requeue", "delete_payload"):
+        setattr(queue, name, AsyncMock())
+    queue.load_payload = AsyncMock(return_value=payload)
+    return queue
+
+
+class TestOcrJobs:
+    """Test cases for async OCR job mode."""
+
+    @pytest.fixture
+    def service(self):
+        return OcrExpenseService()
+
+    @pytest.mark.asyncio
+    async def test_submit_enqueues_pending_job(self, service):
+        """Async submit stores a pending job and enqueues the upload bytes."""
+        file = Mock(spec=UploadFile)
+        file.filename = "receipt.jpg"
+        file.content_type = "image/jpeg"
+        file.size = 11
+        file.read = AsyncMock(side_effect=[b"image-bytes", b""])
+        db = make_db()
+        queue = make_queue()
+
+        with patch("app.modules.ocr_expense.service.ocr_job_queue", queue), \
+             patch.object(service, "_run_pipeline") as run_pipeline:
+            response = await service.submit_expense_job(
+                db, "session-1", "user-1", file, hints=OcrExpenseHints(language="vi")
+            )
+
+        run_pipeline.assert_not_called()
+        job = db.add.call_args[0][0]
+        assert job.status == "pending"
+        assert job.hints == {"language": "vi"}
+        queue.enqueue.assert_awaited_once_with(job.id, b"image-bytes")
+        assert response.status == "pending"
+        assert response.job_id == job.id
+        assert response.result is None
+
+    @pytest.mark.asyncio
+    async def test_process_job_completes(self, service):
+        """Worker runs the pipeline, stores the result and marks the job completed."""
+        job = make_job()
+        db = make_db(job)
+        queue = make_queue()
+
+        with patch("app.modules.ocr_expense.service.ocr_job_queue", queue), \
+             patch.object(service, "_run_pipeline", AsyncMock(return_value=PipelineOutput(VALID_RESULT))) as run_pipeline, \
+             patch.object(service, "_save_ocr_context_to_session", AsyncMock()) as save_context:
+            requeued = await service.process_job(db, "job-1")
+
+        assert requeued is False
+
+        assert run_pipeline.await_args.args[:2] == (b"image-bytes", "image/jpeg")
+        assert run_pipeline.await_args.args[2].language == "vi"
+        save_context.assert_awaited_once_with(db, "session-1", "user-1", VALID_RESULT)
+        assert job.status == "completed"
+        assert job.started_at is not None and job.completed_at is not None
+        queue.set_progress.assert_any_await("job-1", "completed")
+        queue.delete_payload.assert_awaited_once_with("job-1")
+
+    @pytest.mark.asyncio
+    async def test_process_job_retries_then_fails(self, service):
+        """Transient failures are requeued until OCR_JOB_MAX_RETRIES, then the job fails."""
+        job = make_job()
+        db = make_db(job)
+        queue = make_queue()
+        service.job_max_retries = 2
+        service.job_retry_base_delay = 5.0
+
+        with patch("app.modules.ocr_expense.service.ocr_job_queue", queue), \
+             patch.object(service, "_run_pipeline", AsyncMock(side_effect=RuntimeError("Gemini down"))):
+            assert await service.process_job(db, "job-1") is True
+            assert job.status == "pending"
+            assert job.retry_count == 1
+            queue.requeue.assert_awaited_once_with("job-1", delay=5.0)
+
+            assert await service.process_job(db, "job-1") is False
+
+        assert job.status == "failed"
+        assert job.retry_count == 2
+        assert job.error_message == "Gemini down"
+        queue.delete_payload.assert_awaited_once_with("job-1")
+
+    @pytest.mark.asyncio
+    async def test_process_job_missing_payload_fails(self, service):
+        """An expired upload payload fails the job without retrying."""
+        job = make_job()
+        db = make_db(job)
+        queue = make_queue(payload=None)
+
+        with patch("app.modules.ocr_expense.service.ocr_job_queue", queue):
+            await service.process_job(db, "job-1")
+
+        assert job.status == "failed"
+        queue.requeue.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_retry_backoff_honours_retry_after(self, service):
+        """Backoff doubles per attempt, waits at least the limiter's retry_after and is capped."""
+        job = make_job(retry_count=1)
+        db = make_db(job)
+        queue = make_queue()
+        service.job_retry_base_delay = 5.0
+        service.job_retry_max_delay = 60.0
+
+        with patch("app.modules.ocr_expense.service.ocr_job_queue", queue), \
+             patch.object(service, "_run_pipeline", AsyncMock(side_effect=GeminiBusyError("busy", retry_after=30.0))):
+            assert await service.process_job(db, "job-1") is True
+            queue.requeue.assert_awaited_once_with("job-1", delay=30.0)
+
+            job.retry_count = 0
+            service.job_retry_max_delay = 20.0
+            await service.process_job(db, "job-1")
+            assert queue.requeue.await_args.kwargs["delay"] == 20.0
+
+    @pytest.mark.asyncio
+    async def test_worker_skips_ack_for_requeued_job(self):
+        """A requeued job's claim is released by requeue(); the worker must not ack it again."""
+        stop = asyncio.Event()
+        queue = Mock()
+        queue.dequeue = AsyncMock(side_effect=["job-1", "job-2"])
+        queue.ack = AsyncMock()
+
+        async def process_job(db, job_id):
+            if job_id == "job-2":
+                stop.set()
+            return job_id == "job-1"
+
+        session = AsyncMock()
+        with patch.object(worker, "ocr_job_queue", queue), \
+             patch.object(worker, "AsyncSessionLocal", Mock(return_value=session)), \
+             patch.object(worker.ocr_expense_service, "process_job", side_effect=process_job):
+            await worker._consume(0, stop)
+
+        queue.ack.assert_awaited_once_with("job-2")
@@ -13,6 +13,7 @@ from app.modules.ocr_expense.exceptions import (
     FileValidationError, UnsupportedMediaTypeError, InternalError
 )
 from app.modules.ocr_expense.schemas import OcrExpenseHints
+from app.modules.ocr_expense.preprocessing import PreprocessResult
 
 
 class TestOcrExpenseService:
@@ -72,20 +73,34 @@ class TestOcrExpenseService:
         assert service._get_file_extension("test") == ""
 
     @pytest.mark.asyncio
-    async def test_save_file_success(self, service, mock_upload_file, temp_upload_dir):
-        """Test successful file saving."""
+    async def test_ingest_upload_in_memory(self, service, mock_upload_file, temp_upload_dir):
+        """Uploads stay in memory by default: nothing is written to the upload dir."""
         service.upload_dir = temp_upload_dir
-        file_path = temp_upload_dir / "test.jpg"
-        
-        await service._save_file(mock_upload_file, file_path)
-        
-        assert file_path.exists()
-        assert file_path.read_bytes() == b"fake_image_data"
+        service.retain_uploads = False
+
+        data, stored_path = await service._ingest_upload(mock_upload_file, "job-1")
+
+        assert data == b"fake_image_data"
+        assert stored_path == "memory://job-1.jpg"
+        assert list(temp_upload_dir.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_ingest_upload_retained(self, service, mock_upload_file, temp_upload_dir):
+        """With audit retention on, the upload is spooled to disk and its path recorded."""
+        service.upload_dir = temp_upload_dir
+        service.retain_uploads = True
+
+        data, stored_path = await service._ingest_upload(mock_upload_file, "job-1")
+
+        file_path = temp_upload_dir / "job-1.jpg"
+        assert stored_path == str(file_path)
+        assert file_path.read_bytes() == data == b"fake_image_data"
 
     @pytest.mark.asyncio
-    async def test_save_file_oversized(self, service, temp_upload_dir):
-        """Test file saving with oversized file."""
+    async def test_ingest_upload_oversized(self, service, temp_upload_dir):
+        """Test ingesting an oversized file: rejected before anything is spooled."""
         service.upload_dir = temp_upload_dir
+        service.retain_uploads = True
         service.max_file_size = 100  # Small limit for testing
         
         file = Mock(spec=UploadFile)
@@ -93,10 +108,66 @@ class TestOcrExpenseService:
         file.content_type = "image/jpeg"
         file.read = AsyncMock(return_value=b"x" * 200)  # Larger than limit
         
-        file_path = temp_upload_dir / "test.jpg"
-        
         with pytest.raises(FileValidationError, match="File size exceeds limit"):
-            await service._save_file(file, file_path)
+            await service._ingest_upload(file, "job-1")
+        assert list(temp_upload_dir.iterdir()) == []
+
+    @pytest.mark.asyncio
+    async def test_spool_to_disk_failure(self, service, temp_upload_dir):
+        """Write errors while spooling surface as InternalError."""
+        blocker = temp_upload_dir / "not-a-dir"
+        blocker.write_bytes(b"")
+
+        with pytest.raises(InternalError, match="Failed to save file"):
+            await service._spool_to_disk(b"data", blocker / "test.jpg")
+
+    @pytest.mark.asyncio
+    async def test_read_upload_aborts_early(self, service):
+        """Chunked read stops as soon as the limit is exceeded, without draining the upload."""
+        service.max_file_size = 100
+        service.chunk_size = 40
+
+        file = Mock(spec=UploadFile)
+        file.filename = "test.jpg"
+        file.content_type = "image/jpeg"
+        file.read = AsyncMock(return_value=b"x" * 40)  # never-ending stream of full chunks
+
+        with pytest.raises(FileValidationError, match="File size exceeds limit"):
+            await service._read_upload(file)
+        assert file.read.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_extract_expense_sync_in_memory(
+        self,
+        service,
+        mock_db_session,
+        mock_upload_file,
+        temp_upload_dir,
+        mock_gemini_response
+    ):
+        """Uploads are handed to the preprocessor as bytes and nothing is written to disk."""
+        service.upload_dir = temp_upload_dir
+        service.retain_uploads = False
+
+        with patch('app.modules.ocr_expense.service.preprocessor') as mock_prep, \
+             patch('app.modules.ocr_expense.service.gemini_ocr_client') as mock_gemini, \
+             patch('app.modules.ocr_expense.service.save_message', new_callable=AsyncMock):
+            mock_prep.preprocess_bytes = AsyncMock(return_value=PreprocessResult(image_bytes=b"processed"))
+            mock_gemini.extract_expense_data = AsyncMock(return_value=mock_gemini_response)
+
+            await service.extract_expense_sync(
+                db=mock_db_session,
+                session_id="test-session-123",
+                user_id="test-user-123",
+                file=mock_upload_file,
+            )
+
+            mock_prep.preprocess_bytes.assert_awaited_once()
+            assert mock_prep.preprocess_bytes.await_args.args == (b"fake_image_data", "image/jpeg")
+            assert list(temp_upload_dir.iterdir()) == []
+            job = mock_db_session.add.call_args_list[0].args[0]
+            assert job.file_path.startswith("memory://")
+            assert job.file_size == len(b"fake_image_data")
 
     @pytest.mark.asyncio
     async def test_extract_expense_sync_success(
@@ -120,7 +191,7 @@ class TestOcrExpenseService:
              patch('app.modules.ocr_expense.service.schema_validator') as mock_validator:
             
             # Configure mocks
-            mock_prep.preprocess_file = AsyncMock(return_value=b"processed")
+            mock_prep.preprocess_bytes = AsyncMock(return_value=PreprocessResult(image_bytes=b"processed"))
             mock_gemini.extract_expense_data = AsyncMock(return_value=mock_gemini_response)
             mock_post.apply_rules = Mock(return_value=mock_gemini_response)
             mock_validator.validate = Mock()
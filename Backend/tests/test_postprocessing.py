@@ -0,0 +1,124 @@
+"""
+Tests for the compiled result pipeline (post-processing rules + schema validation).
+"""
+
+import copy
+
+import pytest
+
+from app.modules.ocr_expense.postprocessing import OcrPostProcessor
+from app.modules.ocr_expense.schemas import (
+    OcrExpenseAmount, OcrExpenseCategory, OcrExpenseItem, OcrExpenseMeta, OcrExpenseResult,
+)
+from app.modules.ocr_expense.validation import MISSING, CompiledSchema, schema_validator
+
+
+MESSY = {
+    "transaction_date": "09/01/2025",
+    "amount": {"value": "1.250.000đ", "currency": "vnd"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [{"name": " Phở bò ", "qty": 0}, {"name": "", "qty": 1}, "x", {"name": "Trà đá"}],
+    "meta": {"needs_review": False, "warnings": ["low_contrast", "low_contrast"]},
+}
+
+
+@pytest.fixture
+def processor():
+    return OcrPostProcessor()
+
+
+class TestCompiledResultPipeline:
+    """One pass normalizes the Gemini result and validates it against the schema."""
+
+    def test_normalizes_messy_result(self, processor):
+        result, errors = processor.process(copy.deepcopy(MESSY), {"timezone": "Asia/Ho_Chi_Minh"})
+
+        assert errors == []
+        assert len(result["transaction_date"]) == 10
+        assert result["amount"] == {"value": 1250000, "currency": "VND"}
+        assert result["items"] == [{"name": "Phở bò", "qty": 1}, {"name": "Trà đá", "qty": 1}]
+        assert result["meta"]["warnings"] == ["date_defaulted_to_extraction", "low_contrast"]
+        assert result["meta"]["needs_review"] is True
+
+    def test_warnings_are_capped_in_order(self, processor):
+        raw = copy.deepcopy(MESSY)
+        raw["amount"]["value"] = 25_000_000
+        raw["meta"]["warnings"] = ["a", "b", "a", "c"]
+
+        result, _ = processor.process(raw)
+
+        # Rule warnings come first so the LLM's own warnings cannot push them out
+        assert result["meta"]["warnings"] == ["date_defaulted_to_extraction", "amount_seems_high", "a"]
+        assert result["meta"]["needs_review"] is True
+
+    def test_unknown_timezone_falls_back_to_default(self, processor):
+        result, errors = processor.process(copy.deepcopy(MESSY), {"timezone": "Bad/Zone"})
+
+        assert errors == []
+        assert len(result["transaction_date"]) == 10
+        assert "date_defaulted_to_extraction" in result["meta"]["warnings"]
+
+    def test_missing_meta_is_created(self, processor):
+        raw = copy.deepcopy(MESSY)
+        raw["transaction_date"] = "2025-01-09"
+        del raw["meta"]
+
+        result, errors = processor.process(raw)
+
+        assert errors == []
+        assert result["meta"] == {"warnings": [], "needs_review": False}
+
+    def test_reports_schema_violations(self, processor):
+        raw = copy.deepcopy(MESSY)
+        raw["category"] = {"code": "XXX", "name": "", "extra": 1}
+
+        result, errors = processor.process(raw)
+
+        assert "category.code must be one of: FNB, GRO, TRA, UTI, ENT, OTH" in errors
+        assert "category.name must have at least 1 character(s)" in errors
+        assert "category.extra is not allowed" in errors
+        # Violations are reported, not silently dropped
+        assert result["category"]["extra"] == 1
+
+    def test_basic_schema_failure_raises(self, processor):
+        with pytest.raises(ValueError, match="Invalid basic schema"):
+            processor.process({"amount": {"value": 1}})
+
+    def test_validator_without_rules(self):
+        assert schema_validator.validate({"amount": {"value": -1, "currency": "VND"}}) == {
+            "valid": False,
+            "errors": [
+                "amount.value must be >= 0",
+                "transaction_date is required",
+                "category is required",
+            ],
+        }
+        assert "meta.quality.sharpness must be a number" in schema_validator.validate(
+            {"meta": {"quality": {"sharpness": "x"}}}
+        )["errors"]
+
+    def test_rules_run_inline_and_can_drop_elements(self):
+        compiled = CompiledSchema(
+            {"type": "object", "properties": {"tags": {"type": "array", "items": {"type": "string"}}}},
+            rules={"tags[]": lambda value, ctx: MISSING if value == ctx else value.upper()},
+        )
+
+        value, errors = compiled.run({"tags": ["a", "skip", "b"]}, "skip")
+
+        assert value == {"tags": ["A", "B"]}
+        assert errors == []
+
+    def test_build_model_matches_pydantic_construction(self, processor):
+        result, _ = processor.process(copy.deepcopy(MESSY))
+
+        model = schema_validator.build_model(result)
+
+        assert model == OcrExpenseResult(
+            transaction_date=result["transaction_date"],
+            amount=OcrExpenseAmount(**result["amount"]),
+            category=OcrExpenseCategory(**result["category"]),
+            items=[OcrExpenseItem(**item) for item in result["items"]],
+            meta=OcrExpenseMeta(**result["meta"]),
+        )
+        assert schema_validator.build_model({**result, "items": []}).items is None
+        assert schema_validator.build_model({**result, "category": {"code": "XXX"}}) is None
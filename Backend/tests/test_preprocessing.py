@@ -0,0 +1,220 @@
+"""
+Tests for the OCR image preprocessing pipeline.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from app.core.metrics import metrics
+from app.modules.ocr_expense.preprocessing import (
+    ImagePreprocessor, ImageTooLargeError, PreprocessOptions, _preprocess_image_bytes, _preprocess_pdf_bytes
+)
+
+
+def make_jpeg(width: int, height: int, orientation: int | None = None) -> bytes:
+    buf = io.BytesIO()
+    image = Image.new("RGB", (width, height), (240, 240, 230))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    image.save(buf, format="JPEG", quality=90, exif=exif)
+    return buf.getvalue()
+
+
+def make_options(**overrides) -> PreprocessOptions:
+    values = PreprocessOptions.from_settings().__dict__ | overrides
+    return PreprocessOptions(**values)
+
+
+class TestImagePreprocessor:
+    """Test cases for ImagePreprocessor."""
+
+    @pytest.fixture
+    def pooled(self):
+        prep = ImagePreprocessor()
+        prep.workers = 1
+        yield prep
+        prep.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_preprocess_in_process_pool(self, pooled):
+        """Workers take raw bytes and return a resized JPEG with stage timings."""
+        metrics.reset()
+        result = await pooled.preprocess_bytes(make_jpeg(2400, 1800), "image/jpeg")
+
+        with Image.open(io.BytesIO(result.image_bytes)) as img:
+            assert img.format == "JPEG"
+            assert max(img.size) <= pooled.max_dimension
+        assert {"decode", "enhance", "resize", "encode"} <= set(result.timings)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["timings"]["ocr.preprocess.total"]["count"] == 1
+        assert snapshot["gauges"]["ocr.preprocess.in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_preprocess_without_pool(self):
+        """OCR_PREPROCESS_WORKERS=0 runs the same pipeline in a thread."""
+        prep = ImagePreprocessor()
+        prep.workers = 0
+        result = await prep.preprocess_bytes(make_jpeg(640, 480), "image/jpeg")
+
+        assert prep._executor is None
+        with Image.open(io.BytesIO(result.image_bytes)) as img:
+            assert img.size == (640, 480)
+
+    @pytest.mark.asyncio
+    async def test_preprocess_invalid_image(self, pooled):
+        """Undecodable bytes surface as ValueError from the worker."""
+        with pytest.raises(ValueError, match="Image preprocessing failed"):
+            await pooled.preprocess_bytes(b"not an image", "image/jpeg")
+
+
+class TestDecodeAtTargetSize:
+    """Test cases for the draft-decode / resize-before-enhance pipeline."""
+
+    def test_large_jpeg_capped_and_within_budget(self):
+        """A 12MP photo comes out at max_dimension and under the byte target."""
+        options = make_options(max_dimension=1280, target_bytes=200_000)
+        result = _preprocess_image_bytes(make_jpeg(4000, 3000), options)
+
+        with Image.open(io.BytesIO(result.image_bytes)) as img:
+            assert img.size == (1280, 960)
+        assert len(result.image_bytes) <= 200_000
+        assert result.timings["decode"] >= 0
+
+    def test_exif_orientation_applied(self):
+        """Orientation=6 (rotate 90 CW) is honoured even though draft decoding drops EXIF."""
+        result = _preprocess_image_bytes(make_jpeg(400, 200, orientation=6), make_options())
+
+        with Image.open(io.BytesIO(result.image_bytes)) as img:
+            assert img.size == (200, 400)
+
+    def test_decompression_bomb_rejected(self):
+        """Images above OCR_MAX_IMAGE_PIXELS are rejected before decoding."""
+        with pytest.raises(ImageTooLargeError):
+            _preprocess_image_bytes(make_jpeg(1000, 1000), make_options(max_pixels=500_000))
+
+
+class TestPdfPages:
+    """Test cases for multi-page PDF rendering (poppler calls are stubbed)."""
+
+    @pytest.fixture
+    def poppler(self, monkeypatch):
+        calls = []
+
+        def convert_from_path(path, **kwargs):
+            calls.append(kwargs)
+            count = kwargs["last_page"] - kwargs["first_page"] + 1
+            # poppler's -scale-to has already capped the long side (-scale-to-x/-y for a (w, h) size)
+            size = kwargs["size"] if isinstance(kwargs["size"], tuple) else (905, kwargs["size"])
+            return [Image.new("RGB", size, (250, 250, 250)) for _ in range(count)]
+
+        def pdfinfo_from_path(path, first_page=None, last_page=None):
+            if first_page is None:
+                return {"Pages": 7}
+            # A4 pages, except page 3: an 80mm x 600mm till roll
+            size = "226.77 x 1700.79 pts" if first_page == 3 else "595.28 x 841.89 pts (A4)"
+            return {"Pages": 7, f"Page {first_page:4d} size": size, f"Page {first_page:4d} rot": "0"}
+
+        monkeypatch.setattr("pdf2image.pdfinfo_from_path", pdfinfo_from_path)
+        monkeypatch.setattr("pdf2image.convert_from_path", convert_from_path)
+        return calls
+
+    def test_pages_rendered_at_target_size_in_chunks(self, poppler):
+        """Pages render at max_dimension, render_threads at a time, capped at pdf_max_pages."""
+        options = make_options(max_dimension=1280, pdf_max_pages=5, pdf_render_threads=2)
+        result = _preprocess_pdf_bytes(b"%PDF", options)
+
+        assert [(c["first_page"], c["last_page"], c["thread_count"]) for c in poppler] == [(1, 2, 2), (3, 4, 2), (5, 5, 1)]
+        assert all(c["size"] == 1280 for c in poppler)
+        assert len(result.pages) == 5
+        assert result.image_bytes == result.pages[0]
+        assert result.phash is not None
+
+    def test_page_range(self, poppler):
+        """first_page/last_page select a range inside the document."""
+        result = _preprocess_pdf_bytes(b"%PDF", make_options(pdf_render_threads=4), first_page=6, last_page=9)
+
+        assert [(c["first_page"], c["last_page"]) for c in poppler] == [(6, 7)]
+        assert len(result.pages) == 2
+
+    def test_single_tall_page_is_tiled(self, poppler):
+        """A lone tall page renders at the tiling working size and keeps its tiles."""
+        options = make_options(max_dimension=1280, tile_aspect_threshold=2.5, tile_overlap=0.15, tile_max_tiles=6)
+        result = _preprocess_pdf_bytes(b"%PDF", options, first_page=3, last_page=3)
+
+        (call,) = poppler
+        width, height = call["size"]
+        assert width <= 1280 and height > 1280 * 4
+        assert len(result.tiles) > 1
+        assert result.tile_axis == "vertical"
+        for tile in result.tiles:
+            with Image.open(io.BytesIO(tile)) as img:
+                assert max(img.size) <= 1280
+
+    def test_single_regular_page_is_not_tiled(self, poppler):
+        result = _preprocess_pdf_bytes(b"%PDF", make_options(max_dimension=1280), first_page=2, last_page=2)
+
+        assert poppler[0]["size"] == 1280
+        assert result.tiles == []
+
+    def test_page_range_outside_document(self, poppler):
+        with pytest.raises(ValueError, match="outside the document"):
+            _preprocess_pdf_bytes(b"%PDF", make_options(), first_page=9)
+
+
+class TestPassthrough:
+    """Uploads already within bounds are forwarded byte-for-byte."""
+
+    def test_in_bounds_jpeg_forwarded_untouched(self):
+        data = make_jpeg(1200, 900)
+        result = _preprocess_image_bytes(data, make_options(passthrough=True))
+
+        assert result.passthrough is True
+        assert result.image_bytes == data
+        assert result.phash is not None
+        assert "encode" not in result.timings and "enhance" not in result.timings
+
+    @pytest.mark.parametrize("data, overrides", [
+        (make_jpeg(2000, 1500), {}),
+        (make_jpeg(900, 1200, orientation=6), {}),
+        (make_jpeg(1200, 900), {"target_bytes": 1000}),
+        (make_jpeg(400, 1600), {"tile_aspect_threshold": 2.5}),
+        (make_jpeg(1200, 900), {"passthrough": False}),
+    ])
+    def test_out_of_bounds_uploads_take_full_pipeline(self, data, overrides):
+        result = _preprocess_image_bytes(data, make_options(**{"passthrough": True, **overrides}))
+
+        assert result.passthrough is False
+        assert result.image_bytes != data
+
+    def test_progressive_jpeg_takes_full_pipeline(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (800, 600), (240, 240, 230)).save(buf, format="JPEG", quality=90, progressive=True)
+        result = _preprocess_image_bytes(buf.getvalue(), make_options(passthrough=True))
+
+        assert result.passthrough is False
+        assert "progressive" not in Image.open(io.BytesIO(result.image_bytes)).info
+
+    def test_png_takes_full_pipeline(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (800, 600), (240, 240, 230)).save(buf, format="PNG")
+        result = _preprocess_image_bytes(buf.getvalue(), make_options(passthrough=True))
+
+        assert result.passthrough is False
+        assert Image.open(io.BytesIO(result.image_bytes)).format == "JPEG"
+
+    @pytest.mark.asyncio
+    async def test_trigger_rate_and_time_saved(self):
+        metrics.reset()
+        prep = ImagePreprocessor()
+        prep.workers = 0
+        prep.options = make_options(passthrough=True)
+        await prep.preprocess_bytes(make_jpeg(3000, 2000), "image/jpeg")
+        await prep.preprocess_bytes(make_jpeg(1200, 900), "image/jpeg")
+
+        assert metrics.get_counter("ocr.preprocess.passthrough") == 1
+        assert metrics.snapshot()["gauges"]["ocr.preprocess.passthrough.rate"] == 0.5
+        assert metrics.get_timing("ocr.preprocess.passthrough.saved").count == 1
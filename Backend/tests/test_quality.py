@@ -0,0 +1,131 @@
+"""
+Tests for the image quality gate.
+"""
+
+import io
+import pickle
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+from app.modules.ocr_expense.exceptions import LowImageQualityError
+from app.modules.ocr_expense.preprocessing import (
+    ImageQualityError, PreprocessOptions, PreprocessResult, _preprocess_image_bytes
+)
+from app.modules.ocr_expense.quality import QualityThresholds, assess_quality, quality_issue
+from app.modules.ocr_expense.service import OcrExpenseService
+
+
+THRESHOLDS = QualityThresholds(min_sharpness=10, min_brightness=40, max_brightness=250, min_coverage=0.02)
+
+RESULT = {
+    "transaction_date": "2024-01-15",
+    "amount": {"value": 150000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def make_receipt() -> Image.Image:
+    """Paper-coloured receipt with text-like strokes on a darker table."""
+    image = Image.new("RGB", (900, 1200), (110, 95, 80))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([200, 60, 700, 1140], fill=(240, 238, 230))
+    for y in range(120, 1080, 40):
+        for x in range(240, 640, 70):
+            draw.rectangle([x, y, x + 50, y + 18], fill=(25, 25, 25))
+    return image
+
+
+def to_jpeg(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def make_options(**overrides) -> PreprocessOptions:
+    values = PreprocessOptions.from_settings().__dict__ | {"quality_thresholds": THRESHOLDS} | overrides
+    return PreprocessOptions(**values)
+
+
+class TestQualityGate:
+    """Test cases for quality scoring and the preprocessing gate."""
+
+    @pytest.mark.parametrize("transform, issue", [
+        (lambda im: im, None),
+        (lambda im: im.filter(ImageFilter.GaussianBlur(4)), "blurry"),
+        (lambda im: ImageEnhance.Brightness(im).enhance(0.12), "too_dark"),
+        (lambda im: Image.new("RGB", im.size, (235, 235, 228)), "no_receipt"),
+    ])
+    def test_quality_issue(self, transform, issue):
+        """Sharp photos pass; blurred, dark and empty frames fail with a specific reason."""
+        scores = assess_quality(transform(make_receipt()))
+        assert set(scores) == {"sharpness", "brightness", "dark_clip", "bright_clip", "coverage"}
+        assert quality_issue(scores, THRESHOLDS) == issue
+
+    def test_reject_raises_picklable_error(self):
+        """OCR_QUALITY_GATE=reject stops preprocessing with an error that survives the process pool."""
+        blurry = to_jpeg(make_receipt().filter(ImageFilter.GaussianBlur(4)))
+        with pytest.raises(ImageQualityError) as exc_info:
+            _preprocess_image_bytes(blurry, make_options(quality_gate="reject"))
+
+        error = pickle.loads(pickle.dumps(exc_info.value))
+        assert error.reason == "blurry"
+        assert error.scores["sharpness"] < 10
+        assert error.seconds > 0
+
+    def test_warn_keeps_scores(self):
+        """OCR_QUALITY_GATE=warn processes the image and reports scores and the failed check."""
+        dark = to_jpeg(ImageEnhance.Brightness(make_receipt()).enhance(0.12))
+        result = _preprocess_image_bytes(dark, make_options(quality_gate="warn"))
+
+        assert result.image_bytes
+        assert result.quality_issue == "too_dark"
+        assert result.quality["brightness"] < 40
+        assert "quality" in result.timings
+
+        assert _preprocess_image_bytes(dark, make_options(quality_gate="off")).quality is None
+
+    @pytest.mark.asyncio
+    async def test_pipeline_attaches_quality_warning(self):
+        """Warn-mode scores land in meta.quality and the warning requests review."""
+        service = OcrExpenseService()
+        scores = {"sharpness": 4.0, "brightness": 180.0, "dark_clip": 0.0, "bright_clip": 0.1, "coverage": 0.3}
+
+        with patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.post_processor") as mock_post:
+            mock_prep.preprocess_bytes = AsyncMock(
+                return_value=PreprocessResult(image_bytes=b"x", quality=scores, quality_issue="blurry")
+            )
+            mock_gemini.extract_expense_data = AsyncMock(return_value=dict(RESULT))
+            mock_post.apply_rules = Mock(side_effect=lambda data, ctx: data)
+            output = await service._run_pipeline(b"data", "image/jpeg")
+
+        assert output.result["meta"] == {"needs_review": True, "warnings": ["image_blurry"], "quality": scores}
+        assert service._build_result_payload(output.result).meta.quality == scores
+
+    @pytest.mark.asyncio
+    async def test_rejection_skips_gemini(self):
+        """A rejected photo becomes a 422 IMAGE_QUALITY_LOW without calling Gemini."""
+        service = OcrExpenseService()
+        file = Mock()
+        file.filename = "receipt.jpg"
+        file.content_type = "image/jpeg"
+        file.size = 4
+        file.read = AsyncMock(side_effect=[b"data", b""])
+        error = ImageQualityError("too_dark", {"brightness": 12.0}, 0.004)
+
+        with patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini:
+            mock_prep.preprocess_bytes = AsyncMock(side_effect=error)
+            mock_gemini.extract_expense_data = AsyncMock()
+            with pytest.raises(LowImageQualityError) as exc_info:
+                await service.extract_expense_sync(AsyncMock(), "session-1", "user-1", file)
+
+        mock_gemini.extract_expense_data.assert_not_awaited()
+        assert exc_info.value.status_code == 422
+        assert exc_info.value.detail["code"] == "IMAGE_QUALITY_LOW"
+        assert exc_info.value.detail["detail"] == {"reason": "too_dark", "scores": {"brightness": 12.0}}
@@ -0,0 +1,230 @@
+"""
+Tests for the Gemini rate limiter: quota waits, 429/503 retries, fair queueing and the 503 mapping.
+"""
+
+import asyncio
+import io
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+from PIL import Image
+
+from app.core.metrics import metrics
+from app.modules.ocr_expense.exceptions import ServiceBusyError, ocr_expense_exception_handler
+from app.modules.ocr_expense.gemini_client import GeminiOcrClient
+from app.modules.ocr_expense.ratelimit import FairQueue, GeminiBusyError, GeminiRateLimiter, estimate_tokens
+
+
+GEMINI_JSON = {
+    "transaction_date": "2025-01-09",
+    "amount": {"value": 49200, "currency": "VND"},
+    "category": {"code": "GRO", "name": "Tạp hoá"},
+    "items": [{"name": "Snack vị tôm", "qty": 1}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def quota_error(code: int = 429) -> errors.APIError:
+    status = "RESOURCE_EXHAUSTED" if code == 429 else "UNAVAILABLE"
+    return errors.APIError(code, {"error": {"code": code, "message": "quota", "status": status}})
+
+
+class FlakyModels:
+    """generate_content that fails with the given errors before succeeding."""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.calls = 0
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return SimpleNamespace(text=json.dumps(GEMINI_JSON), candidates=[], usage_metadata=None)
+
+
+class StubScript:
+    """Stand-in for the registered token-bucket Lua script: returns queued wait times (ms)."""
+
+    def __init__(self, waits=(), error=None):
+        self.waits = list(waits)
+        self.error = error
+        self.calls = []
+
+    async def __call__(self, keys, args):
+        self.calls.append((keys, args))
+        if self.error is not None:
+            raise self.error
+        return self.waits.pop(0) if self.waits else 0
+
+
+def make_limiter(script: StubScript, rpm: int = 60, tpm: int = 100_000) -> GeminiRateLimiter:
+    limiter = GeminiRateLimiter()
+    limiter.rpm, limiter.tpm = rpm, tpm
+    limiter._script = script
+    return limiter
+
+
+def make_client(failures=(), limiter=None, deadline: float = 5.0) -> tuple[GeminiOcrClient, FlakyModels]:
+    client = GeminiOcrClient()
+    stub = FlakyModels(failures)
+    client.client = SimpleNamespace(aio=SimpleNamespace(models=stub))
+    client.retry_base_delay = 0.0
+    client.queue_deadline_seconds = deadline
+    client.rate_limiter = limiter or make_limiter(StubScript(), rpm=0, tpm=0)
+    return client, stub
+
+
+class TestGeminiRetry:
+    """429/503 from Gemini are retried with backoff, then surface as GeminiBusyError."""
+
+    @pytest.fixture(autouse=True)
+    def reset_metrics(self):
+        metrics.reset()
+
+    @pytest.mark.asyncio
+    async def test_retries_until_success(self):
+        client, stub = make_client([quota_error(429), quota_error(503)])
+
+        result = await client.extract_expense_data(b"fake-image")
+
+        assert result == GEMINI_JSON
+        assert stub.calls == 3
+        assert metrics.get_counter("ocr.gemini.retries") == 2
+        assert metrics.get_counter("ocr.gemini.status.429") == 1
+
+    @pytest.mark.asyncio
+    async def test_persistent_429_raises_busy(self):
+        client, stub = make_client([quota_error(429)] * 10)
+        client.retry_max_attempts = 3
+
+        with pytest.raises(GeminiBusyError):
+            await client.extract_expense_data(b"fake-image")
+        assert stub.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_other_errors_are_not_retried(self):
+        client, stub = make_client([quota_error(400)])
+
+        with pytest.raises(RuntimeError, match="OCR extraction failed"):
+            await client.extract_expense_data(b"fake-image")
+        assert stub.calls == 1
+
+
+class TestGeminiRateLimiter:
+    """Shared token buckets: wait for quota within the deadline, fail open without Redis."""
+
+    @pytest.mark.asyncio
+    async def test_waits_for_refill(self):
+        script = StubScript(waits=[50, 0])
+        client, stub = make_client(limiter=make_limiter(script))
+
+        start = time.perf_counter()
+        await client.extract_expense_data(b"fake-image", user_id="u1")
+
+        assert time.perf_counter() - start >= 0.05
+        assert len(script.calls) == 2
+        keys, (rpm, tpm, tokens) = script.calls[0]
+        assert keys[0].endswith(":rpm") and client.model_name in keys[0]
+        assert (rpm, tpm) == (60, 100_000) and tokens > 0
+        assert stub.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_wait_past_deadline_raises_busy(self):
+        client, stub = make_client(limiter=make_limiter(StubScript(waits=[30_000])), deadline=1.0)
+
+        with pytest.raises(GeminiBusyError) as exc_info:
+            await client.extract_expense_data(b"fake-image")
+        assert exc_info.value.retry_after == 30.0
+        assert stub.calls == 0
+
+    @pytest.mark.asyncio
+    async def test_redis_error_fails_open(self):
+        limiter = make_limiter(StubScript(error=ConnectionError("redis down")))
+        client, stub = make_client(limiter=limiter)
+
+        assert await client.extract_expense_data(b"fake-image") == GEMINI_JSON
+        assert metrics.get_counter("ocr.gemini.ratelimit.errors") == 1
+
+    @pytest.mark.asyncio
+    async def test_fair_queue_round_robin(self):
+        """A user with many queued calls does not delay another user's single call."""
+        queue = FairQueue()
+        order = []
+
+        release = asyncio.Event()
+
+        async def call(user: str, label: str, hold: bool = False):
+            async with queue.turn(user):
+                order.append(label)
+                if hold:
+                    await release.wait()
+
+        holder = asyncio.ensure_future(call("batch", "first", hold=True))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(call("batch", f"batch-{i}")) for i in range(3)]
+        waiters.append(asyncio.ensure_future(call("single", "single")))
+        await asyncio.sleep(0)
+        assert queue.waiting == 4
+        release.set()
+        await asyncio.gather(holder, *waiters)
+
+        assert order == ["first", "batch-0", "single", "batch-1", "batch-2"]
+        assert queue.waiting == 0
+
+    @pytest.mark.asyncio
+    async def test_turn_wait_is_bounded_by_deadline(self):
+        """A caller stuck behind a long-running holder gives up at its deadline with GeminiBusyError."""
+        limiter = make_limiter(StubScript())
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter._queue.turn("batch"):
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        rejected = metrics.get_counter("ocr.gemini.ratelimit.rejected")
+        start = time.monotonic()
+
+        with pytest.raises(GeminiBusyError):
+            await limiter.acquire("gemini-test", 100, "single", deadline=start + 0.05)
+
+        assert time.monotonic() - start < 1.0
+        assert limiter._queue.waiting == 0
+        assert metrics.get_counter("ocr.gemini.ratelimit.rejected") == rejected + 1
+        release.set()
+        await holder
+        await limiter.acquire("gemini-test", 100, "single", deadline=time.monotonic() + 1.0)
+
+    def test_estimate_tokens_counts_image_tiles(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (1000, 2000), "white").save(buf, format="JPEG")
+
+        small = estimate_tokens("x" * 300, [b"not-an-image"])
+        large = estimate_tokens("x" * 300, [buf.getvalue()])
+
+        assert large - small == 258 * 2 * 3 - 258
+
+
+class TestServiceBusyMapping:
+    """Exhausted quota reaches the client as 503 OCR_BUSY with Retry-After."""
+
+    @pytest.mark.asyncio
+    async def test_handler_sets_retry_after(self):
+        response = await ocr_expense_exception_handler(None, ServiceBusyError("busy", retry_after=7))
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "7"
+        assert json.loads(response.body)["code"] == "OCR_BUSY"
+
+    def test_busy_rejection(self):
+        from app.modules.ocr_expense.service import OcrExpenseService
+
+        error = OcrExpenseService()._busy_rejection(GeminiBusyError("quota", retry_after=2.4))
+
+        assert isinstance(error, ServiceBusyError)
+        assert error.headers == {"Retry-After": "2"}
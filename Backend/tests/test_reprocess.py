@@ -0,0 +1,147 @@
+"""
+Tests for the raw Gemini response archive and offline reprocessing.
+"""
+
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.modules.ocr_expense.archive import decode_raw_response, encode_raw_response
+from app.modules.ocr_expense.models import OcrExpenseJob, OcrExpenseResult
+from app.modules.ocr_expense.reprocess import reprocess_results
+from app.modules.ocr_expense.service import OcrExpenseService, PipelineOutput
+
+
+RAW = {
+    "transaction_date": "2024-01-15",
+    "amount": {"value": 25_000_000, "currency": "VND"},
+    "category": {"code": "FNB", "name": "Ăn uống"},
+    "items": [{"name": "Coffee", "qty": 2}],
+    "meta": {"needs_review": False, "warnings": []},
+}
+
+
+def make_row(raw, meta, transaction_date="2024-01-15", amount=25_000_000):
+    return OcrExpenseResult(
+        id=str(uuid.uuid4()),
+        job_id=str(uuid.uuid4()),
+        transaction_date=transaction_date,
+        amount_value=amount,
+        amount_currency="VND",
+        category_code="FNB",
+        category_name="Ăn uống",
+        items_json=[{"name": "Coffee", "qty": 2}],
+        meta_json=meta,
+        processing_time=1.0,
+        word_count=5,
+        raw_response=encode_raw_response(raw),
+        prompt_version="abc123",
+        created_at=datetime(2024, 1, 20, 3, 0),
+    )
+
+
+@asynccontextmanager
+async def results_db():
+    """Fresh in-memory database with the ocr_expense_jobs / ocr_expense_results tables."""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(OcrExpenseJob.__table__.create)
+        await conn.run_sync(OcrExpenseResult.__table__.create)
+    async with sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+class TestRawResponseArchive:
+    """Raw Gemini JSON is stored compressed with every extracted result."""
+
+    def test_round_trip(self):
+        blob = encode_raw_response(RAW)
+
+        assert decode_raw_response(blob) == RAW
+        assert encode_raw_response(None) is None
+        assert decode_raw_response(None) is None
+
+    def test_result_row_archives_pipeline_output(self):
+        service = OcrExpenseService()
+        output = PipelineOutput({**RAW}, raw=RAW, prompt_version="abc123")
+
+        row = service._result_row("job-1", output.result, 1.0, output)
+        reused = service._result_row("job-2", output.result, 1.0, PipelineOutput({**RAW}))
+
+        assert decode_raw_response(row["raw_response"]) == RAW
+        assert row["prompt_version"] == "abc123"
+        assert reused["raw_response"] is None and reused["prompt_version"] is None
+
+
+class TestReprocess:
+    """Stored responses are re-run through the current rules in batches."""
+
+    async def _seed(self, db):
+        # Extracted before the amount_seems_high rule existed
+        stale = make_row(RAW, {"needs_review": False, "warnings": [], "quality": {"sharpness": 8.0}})
+        current = make_row(
+            {**RAW, "amount": {"value": 150000, "currency": "VND"}},
+            {"needs_review": False, "warnings": []},
+            amount=150000,
+        )
+        defaulted = make_row(
+            {**RAW, "transaction_date": None, "amount": {"value": 150000, "currency": "VND"}},
+            {"needs_review": True, "warnings": ["date_defaulted_to_extraction"]},
+            transaction_date="2024-01-19",
+            amount=150000,
+        )
+        job = OcrExpenseJob(
+            id=stale.job_id, session_id="session-1", user_id="user-1", original_filename="r.jpg",
+            file_path="r.jpg", file_size=1, content_type="image/jpeg",
+        )
+        db.add_all([job, stale, current, defaulted])
+        await db.commit()
+        return stale
+
+    @pytest.mark.asyncio
+    async def test_updates_changed_rows(self):
+        async with results_db() as db:
+            stale = await self._seed(db)
+
+            with patch("app.modules.ocr_expense.reprocess.session_context_cache") as context_cache:
+                context_cache.invalidate = AsyncMock()
+                stats = await reprocess_results(db, batch_size=1)
+
+            db.expunge_all()
+            ids = (await db.execute(select(OcrExpenseResult.id))).scalars().all()
+            updated = await db.get(OcrExpenseResult, stale.id)
+
+        summary = stats.summary()
+        assert (summary["scanned"], summary["changed"], summary["unchanged"]) == (3, 1, 2)
+        assert summary["fields"] == {"meta_json": 1}
+        assert summary["warnings"] == {"+amount_seems_high": 1}
+        assert stats.last_id == max(ids)
+        # Chat sessions of rewritten results drop their cached OCR prompt context
+        context_cache.invalidate.assert_awaited_once_with("session-1")
+        # Pipeline annotations survive reprocessing
+        assert updated.meta_json == {
+            "needs_review": True, "warnings": ["amount_seems_high"], "quality": {"sharpness": 8.0},
+        }
+
+    @pytest.mark.asyncio
+    async def test_dry_run_and_resume(self):
+        async with results_db() as db:
+            stale = await self._seed(db)
+
+            stats = await reprocess_results(db, dry_run=True)
+            resumed = await reprocess_results(db, after_id=stats.last_id)
+
+            db.expunge_all()
+            unchanged = await db.get(OcrExpenseResult, stale.id)
+
+        assert stats.changed == 1
+        assert resumed.scanned == 0
+        assert unchanged.meta_json["warnings"] == []
@@ -0,0 +1,85 @@
+"""
+Tests for two-tier OCR (low-resolution first pass with escalation).
+"""
+
+import io
+
+import pytest
+from unittest.mock import AsyncMock, patch
+from PIL import Image
+
+from app.core.metrics import metrics
+from app.modules.ocr_expense.preprocessing import PreprocessOptions, PreprocessResult, _preprocess_image_bytes
+from app.modules.ocr_expense.schemas import OcrExpenseHints
+from app.modules.ocr_expense.service import OcrExpenseService
+
+
+def make_result(value=150000, items=None, needs_review=False, warnings=None):
+    return {
+        "transaction_date": "2024-01-15",
+        "amount": {"value": value, "currency": "VND"},
+        "category": {"code": "FNB", "name": "Ăn uống"},
+        "items": items if items is not None else [{"name": "Cà phê", "qty": 1}],
+        "meta": {"needs_review": needs_review, "warnings": warnings or []},
+    }
+
+
+class TestTieredOcr:
+    """Test cases for the tiered extraction mode."""
+
+    @pytest.fixture
+    def service(self):
+        service = OcrExpenseService()
+        service.tiered = True
+        service.tier1_model = "gemini-lite"
+        metrics.reset()
+        return service
+
+    async def run(self, service, responses, hints=None):
+        with patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini:
+            mock_prep.preprocess_bytes = AsyncMock(
+                return_value=PreprocessResult(image_bytes=b"full", draft_bytes=b"draft")
+            )
+            mock_gemini.extract_expense_data = AsyncMock(side_effect=responses)
+            output = await service._run_pipeline(b"data", "image/jpeg", hints)
+        return output, mock_gemini.extract_expense_data.await_args_list
+
+    @pytest.mark.asyncio
+    async def test_confident_draft_is_kept(self, service):
+        """A clean tier-1 result is returned without the full-resolution call."""
+        output, calls = await self.run(service, [make_result()])
+
+        assert len(calls) == 1
+        assert calls[0].kwargs["image_bytes"] == b"draft"
+        assert calls[0].kwargs["model"] == "gemini-lite"
+        assert output.result["amount"]["value"] == 150000
+        assert metrics.get_counter("ocr.tier.draft.accepted") == 1
+        assert metrics.get_timing("ocr.tier.draft").count == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("draft, hints, reason", [
+        (make_result(needs_review=True), None, "needs_review"),
+        (make_result(value=0), None, "implausible_total"),
+        (make_result(items=[]), OcrExpenseHints(items_expected=True), "missing_items"),
+        (RuntimeError("timeout"), None, "error"),
+    ])
+    async def test_escalates_to_full_pass(self, service, draft, hints, reason):
+        """Doubtful tier-1 results are redone at full resolution with the default model."""
+        output, calls = await self.run(service, [draft, make_result(value=215000)], hints)
+
+        assert [call.kwargs["image_bytes"] for call in calls] == [b"draft", b"full"]
+        assert calls[1].kwargs.get("model") is None
+        assert output.result["amount"]["value"] == 215000
+        assert metrics.get_counter(f"ocr.tier.escalated.{reason}") == 1
+        assert metrics.get_timing("ocr.tier.full").count == 1
+
+    def test_preprocess_encodes_draft(self):
+        """draft_dimension adds a smaller copy of the same image."""
+        buf = io.BytesIO()
+        Image.new("RGB", (1200, 1600), (240, 240, 230)).save(buf, format="JPEG")
+        values = PreprocessOptions.from_settings().__dict__ | {"max_dimension": 1280, "draft_dimension": 640}
+        result = _preprocess_image_bytes(buf.getvalue(), PreprocessOptions(**values))
+
+        assert max(Image.open(io.BytesIO(result.image_bytes)).size) == 1280
+        assert max(Image.open(io.BytesIO(result.draft_bytes)).size) == 640
@@ -0,0 +1,171 @@
+"""
+Tests for tall-receipt tiling and tile result merging.
+"""
+
+import asyncio
+import io
+
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from PIL import Image
+
+from app.modules.ocr_expense.preprocessing import PreprocessOptions, PreprocessResult, _preprocess_image_bytes
+from app.modules.ocr_expense.service import OcrExpenseService
+from app.modules.ocr_expense.tiling import merge_tile_results, needs_tiling, tile_spans, working_size
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (240, 240, 230)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def make_options(**overrides) -> PreprocessOptions:
+    values = PreprocessOptions.from_settings().__dict__ | overrides
+    return PreprocessOptions(**values)
+
+
+def tile_result(items, total=0, date=None, code="FNB"):
+    return {
+        "transaction_date": date,
+        "amount": {"value": total, "currency": "VND"},
+        "category": {"code": code, "name": "Ăn uống"},
+        "items": [{"name": name, "qty": 1} for name in items],
+        "meta": {"needs_review": False, "warnings": []},
+    }
+
+
+class TestTiling:
+    """Test cases for tile geometry."""
+
+    def test_needs_tiling_threshold(self):
+        """Only images past the aspect threshold are tiled; 0 disables tiling."""
+        assert needs_tiling((800, 4000), 2.5)
+        assert needs_tiling((4000, 800), 2.5)
+        assert not needs_tiling((1200, 1600), 2.5)
+        assert not needs_tiling((800, 4000), 0)
+
+    def test_tile_spans_overlap_and_cover(self):
+        """Spans are full-size, overlap by the configured fraction and reach the end."""
+        spans = tile_spans(5000, 1600, 0.15)
+        assert spans[0] == (0, 1600)
+        assert spans[-1] == (3400, 5000)
+        assert all(end - start == 1600 for start, end in spans)
+        assert all(nxt[0] < cur[1] for cur, nxt in zip(spans, spans[1:]))
+        assert tile_spans(1200, 1600, 0.15) == [(0, 1200)]
+
+    def test_working_size_caps_tile_count(self):
+        """The long side is scaled so no more than max_tiles tiles are produced."""
+        width, height = working_size((1000, 20000), 1600, 0.15, 4)
+        assert width <= 1600
+        assert len(tile_spans(height, 1600, 0.15)) <= 4
+
+    def test_preprocess_tall_image_produces_tiles(self):
+        """A tall receipt keeps its short side and is cut into tiles of at most max_dimension."""
+        options = make_options(max_dimension=800, tile_aspect_threshold=2.5, tile_overlap=0.15)
+        result = _preprocess_image_bytes(make_jpeg(600, 3000), options)
+
+        assert len(result.tiles) == len(tile_spans(3000, 800, 0.15))
+        for tile in result.tiles:
+            assert Image.open(io.BytesIO(tile)).size == (600, 800)
+        assert max(Image.open(io.BytesIO(result.image_bytes)).size) == 800
+
+        regular = _preprocess_image_bytes(make_jpeg(600, 3000), make_options(max_dimension=800, tile_aspect_threshold=0))
+        assert regular.tiles == []
+
+    def test_wide_image_tiles_are_described_left_to_right(self):
+        """Wide images are cut left-to-right and the tile prompt says so."""
+        from app.modules.ocr_expense.gemini_client import gemini_ocr_client
+
+        options = make_options(max_dimension=800, tile_aspect_threshold=2.5, tile_overlap=0.15)
+        result = _preprocess_image_bytes(make_jpeg(3000, 600), options)
+
+        assert result.tiles and result.tile_axis == "horizontal"
+        prompt = gemini_ocr_client._build_expense_prompt(tile=(0, len(result.tiles), result.tile_axis))
+        assert "(từ trái sang phải)" in prompt and "(từ trên xuống)" not in prompt
+
+
+class TestMergeTileResults:
+    """Test cases for merging per-tile extractions."""
+
+    def test_merge_dedups_seam_items(self):
+        """Items repeated in the overlap band are kept once, in order."""
+        merged = merge_tile_results([
+            tile_result(["Cà phê sữa", "Bánh mì", "Trà đào"], date="2024-01-15"),
+            tile_result(["Trà đào", "Nước suối", "Khăn lạnh"]),
+            tile_result(["khăn lạnh", "Bánh flan"], total=215000),
+        ])
+        assert [it["name"] for it in merged["items"]] == [
+            "Cà phê sữa", "Bánh mì", "Trà đào", "Nước suối", "Khăn lạnh", "Bánh flan"
+        ]
+        assert merged["amount"]["value"] == 215000
+        assert merged["transaction_date"] == "2024-01-15"
+        assert merged["meta"]["needs_review"] is False
+
+    def test_merge_without_total_needs_review(self):
+        """No tile reporting a total leaves amount at 0 and requests review."""
+        merged = merge_tile_results([tile_result(["A"]), tile_result(["B"])])
+        assert merged["amount"]["value"] == 0
+        assert merged["meta"]["needs_review"] is True
+
+    @pytest.mark.asyncio
+    async def test_pipeline_extracts_tiles_concurrently(self):
+        """Each tile is sent to Gemini concurrently and the results are merged before post-processing."""
+        service = OcrExpenseService()
+        running = 0
+        peak = 0
+        results = [tile_result(["A", "B"], date="2024-01-15"), tile_result(["B", "C"], total=90000)]
+
+        async def extract(image_bytes, hints=None, tile=None, user_id=None):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return results[tile[0]]
+
+        with patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.post_processor") as mock_post, \
+             patch("app.modules.ocr_expense.service.schema_validator"):
+            mock_prep.preprocess_bytes = AsyncMock(
+                return_value=PreprocessResult(image_bytes=b"whole", tiles=[b"t0", b"t1"])
+            )
+            mock_gemini.extract_expense_data = AsyncMock(side_effect=extract)
+            mock_post.apply_rules = Mock(side_effect=lambda data, ctx: data)
+            output = await service._run_pipeline(b"data", "image/jpeg")
+
+        assert peak == 2
+        assert [call.kwargs["tile"] for call in mock_gemini.extract_expense_data.await_args_list] == [(0, 2, "vertical"), (1, 2, "vertical")]
+        assert [it["name"] for it in output.result["items"]] == ["A", "B", "C"]
+        assert output.result["amount"]["value"] == 90000
+
+    @pytest.mark.asyncio
+    async def test_pipeline_merges_tiles_that_succeeded(self):
+        """A failed tile does not fail the receipt: the other tiles are merged and flagged for review."""
+        service = OcrExpenseService()
+        results = [tile_result(["A", "B"], date="2024-01-15"), RuntimeError("tile failed"), tile_result(["C"], total=90000)]
+
+        async def extract(image_bytes, hints=None, tile=None, user_id=None):
+            if isinstance(results[tile[0]], Exception):
+                raise results[tile[0]]
+            return results[tile[0]]
+
+        with patch("app.modules.ocr_expense.service.preprocessor") as mock_prep, \
+             patch("app.modules.ocr_expense.service.gemini_ocr_client") as mock_gemini, \
+             patch("app.modules.ocr_expense.service.post_processor") as mock_post, \
+             patch("app.modules.ocr_expense.service.schema_validator"):
+            mock_prep.preprocess_bytes = AsyncMock(
+                return_value=PreprocessResult(image_bytes=b"whole", tiles=[b"t0", b"t1", b"t2"])
+            )
+            mock_gemini.extract_expense_data = AsyncMock(side_effect=extract)
+            mock_post.apply_rules = Mock(side_effect=lambda data, ctx: data)
+            output = await service._run_pipeline(b"data", "image/jpeg")
+
+            results[0] = results[2] = RuntimeError("tile failed")
+            with pytest.raises(RuntimeError):
+                await service._run_pipeline(b"data", "image/jpeg")
+
+        assert [it["name"] for it in output.result["items"]] == ["A", "B", "C"]
+        assert output.result["meta"]["needs_review"] is True
+        assert output.result["meta"]["warnings"][0] == "partial_tile_extraction"